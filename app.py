@@ -1,118 +1,479 @@
 # app.py
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, abort
 import os
 import uuid
-import threading
+import json
+import tempfile
 import shutil
-import subprocess
 import logging
+import threading
+import time
+import resource
+import hmac
+from urllib.parse import quote
 from werkzeug.utils import secure_filename
 # Import your montage creation script
 import montage_maker
+from job_scheduler import JobScheduler, QueueFullError
+from media_index import MediaIndex
+from proxy_cache import ProxyCache
+from render_cache import RenderCache
+from chunked_uploads import UploadStore, UploadError
+from task_store import SQLiteTaskStore, MemoryTaskStore, FINISHED_STATUSES
+from janitor import Janitor
+from beat_detection import BeatCache, DETECTOR_VERSION
+from download_cache import DownloadCache
+import job_queue
+import metrics
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 OUTPUT_FOLDER = 'outputs'
 SERVER_VIDEOS_FOLDER = 'server_videos' # Folder for persistent videos
-YT_DOWNLOADS_FOLDER = os.path.join(UPLOAD_FOLDER, 'yt_downloads')
+CHUNKED_UPLOADS_FOLDER = os.path.join(UPLOAD_FOLDER, 'chunked') # Resumable uploads, kept across tasks
+DATA_FOLDER = 'data' # Persistent indexes and caches
+MEDIA_INDEX_PATH = os.path.join(DATA_FOLDER, 'media_index.sqlite3')
+MEDIA_INDEX_SCAN_INTERVAL = 30 # Seconds between incremental scans of SERVER_VIDEOS_FOLDER
+PROXY_FOLDER = os.path.join(SERVER_VIDEOS_FOLDER, '.proxies') # Resolution-specific proxies, next to the originals
+PROXY_CACHE_MAX_BYTES = 50 * 1024 * 1024 * 1024 # 50 GB, least recently used proxies are evicted first
+PROXY_AUTO_BUILD = True # Build a proxy in the background after a server video is used at a new resolution
+RENDER_CACHE_FOLDER = os.path.join(OUTPUT_FOLDER, 'render_cache') # Finished montages keyed by input hashes + options
+RENDER_CACHE_MAX_BYTES = 20 * 1024 * 1024 * 1024 # 20 GB, least recently used renders are evicted first
+BEAT_CACHE_FOLDER = os.path.join(DATA_FOLDER, 'beats') # Detected beats as label files, keyed by audio content hash
+DOWNLOAD_CACHE_FOLDER = os.path.join(DATA_FOLDER, 'downloads') # yt-dlp downloads keyed by URL, reused across tasks
+DOWNLOAD_CACHE_MAX_BYTES = 20 * 1024 * 1024 * 1024 # 20 GB, least recently used downloads are evicted first
 
 ALLOWED_EXTENSIONS_VIDEO = {'mp4', 'mov', 'avi', 'mkv', 'webm'}
 ALLOWED_EXTENSIONS_AUDIO = {'mp3', 'wav', 'aac', 'ogg', 'flac'}
 ALLOWED_EXTENSIONS_LABELS = {'txt'}
-YT_DLP_PATH = None
+YT_DLP_PATH = os.environ.get('YT_DLP_PATH') # yt-dlp executable; None runs 'yt-dlp' from PATH
+MAX_CONCURRENT_JOBS = 2 # Montage pipelines rendering at the same time
+MAX_QUEUE_DEPTH = 20 # Waiting jobs beyond this are rejected with 503
+MAX_EXTRACTION_WORKERS = 4 # Upper bound of a job's extraction_workers, i.e. ffmpeg processes per job
+MAX_FFMPEG_THREADS = 8 # Upper bound of a job's ffmpeg_threads
+DEFAULT_SEED = 0 # Seed of jobs submitted without one, so an identical resubmission is a render cache hit
+MAX_JOB_PRIORITY = 10 # Job priorities are clamped to +-this; clients may only lower theirs
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN') # Requests with a matching X-Admin-Token header may raise their priority; None disables
+SSE_KEEPALIVE_INTERVAL = 15 # Seconds between keep-alive comments on idle event streams
+JOB_TIMEOUT = 4 * 3600 # Seconds a job may run before it is stopped; None disables
+STAGE_TIMEOUTS = {} # Per-stage child process limits in seconds, overriding montage_maker.STAGE_TIMEOUTS
+ABANDONED_TASK_TIMEOUT = 120 # Web UI jobs are cancelled once no page has watched them for this long; None disables
+ABANDONED_TASK_CHECK_INTERVAL = 30
+TASK_STORE = 'sqlite' # 'sqlite' (survives restarts) or 'memory'
+TASK_STORE_PATH = os.path.join(DATA_FOLDER, 'tasks.sqlite3')
+TASK_TTL = 24 * 3600 # Finished tasks are forgotten after this many seconds without updates
+JANITOR_INTERVAL = 300 # Seconds between janitor runs
+OUTPUT_MAX_AGE = 3 * 24 * 3600 # Finished montages in OUTPUT_FOLDER/<task_id> are deleted after this
+OUTPUT_MAX_BYTES = 50 * 1024 * 1024 * 1024 # Oldest outputs are deleted first beyond this total
+UPLOAD_MAX_AGE = 24 * 3600 # Uploads and chunked uploads
+UPLOAD_MAX_BYTES = 50 * 1024 * 1024 * 1024
+TEMP_DIR_MAX_AGE = 12 * 3600 # Orphaned rhythmic_montage_* render temp dirs
+WORK_QUEUE_URL = os.environ.get('WORK_QUEUE_URL') # sqlite:///path or redis://host:port/db spreads scenes over render workers; None renders in-process
+WORK_FOLDER = os.environ.get('WORK_FOLDER', os.path.join(DATA_FOLDER, 'work')) # Temp dirs of distributed renders, must be shared with the workers at the same path
+OUTPUT_CACHE_MAX_AGE = 3600 # Seconds browsers may reuse a finished montage without revalidating
+SENDFILE_MODE = os.environ.get('SENDFILE_MODE') # None (Flask sends outputs), 'x-sendfile' (Apache/lighttpd) or 'x-accel-redirect' (nginx)
+SENDFILE_ACCEL_PREFIX = os.environ.get('SENDFILE_ACCEL_PREFIX', '/protected_outputs/') # nginx internal location aliased to OUTPUT_FOLDER
 
 app = Flask(__name__)
 app.config.from_mapping({
     'UPLOAD_FOLDER': UPLOAD_FOLDER,
     'OUTPUT_FOLDER': OUTPUT_FOLDER,
     'SERVER_VIDEOS_FOLDER': SERVER_VIDEOS_FOLDER,
-    'YT_DOWNLOADS_FOLDER': YT_DOWNLOADS_FOLDER,
+    'CHUNKED_UPLOADS_FOLDER': CHUNKED_UPLOADS_FOLDER,
+    'DATA_FOLDER': DATA_FOLDER,
+    'MEDIA_INDEX_PATH': MEDIA_INDEX_PATH,
+    'MEDIA_INDEX_SCAN_INTERVAL': MEDIA_INDEX_SCAN_INTERVAL,
+    'PROXY_FOLDER': PROXY_FOLDER,
+    'PROXY_CACHE_MAX_BYTES': PROXY_CACHE_MAX_BYTES,
+    'PROXY_AUTO_BUILD': PROXY_AUTO_BUILD,
+    'RENDER_CACHE_FOLDER': RENDER_CACHE_FOLDER,
+    'RENDER_CACHE_MAX_BYTES': RENDER_CACHE_MAX_BYTES,
+    'BEAT_CACHE_FOLDER': BEAT_CACHE_FOLDER,
+    'DOWNLOAD_CACHE_FOLDER': DOWNLOAD_CACHE_FOLDER,
+    'DOWNLOAD_CACHE_MAX_BYTES': DOWNLOAD_CACHE_MAX_BYTES,
+    'YT_DLP_PATH': YT_DLP_PATH,
+    'MAX_CONCURRENT_JOBS': MAX_CONCURRENT_JOBS,
+    'MAX_QUEUE_DEPTH': MAX_QUEUE_DEPTH,
+    'MAX_EXTRACTION_WORKERS': MAX_EXTRACTION_WORKERS,
+    'MAX_FFMPEG_THREADS': MAX_FFMPEG_THREADS,
+    'DEFAULT_SEED': DEFAULT_SEED,
+    'MAX_JOB_PRIORITY': MAX_JOB_PRIORITY,
+    'ADMIN_TOKEN': ADMIN_TOKEN,
+    'SSE_KEEPALIVE_INTERVAL': SSE_KEEPALIVE_INTERVAL,
+    'JOB_TIMEOUT': JOB_TIMEOUT,
+    'STAGE_TIMEOUTS': STAGE_TIMEOUTS,
+    'ABANDONED_TASK_TIMEOUT': ABANDONED_TASK_TIMEOUT,
+    'ABANDONED_TASK_CHECK_INTERVAL': ABANDONED_TASK_CHECK_INTERVAL,
+    'TASK_STORE': TASK_STORE,
+    'TASK_STORE_PATH': TASK_STORE_PATH,
+    'TASK_TTL': TASK_TTL,
+    'JANITOR_INTERVAL': JANITOR_INTERVAL,
+    'OUTPUT_MAX_AGE': OUTPUT_MAX_AGE,
+    'OUTPUT_MAX_BYTES': OUTPUT_MAX_BYTES,
+    'UPLOAD_MAX_AGE': UPLOAD_MAX_AGE,
+    'UPLOAD_MAX_BYTES': UPLOAD_MAX_BYTES,
+    'TEMP_DIR_MAX_AGE': TEMP_DIR_MAX_AGE,
+    'WORK_QUEUE_URL': WORK_QUEUE_URL,
+    'WORK_FOLDER': WORK_FOLDER,
+    'OUTPUT_CACHE_MAX_AGE': OUTPUT_CACHE_MAX_AGE,
+    'SENDFILE_MODE': SENDFILE_MODE,
+    'SENDFILE_ACCEL_PREFIX': SENDFILE_ACCEL_PREFIX,
+    'USE_X_SENDFILE': SENDFILE_MODE == 'x-sendfile', # send_file() then only sets the X-Sendfile header
     'MAX_CONTENT_LENGTH': 5 * 1024 * 1024 * 1024 # 5 GB limit
 })
 
 # Ensure directories exist
-for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER, YT_DOWNLOADS_FOLDER, SERVER_VIDEOS_FOLDER]:
+for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER, SERVER_VIDEOS_FOLDER, DATA_FOLDER, WORK_FOLDER]:
     os.makedirs(folder, exist_ok=True)
 
 # Setup basic logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 app.logger.handlers.extend(logging.getLogger().handlers)
 
-tasks = {} # In-memory store for task statuses
+if app.config['TASK_STORE'] == 'memory':
+    tasks = MemoryTaskStore()
+else:
+    tasks = SQLiteTaskStore(app.config['TASK_STORE_PATH'])
+# Jobs that were queued or running when the server stopped will never finish
+for stale_task_id in tasks.unfinished_task_ids():
+    tasks.update(stale_task_id, {"status": "error", "message": "The server restarted before this task finished. Please submit it again."})
+
+task_versions = {} # task_id -> update counter, lets event streams detect changes
+task_conditions = {} # task_id -> Condition notified on every update of that task
+task_watchers = {} # task_id -> number of open event streams
+task_last_seen = {} # task_id -> time.monotonic() of the last status request or event stream activity
+task_conditions_lock = threading.Lock()
+
+scheduler = JobScheduler(app.config['MAX_CONCURRENT_JOBS'], app.config['MAX_QUEUE_DEPTH'])
+scheduler.start()
+
+media_index = MediaIndex(app.config['MEDIA_INDEX_PATH'], app.config['SERVER_VIDEOS_FOLDER'], ALLOWED_EXTENSIONS_VIDEO)
+media_index.start_background_indexer(app.config['MEDIA_INDEX_SCAN_INTERVAL'])
+
+proxy_cache = ProxyCache(app.config['PROXY_FOLDER'], app.config['PROXY_CACHE_MAX_BYTES'])
+render_cache = RenderCache(app.config['RENDER_CACHE_FOLDER'], app.config['RENDER_CACHE_MAX_BYTES'])
+upload_store = UploadStore(app.config['CHUNKED_UPLOADS_FOLDER'], media_index)
+beat_cache = BeatCache(app.config['BEAT_CACHE_FOLDER'])
+download_cache = DownloadCache(app.config['DOWNLOAD_CACHE_FOLDER'], app.config['DOWNLOAD_CACHE_MAX_BYTES'], ALLOWED_EXTENSIONS_VIDEO, app.config['YT_DLP_PATH'])
+work_queue = job_queue.open_work_queue(app.config['WORK_QUEUE_URL']) if app.config['WORK_QUEUE_URL'] else None
+
+def children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+metrics.gauge("montage_queue_depth", "Jobs waiting in the scheduler queue.", callback=scheduler.queue_depth)
+metrics.gauge("montage_active_jobs", "Jobs currently running.", callback=scheduler.active_count)
+metrics.gauge("montage_process_children_cpu_seconds", "User+system CPU time of all reaped child processes (RUSAGE_CHILDREN).", callback=children_cpu_seconds)
+TASK_OUTCOMES = metrics.counter("montage_tasks_total", "Finished montage requests by outcome (completed, error, cancelled, timed_out, cache_hit, rejected).", ["outcome"])
+TASK_QUEUE_WAIT = metrics.histogram("montage_task_queue_wait_seconds", "Time jobs spent queued before a worker picked them up.")
+TASK_RUN_SECONDS = metrics.histogram("montage_task_run_seconds", "Time from a worker picking a job up to its completion.", ["outcome"])
+TASK_LATENCY = metrics.histogram("montage_task_latency_seconds", "Time from submission to completion, queueing included.", ["outcome"])
+
+def is_server_video(video_path):
+    server_folder = os.path.abspath(app.config['SERVER_VIDEOS_FOLDER'])
+    return os.path.dirname(os.path.abspath(video_path)) == server_folder
+
+def queue_full_response():
+    TASK_OUTCOMES.inc(outcome="rejected")
+    response = jsonify({"error": "The server is busy. Too many montages are queued, please try again later."})
+    response.headers['Retry-After'] = '30'
+    return response, 503
 
 def allowed_file(filename, allowed_extensions):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
+def task_condition(task_id):
+    with task_conditions_lock:
+        return task_conditions.setdefault(task_id, threading.Condition())
+
 def update_task_progress(task_id, progress_data):
-    if task_id in tasks:
-        tasks[task_id].update(progress_data)
-        app.logger.info(f"Task {task_id} Progress: {progress_data}")
-
-def run_yt_dlp_download(video_url, download_path, task_id):
-    yt_dlp_executable = YT_DLP_PATH or "yt-dlp"
-    cmd = [
-        yt_dlp_executable, '-f', 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best',
-        '--merge-output-format', 'mp4', '-o', os.path.join(download_path, '%(title)s.%(ext)s'), video_url
+    if progress_data.get("output_file"): # Clients fetch outputs by name from /stream/<task_id>/ and /download/<task_id>/
+        progress_data = dict(progress_data, output_file=os.path.basename(progress_data["output_file"]))
+        if progress_data.get("variants"):
+            progress_data["variants"] = [dict(variant, output_file=os.path.basename(variant["output_file"])) for variant in progress_data["variants"]]
+    condition = task_condition(task_id)
+    with condition:
+        if not tasks.update(task_id, progress_data):
+            return
+        task_versions[task_id] = task_versions.get(task_id, 0) + 1
+        condition.notify_all()
+    # Status transitions at info level; step messages and percent updates only when debugging
+    if progress_data.get("status") in FINISHED_STATUSES:
+        app.logger.info(f"Task {task_id} {progress_data['status']}: {progress_data.get('message')}")
+    else:
+        app.logger.debug(f"Task {task_id} Progress: {progress_data}")
+
+def forget_task_events(task_ids):
+    with task_conditions_lock:
+        for task_id in task_ids:
+            task_conditions.pop(task_id, None)
+            task_versions.pop(task_id, None)
+            task_watchers.pop(task_id, None)
+            task_last_seen.pop(task_id, None)
+
+def touch_task(task_id):
+    with task_conditions_lock:
+        task_last_seen[task_id] = time.monotonic()
+
+def is_task_active(task_id):
+    task = tasks.get(task_id)
+    return bool(task) and task.get("status") not in FINISHED_STATUSES
+
+def is_upload_in_use(upload_id):
+    """True while a queued or running task reads this chunked upload."""
+    for task_id in tasks.unfinished_task_ids():
+        task = tasks.get(task_id)
+        if task and task.get("upload_id") == upload_id:
+            return True
+    return False
+
+janitor = Janitor(tasks, app.config, is_task_active, upload_store, on_tasks_expired=forget_task_events, is_upload_in_use=is_upload_in_use)
+janitor.start()
+
+def task_snapshot(task_id):
+    """Copy of a task's state for clients, with its live queue position while it waits."""
+    task = tasks.get(task_id)
+    if not task:
+        return None
+    snapshot = dict(task)
+    if snapshot.get("status") == "queued":
+        queue_position = scheduler.queue_position(task_id)
+        if queue_position is not None:
+            snapshot.update(queue_position=queue_position, message=f"Task queued (position {queue_position}).")
+    return snapshot
+
+def montage_options_from_form(form, audio_path=None):
+    return {
+        "resolution": form.get('resolution', '1280x720'),
+        "total_duration": float(form.get('total_duration', 0)),
+        "total_scenes": int(form.get('total_scenes', 0)),
+        "min_scene_duration": float(form.get('min_scene_duration', 0.6)),
+        "audio_mode": form.get('audio_mode', 'replace'),
+        "render_engine": form.get('render_engine', 'clips'),
+        # Clamped, so one job cannot take more of the machine than MAX_CONCURRENT_JOBS budgets for
+        "extraction_workers": min(int(form.get('extraction_workers', 1)), app.config['MAX_EXTRACTION_WORKERS']),
+        "ffmpeg_threads": min(int(form.get('ffmpeg_threads', 0)), app.config['MAX_FFMPEG_THREADS']),
+        "cut_mode": form.get('cut_mode', 'reencode'),
+        "output_mode": form.get('output_mode', 'mp4'),
+        # A blank seed is the fixed default, recorded with the task; vary the seed for a different montage
+        "seed": int(form['seed']) if form.get('seed') else app.config['DEFAULT_SEED'],
+        "audio_file_path": audio_path
+    }
+
+def job_priority_from_request(req):
+    """Scheduler priority of a job request: clients may lower theirs, only admins may raise it."""
+    limit = app.config['MAX_JOB_PRIORITY']
+    priority = max(-limit, min(int(req.form.get('priority', 0)), limit))
+    admin_token = app.config['ADMIN_TOKEN']
+    if admin_token and hmac.compare_digest(req.headers.get('X-Admin-Token', ''), admin_token):
+        return priority
+    return min(priority, 0)
+
+def render_cache_entries(input_video_path, label_file_path, options, output_path):
+    """(cache key, output path, resolution) per output variant.
+
+    Each variant is keyed as if it had been rendered alone, so a multi-resolution job and a
+    later single-resolution job for one of its sizes share the cached render. Hashing the
+    inputs reads them in full, so this runs in the task, never on the request thread.
+    """
+    variants = montage_maker.parse_output_variants(options['resolution'])
+    video_hash = media_index.get_content_hash(input_video_path) # Persisted for library videos, so restarts don't re-hash them
+    return [
+        (render_cache.make_key(input_video_path, label_file_path, options.get('audio_file_path'), dict(options, resolution=variant['spec']), video_hash),
+         montage_maker.variant_output_path(output_path, variants, k), variant['resolution'])
+        for k, variant in enumerate(variants)
     ]
-    app.logger.info(f"Executing yt-dlp: {' '.join(cmd)}")
-    update_task_progress(task_id, {"status": "processing", "message": "Downloading video from URL..."})
-    
-    process = subprocess.run(cmd, capture_output=True, text=True, check=False)
-    if process.returncode != 0:
-        error_message = f"yt-dlp error: {process.stderr[:500]}"
-        update_task_progress(task_id, {"status": "error", "message": error_message})
-        raise montage_maker.MontageError(error_message)
-        
-    video_files = [f for f in os.listdir(download_path) if allowed_file(f, ALLOWED_EXTENSIONS_VIDEO)]
-    if not video_files:
-        raise montage_maker.MontageError("yt-dlp ran, but no video file was found.")
-        
-    full_video_path = os.path.join(download_path, video_files[0])
-    update_task_progress(task_id, {"status": "processing", "message": f"Video '{video_files[0]}' downloaded."})
-    return full_video_path
 
-def process_montage_task(task_id, input_video_path, label_file_path, output_video_name, options):
+def complete_from_render_cache(task_id, cache_entries):
+    """Serve a task from the render cache. Returns False unless every variant is cached."""
+    for cache_key, output_path, _ in cache_entries:
+        if not render_cache.materialize(cache_key, output_path):
+            return False
+    output_path = cache_entries[0][1]
+    progress_data = {"status": "completed", "message": f"Output video created: {os.path.basename(output_path)} (served from render cache)", "output_file": output_path}
+    if len(cache_entries) > 1:
+        progress_data["variants"] = [{"resolution": resolution, "output_file": path} for _, path, resolution in cache_entries]
+    update_task_progress(task_id, progress_data)
+    return True
+
+def start_task_job(task_id):
+    """JobControl through which cancel_task() and the job timeout stop the task's processes."""
+    return montage_maker.start_job(task_id, app.config['JOB_TIMEOUT'], app.config['STAGE_TIMEOUTS'])
+
+def process_montage_task(task_id, input_video_path, label_file_path, output_video_name, options, submitted_at=None, video_url=None):
+    """Renders one montage; with video_url, the source is fetched through the download cache first."""
+    started_at = time.monotonic()
+    if submitted_at is not None:
+        TASK_QUEUE_WAIT.observe(started_at - submitted_at)
+    outcome = "error"
+    download_pinned = False
+    job = montage_maker.job_control(task_id) or start_task_job(task_id)
     try:
+        job.start_timer() # The job timeout counts from here, not from submission
+        job.check() # Cancelled between leaving the queue and starting
         update_task_progress(task_id, {"status": "processing", "message": "Preparing for montage generation..."})
+        if video_url:
+            input_video_path = download_cache.get(video_url, update_task_progress, task_id)
+            download_pinned = True
         output_dir = os.path.join(app.config['OUTPUT_FOLDER'], task_id)
         os.makedirs(output_dir, exist_ok=True)
         output_path = os.path.join(output_dir, output_video_name)
 
-        montage_maker.create_rhythmic_montage_ffmpeg(
-            input_video_path=input_video_path,
-            output_video_path=output_path,
-            label_file_path=label_file_path,
-            output_resolution_str=options['resolution'],
-            target_total_output_duration_sec=options['total_duration'],
-            target_total_num_scenes=options['total_scenes'],
-            min_beat_grouped_scene_duration=options['min_scene_duration'],
-            audio_file_path=options.get('audio_file_path'),
-            audio_mix_behavior=options['audio_mode'],
-            progress_callback=update_task_progress,
-            task_id=task_id
-        )
+        # An identical job rendered before (or while this one was queued) is served from the render cache
+        cache_entries = render_cache_entries(input_video_path, label_file_path, options, output_path)
+        if complete_from_render_cache(task_id, cache_entries):
+            outcome = "cache_hit"
+            return
+
+        if options.get('plan'):
+            montage_maker.render_montage_from_plan(
+                input_video_path=input_video_path,
+                output_video_path=output_path,
+                plan=options['plan'],
+                output_resolution_str=options['resolution'],
+                audio_file_path=options.get('audio_file_path'),
+                audio_mix_behavior=options['audio_mode'],
+                progress_callback=update_task_progress,
+                task_id=task_id,
+                render_engine=options['render_engine'],
+                extraction_workers=options['extraction_workers'],
+                ffmpeg_threads=options['ffmpeg_threads'],
+                media_index=media_index,
+                cut_mode=options['cut_mode'],
+                proxy_cache=proxy_cache if is_server_video(input_video_path) else None,
+                output_mode=options['output_mode'],
+                work_queue=work_queue,
+                work_dir=app.config['WORK_FOLDER']
+            )
+        else:
+            montage_maker.create_rhythmic_montage_ffmpeg(
+                input_video_path=input_video_path,
+                output_video_path=output_path,
+                label_file_path=label_file_path,
+                output_resolution_str=options['resolution'],
+                target_total_output_duration_sec=options['total_duration'],
+                target_total_num_scenes=options['total_scenes'],
+                min_beat_grouped_scene_duration=options['min_scene_duration'],
+                audio_file_path=options.get('audio_file_path'),
+                audio_mix_behavior=options['audio_mode'],
+                progress_callback=update_task_progress,
+                task_id=task_id,
+                render_engine=options['render_engine'],
+                extraction_workers=options['extraction_workers'],
+                ffmpeg_threads=options['ffmpeg_threads'],
+                media_index=media_index,
+                cut_mode=options['cut_mode'],
+                proxy_cache=proxy_cache if is_server_video(input_video_path) else None,
+                seed=options['seed'],
+                beat_detector=beat_cache,
+                output_mode=options['output_mode'],
+                work_queue=work_queue,
+                work_dir=app.config['WORK_FOLDER']
+            )
+        for cache_key, variant_path, _ in cache_entries:
+            render_cache.store(cache_key, variant_path)
+        outcome = "completed"
+        if app.config['PROXY_AUTO_BUILD'] and is_server_video(input_video_path) and len(cache_entries) == 1:
+            proxy_cache.request_build(input_video_path, *montage_maker.parse_resolution(options['resolution']))
     except Exception as e:
-        app.logger.error(f"Error in task {task_id}: {e}", exc_info=True)
-        update_task_progress(task_id, {"status": "error", "message": str(e)})
+        if job.cancelled:
+            outcome = "timed_out" if job.timed_out else "cancelled"
+            app.logger.info(f"Task {task_id} stopped: {job.reason}")
+            shutil.rmtree(os.path.join(app.config['OUTPUT_FOLDER'], task_id), ignore_errors=True) # Partial outputs
+            update_task_progress(task_id, {"status": "error" if job.timed_out else "cancelled", "message": job.reason})
+        else:
+            app.logger.error(f"Error in task {task_id}: {e}", exc_info=True)
+            update_task_progress(task_id, {"status": "error", "message": str(e)})
     finally:
+        montage_maker.finish_job(task_id)
+        finished_at = time.monotonic()
+        TASK_OUTCOMES.inc(outcome=outcome)
+        TASK_RUN_SECONDS.observe(finished_at - started_at, outcome=outcome)
+        if submitted_at is not None:
+            TASK_LATENCY.observe(finished_at - submitted_at, outcome=outcome)
+        if download_pinned:
+            download_cache.release(video_url) # The download stays cached for later tasks
         # --- SAFE CLEANUP ---
         # This only cleans up temporary folders inside 'uploads/'
-        # It will NOT touch the 'server_videos' folder.
+        # It will NOT touch the 'server_videos' folder or the download cache.
         dirs_to_cleanup = set()
         
         # The task-specific directory holds transient files (labels, audio, uploaded videos)
-        task_upload_dir = os.path.dirname(label_file_path)
+        task_upload_dir = os.path.join(app.config['UPLOAD_FOLDER'], task_id)
         dirs_to_cleanup.add(task_upload_dir)
-
-        # The yt-dlp download directory is also temporary
-        if 'yt_downloads' in input_video_path:
-             dirs_to_cleanup.add(os.path.dirname(input_video_path))
         
         for dir_path in dirs_to_cleanup:
             if os.path.exists(dir_path):
                 shutil.rmtree(dir_path, ignore_errors=True)
                 app.logger.info(f"Cleaned up temporary directory: {dir_path}")
 
+def process_plan_task(task_id, beat_source_path, input_video_duration, keyframe_times, options):
+    """Detects the beats of beat_source_path and completes the task with the scene plan as "plan"."""
+    job = montage_maker.job_control(task_id) or start_task_job(task_id)
+    try:
+        job.start_timer()
+        job.check()
+        update_task_progress(task_id, {"status": "processing", "message": "Planning scenes..."})
+        beat_timestamps = beat_cache.get_beats(beat_source_path, update_task_progress, task_id)
+        plan = montage_maker.plan_montage_scenes(
+            input_video_duration, beat_timestamps, options['total_duration'], options['total_scenes'],
+            options['min_scene_duration'], options['seed'], keyframe_times
+        )
+        update_task_progress(task_id, {"status": "completed", "message": f"Planned {len(plan['scenes'])} scenes.", "plan": plan})
+    except Exception as e:
+        if job.cancelled:
+            update_task_progress(task_id, {"status": "error" if job.timed_out else "cancelled", "message": job.reason})
+        else:
+            app.logger.error(f"Error in plan task {task_id}: {e}", exc_info=True)
+            update_task_progress(task_id, {"status": "error", "message": str(e)})
+    finally:
+        montage_maker.finish_job(task_id)
+        shutil.rmtree(os.path.join(app.config['UPLOAD_FOLDER'], task_id), ignore_errors=True) # The uploaded audio
+
+def cancel_task(task_id, reason):
+    """Stop a queued or running task. Returns its state afterwards, or None if it is unknown.
+
+    A queued task is finished here; a running one reports "cancelled" once its processes
+    are gone.
+    """
+    task = tasks.get(task_id)
+    if task is None or task.get("status") in FINISHED_STATUSES:
+        return task
+    montage_maker.cancel_job(task_id, reason)
+    if scheduler.cancel(task_id): # Never started, so nothing else will finish it
+        montage_maker.finish_job(task_id)
+        TASK_OUTCOMES.inc(outcome="cancelled")
+        shutil.rmtree(os.path.join(app.config['UPLOAD_FOLDER'], task_id), ignore_errors=True)
+        update_task_progress(task_id, {"status": "cancelled", "message": reason})
+    return tasks.get(task_id)
+
+def cancel_abandoned_tasks():
+    """Cancel web UI tasks nobody watches: no open event stream and no status request for ABANDONED_TASK_TIMEOUT."""
+    now = time.monotonic()
+    for task_id in tasks.unfinished_task_ids():
+        task = tasks.get(task_id)
+        if not task or not task.get("cancel_when_abandoned"):
+            continue
+        with task_conditions_lock:
+            watched = task_watchers.get(task_id, 0) > 0
+            last_seen = task_last_seen.setdefault(task_id, now)
+        if not watched and now - last_seen > app.config['ABANDONED_TASK_TIMEOUT']:
+            app.logger.info(f"Task {task_id} has not been watched for {now - last_seen:.0f}s, cancelling it.")
+            cancel_task(task_id, "Cancelled because the page that started it was closed.")
+
+def start_abandoned_task_reaper():
+    def reaper_loop():
+        while True:
+            time.sleep(app.config['ABANDONED_TASK_CHECK_INTERVAL'])
+            try:
+                cancel_abandoned_tasks()
+            except Exception:
+                app.logger.exception("Cancelling abandoned tasks failed")
+    threading.Thread(target=reaper_loop, name="abandoned_task_reaper", daemon=True).start()
+
+if app.config['ABANDONED_TASK_TIMEOUT']:
+    start_abandoned_task_reaper()
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -120,16 +481,140 @@ def index():
 @app.route('/list_server_videos')
 def list_server_videos():
     try:
-        video_files = [
-            f for f in os.listdir(app.config['SERVER_VIDEOS_FOLDER'])
-            if os.path.isfile(os.path.join(app.config['SERVER_VIDEOS_FOLDER'], f))
-            and allowed_file(f, ALLOWED_EXTENSIONS_VIDEO)
-        ]
-        return jsonify(sorted(video_files))
+        # Served from the media index; the background indexer picks up added/changed files
+        return jsonify(media_index.list_videos())
     except Exception as e:
         app.logger.error(f"Error listing server videos: {e}")
         return jsonify({"error": "Could not list server videos."}), 500
 
+def upload_error_response(e):
+    body = {"error": str(e)}
+    if e.current_offset is not None:
+        body["offset"] = e.current_offset
+    return jsonify(body), e.status_code
+
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    """Start a resumable upload. Send the bytes with PUT /uploads/<id>?offset=N, then POST /uploads/<id>/complete."""
+    payload = request.get_json(silent=True) or request.form
+    filename = secure_filename(payload.get('filename') or '')
+    try:
+        total_size = int(payload.get('size', -1))
+    except (TypeError, ValueError):
+        total_size = -1
+    if not filename or not allowed_file(filename, ALLOWED_EXTENSIONS_VIDEO):
+        return jsonify({"error": "A video filename with an allowed extension is required."}), 400
+    if total_size <= 0:
+        return jsonify({"error": "The total file size is required."}), 400
+    upload_id = upload_store.create(filename, total_size)
+    return jsonify({"upload_id": upload_id, "offset": 0}), 201
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    try:
+        return jsonify(upload_store.status(upload_id))
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    try:
+        offset = int(request.args.get('offset', request.headers.get('Upload-Offset', -1)))
+    except ValueError:
+        return jsonify({"error": "A numeric offset is required."}), 400
+    try:
+        # request.stream is read directly, so the chunk is never spooled to a temp file
+        new_offset = upload_store.append_chunk(upload_id, offset, request.stream)
+        return jsonify({"upload_id": upload_id, "offset": new_offset})
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    try:
+        return jsonify(upload_store.complete(upload_id))
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/plan', methods=['POST'])
+def plan_route():
+    """Scene plan as JSON, without rendering. Feed the result back to /create_montage as 'plan'.
+
+    With a label file the plan is returned right away; otherwise beats are detected in a
+    task (202 with its task_id) whose completed state carries the plan as "plan".
+    """
+    server_file = request.form.get('server_video_filename')
+    video_duration = request.form.get('video_duration')
+    label_file = request.files.get('label_file')
+    audio_file = request.files.get('audio_file')
+    has_labels = bool(label_file and label_file.filename)
+    has_audio = bool(audio_file and audio_file.filename)
+    if not has_labels and not has_audio and not server_file:
+        return jsonify({"error": "Provide a label file, or an audio file or server video to detect beats from."}), 400
+    try:
+        options = montage_options_from_form(request.form)
+        keyframe_times = None
+        beat_source_path = None
+        if server_file:
+            video_path = os.path.join(app.config['SERVER_VIDEOS_FOLDER'], secure_filename(server_file))
+            if not os.path.exists(video_path):
+                return jsonify({"error": f"Server file '{server_file}' not found."}), 404
+            beat_source_path = video_path
+            variants = montage_maker.parse_output_variants(options['resolution'])
+            video_path, source_info = montage_maker.resolve_render_source(
+                video_path, variants[0]['width'], variants[0]['height'], media_index,
+                proxy_cache if len(variants) == 1 else None # Multi-variant renders read the original
+            )
+            try:
+                input_video_duration = source_info['duration']
+                if options['cut_mode'] == 'copy':
+                    keyframe_times = media_index.get_keyframes(video_path)
+            finally:
+                if video_path != beat_source_path: # A pinned proxy replaced the source
+                    proxy_cache.release(video_path)
+        elif video_duration:
+            input_video_duration = float(video_duration)
+        else:
+            return jsonify({"error": "Provide a server_video_filename or the video_duration of the source."}), 400
+
+        if has_labels:
+            with tempfile.NamedTemporaryFile(dir=app.config['UPLOAD_FOLDER'], suffix='.txt', delete=False) as f:
+                label_file.save(f)
+            try:
+                beat_timestamps = montage_maker.parse_audacity_labels_np(f.name)
+            finally:
+                os.remove(f.name)
+            plan = montage_maker.plan_montage_scenes(
+                input_video_duration, beat_timestamps, options['total_duration'], options['total_scenes'],
+                options['min_scene_duration'], options['seed'], keyframe_times
+            )
+            return jsonify(plan)
+    except (montage_maker.MontageError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    # --- Beat detection can take minutes: run it as a task, the plan arrives in its final state ---
+    if scheduler.is_full():
+        return queue_full_response()
+    task_id = str(uuid.uuid4())
+    task_temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], task_id)
+    if has_audio:
+        os.makedirs(task_temp_dir)
+        beat_source_path = os.path.join(task_temp_dir, secure_filename(audio_file.filename))
+        audio_file.save(beat_source_path)
+    tasks.create(task_id, {"status": "queued", "message": "Plan queued.", "task_id": task_id, "seed": options["seed"]})
+    touch_task(task_id)
+    start_task_job(task_id)
+    try:
+        queue_position = scheduler.submit(task_id, process_plan_task, args=(
+            task_id, beat_source_path, input_video_duration, keyframe_times, options
+        ))
+    except QueueFullError:
+        montage_maker.finish_job(task_id)
+        tasks.delete(task_id)
+        shutil.rmtree(task_temp_dir, ignore_errors=True)
+        return queue_full_response()
+    return jsonify({"task_id": task_id, "message": f"Plan queued (position {queue_position}).", "queue_position": queue_position}), 202
+
 @app.route('/create_montage', methods=['POST'])
 def create_montage_route():
     task_id = str(uuid.uuid4())
@@ -138,27 +623,44 @@ def create_montage_route():
         video_url = request.form.get('input_video_url')
         video_file = request.files.get('input_video_file')
         server_file = request.form.get('server_video_filename')
+        upload_id = request.form.get('upload_id') # Finished chunked upload
 
         source_count = sum([
             1 if video_url else 0,
             1 if video_file and video_file.filename else 0,
-            1 if server_file else 0
+            1 if server_file else 0,
+            1 if upload_id else 0
         ])
 
         if source_count != 1:
             return jsonify({"error": "Please provide exactly ONE video source (URL, Upload, or Server File)."}), 400
 
-        # --- Handle required label file ---
+        # --- Admission control: reject before saving or downloading anything ---
+        if scheduler.is_full():
+            return queue_full_response()
+
+        # --- A scene plan from /plan replaces the label file ---
+        plan = None
+        if request.form.get('plan'):
+            try:
+                plan = json.loads(request.form['plan'])
+            except ValueError as e:
+                return jsonify({"error": f"Invalid plan JSON: {e}"}), 400
+            if not isinstance(plan, dict) or not plan.get('scenes'):
+                return jsonify({"error": "The plan must be a JSON object with a non-empty 'scenes' list."}), 400
+
+        # --- Optional label file; without one, beats are detected from the audio ---
         label_file = request.files.get('label_file')
-        if not label_file or not label_file.filename:
-            return jsonify({"error": "A label file is required."}), 400
+        has_labels = bool(label_file and label_file.filename)
 
         # --- Save transient files to a unique temp folder ---
         task_temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], task_id)
         os.makedirs(task_temp_dir)
         
-        label_path = os.path.join(task_temp_dir, secure_filename(label_file.filename))
-        label_file.save(label_path)
+        label_path = None
+        if plan is None and has_labels:
+            label_path = os.path.join(task_temp_dir, secure_filename(label_file.filename))
+            label_file.save(label_path)
 
         # --- Determine video path ---
         video_path = None
@@ -166,11 +668,13 @@ def create_montage_route():
             video_path = os.path.join(app.config['SERVER_VIDEOS_FOLDER'], secure_filename(server_file))
             if not os.path.exists(video_path):
                  return jsonify({"error": f"Server file '{server_file}' not found."}), 404
-        elif video_url:
-            yt_dlp_dir = os.path.join(app.config['YT_DOWNLOADS_FOLDER'], task_id)
-            os.makedirs(yt_dlp_dir)
-            video_path = run_yt_dlp_download(video_url, yt_dlp_dir, task_id)
-        elif video_file:
+        elif upload_id:
+            try:
+                video_path = upload_store.completed_path(upload_id)
+            except UploadError as e:
+                shutil.rmtree(task_temp_dir, ignore_errors=True)
+                return jsonify({"error": str(e)}), e.status_code
+        elif video_file: # A video_url is downloaded by the task itself, off the request thread
             video_path = os.path.join(task_temp_dir, secure_filename(video_file.filename))
             video_file.save(video_path)
 
@@ -182,24 +686,39 @@ def create_montage_route():
             audio_file.save(audio_path)
         
         # --- Gather options and start task ---
-        options = {
-            "resolution": request.form.get('resolution', '1280x720'),
-            "total_duration": float(request.form.get('total_duration', 0)),
-            "total_scenes": int(request.form.get('total_scenes', 0)),
-            "min_scene_duration": float(request.form.get('min_scene_duration', 0.6)),
-            "audio_mode": request.form.get('audio_mode', 'replace'),
-            "audio_file_path": audio_path
-        }
-        
+        options = montage_options_from_form(request.form, audio_path)
+        options["plan"] = plan
+        if plan is not None:
+            options["seed"] = None # The plan already fixes every scene
+        options["beat_detection"] = DETECTOR_VERSION if plan is None and label_path is None else None
+
         output_name = f"montage_output_{task_id}.mp4"
-        tasks[task_id] = {"status": "queued", "message": "Task queued.", "task_id": task_id}
-        
-        thread = threading.Thread(target=process_montage_task, args=(
-            task_id, video_path, label_path, output_name, options
-        ))
-        thread.start()
+        priority = job_priority_from_request(request)
+        try:
+            montage_maker.parse_output_variants(options['resolution'])
+        except montage_maker.MontageError as e:
+            shutil.rmtree(task_temp_dir, ignore_errors=True)
+            return jsonify({"error": str(e)}), 400
+        task = {"status": "queued", "message": "Task queued.", "task_id": task_id, "seed": options["seed"]}
+        if upload_id:
+            task["upload_id"] = upload_id # Keeps the janitor off the upload until the task finishes
+        if request.form.get('cancel_when_abandoned'): # Set by the web UI, whose page watches the task until it finishes
+            task["cancel_when_abandoned"] = True
+        tasks.create(task_id, task)
+        touch_task(task_id)
+
+        start_task_job(task_id) # Before queueing, so a cancel can always reach the job
+        try:
+            queue_position = scheduler.submit(task_id, process_montage_task, args=(
+                task_id, video_path, label_path, output_name, options, time.monotonic(), video_url
+            ), priority=priority)
+        except QueueFullError:
+            montage_maker.finish_job(task_id)
+            tasks.delete(task_id)
+            shutil.rmtree(task_temp_dir, ignore_errors=True)
+            return queue_full_response()
 
-        return jsonify({"task_id": task_id, "message": "Processing initiated..."}), 202
+        return jsonify({"task_id": task_id, "message": f"Task queued (position {queue_position}).", "queue_position": queue_position}), 202
 
     except Exception as e:
         app.logger.error(f"Error in /create_montage for task {task_id}: {e}", exc_info=True)
@@ -210,20 +729,105 @@ def create_montage_route():
         return jsonify({"error": f"A server error occurred: {e}"}), 500
 
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint: queue, ffmpeg, task outcome and per-stage timing metrics."""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/task/<task_id>', methods=['DELETE'])
+@app.route('/task/<task_id>/cancel', methods=['POST']) # navigator.sendBeacon can only POST
+def cancel_task_route(task_id):
+    """Cancel a queued or running task: 200 once cancelled, 202 while its processes are being stopped."""
+    task = cancel_task(task_id, "Cancelled by the user.")
+    if task is None:
+        return jsonify({"status": "error", "message": "Task not found."}), 404
+    if task.get("status") in ("completed", "error"):
+        return jsonify({"error": f"Task already finished ({task['status']}).", "status": task["status"]}), 409
+    if task.get("status") == "cancelled":
+        return jsonify(task), 200
+    return jsonify(dict(task, message="Cancelling...")), 202
+
 @app.route('/status/<task_id>')
 def task_status(task_id):
-    task = tasks.get(task_id)
+    touch_task(task_id)
+    task = task_snapshot(task_id)
     return jsonify(task) if task else (jsonify({"status": "error", "message": "Task not found."}), 404)
 
+@app.route('/events/<task_id>')
+def task_events(task_id):
+    """Server-Sent Events stream of a task's state; ends once the task completes or fails."""
+    if tasks.get(task_id) is None:
+        return jsonify({"status": "error", "message": "Task not found."}), 404
+    keepalive_interval = app.config['SSE_KEEPALIVE_INTERVAL']
+
+    def event_stream():
+        condition = task_condition(task_id)
+        last_version, last_snapshot = None, None
+        with task_conditions_lock:
+            task_watchers[task_id] = task_watchers.get(task_id, 0) + 1
+        try:
+            while True:
+                with condition:
+                    condition.wait_for(lambda: task_versions.get(task_id, 0) != last_version, timeout=keepalive_interval)
+                    version = task_versions.get(task_id, 0)
+                snapshot = task_snapshot(task_id)
+                if snapshot is None:
+                    yield f"data: {json.dumps({'status': 'error', 'message': 'Task not found.', 'task_id': task_id})}\n\n"
+                    return
+                last_version = version # A bump that left the snapshot unchanged must not wake the loop again
+                if snapshot == last_snapshot:
+                    yield ": keep-alive\n\n" # Fails once the client is gone, which ends the stream
+                    continue
+                last_snapshot = snapshot
+                yield f"data: {json.dumps(snapshot)}\n\n"
+                if snapshot.get("status") in FINISHED_STATUSES:
+                    return
+        finally:
+            with task_conditions_lock:
+                task_last_seen[task_id] = time.monotonic()
+                if task_watchers.get(task_id, 0) > 1:
+                    task_watchers[task_id] -= 1
+                else:
+                    task_watchers.pop(task_id, None)
+
+    return Response(event_stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def send_output_file(relative_path, mimetype, as_attachment=False, max_age=None):
+    """File under OUTPUT_FOLDER, with Range (206) and ETag/If-None-Match/If-Range handling.
+
+    With SENDFILE_MODE set, the response only names the file and the front proxy sends
+    the bytes (and answers range and conditional requests itself).
+    """
+    output_folder = os.path.abspath(app.config['OUTPUT_FOLDER']) # Where the tasks wrote it, not relative to app.root_path
+    if not os.path.isfile(os.path.join(output_folder, relative_path)):
+        abort(404)
+    if app.config['SENDFILE_MODE'] == 'x-accel-redirect':
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = app.config['SENDFILE_ACCEL_PREFIX'].rstrip('/') + '/' + quote(relative_path.replace(os.sep, '/'))
+        if as_attachment:
+            response.headers.set('Content-Disposition', 'attachment', filename=os.path.basename(relative_path))
+        return response
+    return send_from_directory(output_folder, relative_path, mimetype=mimetype, as_attachment=as_attachment, conditional=True, etag=True, max_age=max_age)
+
 @app.route('/download/<task_id>/<filename>')
 def download_file(task_id, filename):
-    directory = os.path.join(app.config['OUTPUT_FOLDER'], task_id)
-    return send_from_directory(directory, secure_filename(filename), as_attachment=True)
+    return send_output_file(os.path.join(secure_filename(task_id), secure_filename(filename)), 'video/mp4', as_attachment=True, max_age=app.config['OUTPUT_CACHE_MAX_AGE'])
 
 @app.route('/stream/<task_id>/<filename>')
 def stream_video(task_id, filename):
-    directory = os.path.join(app.config['OUTPUT_FOLDER'], task_id)
-    return send_from_directory(directory, secure_filename(filename), mimetype='video/mp4')
+    return send_output_file(os.path.join(secure_filename(task_id), secure_filename(filename)), 'video/mp4', max_age=app.config['OUTPUT_CACHE_MAX_AGE'])
+
+@app.route('/hls/<task_id>/<hls_dir>/<filename>')
+def stream_hls(task_id, hls_dir, filename):
+    """Live HLS playlist and segments of a montage rendered with output_mode=hls."""
+    relative_path = os.path.join(secure_filename(task_id), secure_filename(hls_dir), secure_filename(filename))
+    if relative_path.endswith('.m3u8'):
+        # The playlist grows while the montage renders; players must re-fetch it
+        response = send_output_file(relative_path, 'application/vnd.apple.mpegurl', max_age=0)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    # Segments never change once listed
+    return send_output_file(relative_path, 'video/mp2t', max_age=app.config['OUTPUT_CACHE_MAX_AGE'])
 
 if __name__ == '__main__':
     app.logger.info(f"Persistent video storage is at: {os.path.abspath(SERVER_VIDEOS_FOLDER)}")
@@ -0,0 +1,237 @@
+# batch.py
+"""Offline bulk montage generation from a JSONL manifest.
+
+Usage: python -m montage_maker batch manifest.jsonl [--jobs 4] [--output-dir out] [--results results.jsonl] [--resume]
+
+Each manifest line is one job:
+  {"id": "clip-001", "video": "a.mp4", "labels": "a.txt", "audio": "song.mp3", "audio_mode": "replace",
+   "resolution": "1280x720", "duration": 30, "scenes": 0, "min_scene_duration": 0.6, "seed": 1,
+   "output": "clip-001.mp4", "engine": "clips", "cut_mode": "reencode"}
+Only "video" is required, plus "labels" unless --beat-cache enables beat detection. Ids
+default to the line number and must be unique. Relative paths are relative to the manifest;
+"output" defaults to <output-dir>/<id>.mp4. One result line per job (status ok/error/skipped,
+output files, seconds) is appended to the results file.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import montage_maker
+import job_queue
+from media_index import MediaIndex
+from beat_detection import BeatCache
+
+logger = logging.getLogger(__name__)
+
+JOB_DEFAULTS = {
+    "audio": None, "audio_mode": "replace", "resolution": "1920x1080", "duration": 0, "scenes": 0,
+    "min_scene_duration": montage_maker.DEFAULT_MIN_BEAT_GROUPED_SCENE_DURATION, "seed": None,
+    "engine": "clips", "cut_mode": "reencode", "labels": None,
+}
+
+def load_manifest(manifest_path, output_dir):
+    """Manifest lines as job dicts with defaults applied and paths made absolute."""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    resolve = lambda path: os.path.join(base_dir, path) if path else path # Absolute paths pass through unchanged
+    jobs = []
+    with open(manifest_path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                raise montage_maker.MontageError(f"{manifest_path}:{line_number}: invalid JSON ({e})")
+            if not isinstance(entry, dict) or not entry.get("video"):
+                raise montage_maker.MontageError(f"{manifest_path}:{line_number}: every job needs a \"video\".")
+            job = dict(JOB_DEFAULTS, **entry)
+            job["id"] = str(entry.get("id", line_number))
+            for key in ("video", "labels", "audio"):
+                job[key] = resolve(job[key])
+            job["output"] = resolve(entry["output"]) if entry.get("output") else os.path.join(os.path.abspath(output_dir), f"{job['id']}.mp4")
+            jobs.append(job)
+    ids = [job["id"] for job in jobs]
+    if len(set(ids)) != len(ids): # Each id names the job's JobControl, so a cancel or timeout must reach only one job
+        duplicates = sorted({job_id for job_id in ids if ids.count(job_id) > 1})
+        raise montage_maker.MontageError(f"Manifest job ids must be unique; repeated: {', '.join(duplicates)}.")
+    outputs = [job["output"] for job in jobs]
+    if len(set(outputs)) != len(outputs):
+        raise montage_maker.MontageError("Several manifest jobs write the same output file; give them distinct ids or outputs.")
+    return jobs
+
+def output_paths(job):
+    """Every file the job produces: the output, then one per extra resolution variant."""
+    variants = montage_maker.parse_output_variants(job["resolution"])
+    return [montage_maker.variant_output_path(job["output"], variants, k) for k in range(len(variants))]
+
+def partial_output_path(output_path):
+    """Where a job renders before its outputs are moved into place, so --resume never trusts a half-written file."""
+    directory, name = os.path.split(output_path)
+    return os.path.join(directory, f".partial.{name}")
+
+class BatchRunner:
+    """Runs manifest jobs on a thread pool with shared probe, label and beat caches."""
+    def __init__(self, results_file, jobs=2, media_index=None, label_cache=None, beat_cache=None,
+                 extraction_workers=1, ffmpeg_threads=0, job_timeout=None, work_queue=None, work_dir=None):
+        self.results_file = results_file
+        self.jobs = jobs
+        self.media_index = media_index
+        self.label_cache = label_cache or montage_maker.LabelCache()
+        self.beat_cache = beat_cache
+        self.extraction_workers = extraction_workers
+        self.ffmpeg_threads = ffmpeg_threads
+        self.job_timeout = job_timeout
+        self.work_queue = work_queue
+        self.work_dir = work_dir
+        self._lock = threading.Lock()
+        self._finished = 0
+        self.counts = {"ok": 0, "error": 0, "skipped": 0}
+
+    def _record(self, result, total):
+        with self._lock:
+            self.results_file.write(json.dumps(result) + "\n")
+            self.results_file.flush()
+            self.counts[result["status"]] += 1
+            self._finished += 1
+            detail = f"{result['seconds']:.1f}s" if result["status"] == "ok" else result.get("error", "")
+            print(f"[{self._finished}/{total}] {result['id']} {result['status']} {detail}", file=sys.stderr)
+
+    def run_job(self, job):
+        """Renders one job; returns its result dict. Never raises for a failed job."""
+        task_id = f"batch-{job['id']}"
+        result = {"id": job["id"], "video": job["video"], "outputs": output_paths(job)}
+        partial_output = partial_output_path(job["output"])
+        completed = {}
+        def progress_callback(_task_id, update):
+            if update.get("status") == "completed":
+                completed.update(update)
+            elif update.get("message"):
+                logger.debug(f"{job['id']}: {update['message']}")
+
+        montage_maker.start_job(task_id, self.job_timeout)
+        started = time.monotonic()
+        result["started_at"] = time.time()
+        try:
+            os.makedirs(os.path.dirname(job["output"]), exist_ok=True)
+            montage_maker.create_rhythmic_montage_ffmpeg(
+                input_video_path=job["video"],
+                output_video_path=partial_output,
+                label_file_path=job["labels"],
+                output_resolution_str=job["resolution"],
+                target_total_output_duration_sec=float(job["duration"]),
+                target_total_num_scenes=int(job["scenes"]),
+                min_beat_grouped_scene_duration=float(job["min_scene_duration"]),
+                audio_file_path=job["audio"],
+                audio_mix_behavior=job["audio_mode"],
+                progress_callback=progress_callback,
+                task_id=task_id,
+                render_engine=job["engine"],
+                extraction_workers=self.extraction_workers,
+                ffmpeg_threads=self.ffmpeg_threads,
+                media_index=self.media_index,
+                cut_mode=job["cut_mode"],
+                seed=job["seed"],
+                beat_detector=self.beat_cache,
+                work_queue=self.work_queue,
+                work_dir=self.work_dir,
+                label_cache=self.label_cache
+            )
+            if not completed: # A label file error returns without raising
+                raise montage_maker.MontageError("The montage was not created.")
+            for output_path in result["outputs"]:
+                os.replace(partial_output_path(output_path), output_path)
+            result.update(status="ok", message=completed.get("message", "").replace(os.path.basename(partial_output), os.path.basename(job["output"])))
+        except Exception as e:
+            for output_path in result["outputs"]:
+                try:
+                    os.remove(partial_output_path(output_path))
+                except OSError:
+                    pass
+            result.update(status="error", error=str(e))
+        finally:
+            montage_maker.finish_job(task_id)
+            result["seconds"] = round(time.monotonic() - started, 3)
+        return result
+
+    def run(self, jobs, resume=False):
+        """Runs every job (skipping those whose outputs all exist when resume is set); returns self.counts."""
+        total = len(jobs)
+        pending = []
+        for job in jobs:
+            try:
+                outputs = output_paths(job)
+            except montage_maker.MontageError as e:
+                self._record({"id": job["id"], "video": job["video"], "status": "error", "error": str(e), "seconds": 0.0}, total)
+                continue
+            if resume and all(os.path.exists(path) for path in outputs):
+                self._record({"id": job["id"], "video": job["video"], "outputs": outputs, "status": "skipped", "seconds": 0.0}, total)
+            else:
+                pending.append(job)
+        executor = ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="batch_job")
+        try:
+            futures = [executor.submit(self.run_job, job) for job in pending]
+            for future in as_completed(futures): # Recorded as they finish, so an interrupted run loses nothing
+                self._record(future.result(), total)
+        except KeyboardInterrupt:
+            print("Interrupted; cancelling running jobs...", file=sys.stderr)
+            for job in pending:
+                montage_maker.cancel_job(f"batch-{job['id']}", "The batch was interrupted.")
+            raise
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        return self.counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m montage_maker batch", description=__doc__.splitlines()[0])
+    parser.add_argument("manifest", help="JSONL file, one job per line")
+    parser.add_argument("--jobs", type=int, default=2, help="Montages rendered in parallel (default: 2)")
+    parser.add_argument("--extraction-workers", type=int, default=1, help="Parallel scene extractions within one montage (default: 1)")
+    parser.add_argument("--ffmpeg-threads", type=int, default=0, help="Threads per ffmpeg process (default: 0, ffmpeg decides)")
+    parser.add_argument("--output-dir", default="batch_outputs", help="Folder for jobs without an \"output\" (default: batch_outputs)")
+    parser.add_argument("--results", help="Result lines are appended here (default: <manifest>.results.jsonl)")
+    parser.add_argument("--resume", action="store_true", help="Skip jobs whose outputs already exist")
+    parser.add_argument("--cache-dir", default=os.path.join("data", "batch"), help="Probe index kept across runs (default: data/batch)")
+    parser.add_argument("--media-root", help="Videos under this folder have their probe results persisted (default: common folder of the manifest videos)")
+    parser.add_argument("--beat-cache", help="Detect beats for jobs without labels, caching them in this folder")
+    parser.add_argument("--job-timeout", type=float, help="Seconds one montage may run before it is stopped")
+    parser.add_argument("--queue", default=os.environ.get("WORK_QUEUE_URL"), help="Render clips-engine scenes on workers through this queue (default: $WORK_QUEUE_URL)")
+    parser.add_argument("--work-dir", help="Shared folder for distributed scene clips (required with --queue)")
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be >= 1")
+    if args.queue and not args.work_dir:
+        parser.error("--work-dir is required with --queue")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    try:
+        jobs = load_manifest(args.manifest, args.output_dir)
+    except (OSError, montage_maker.MontageError) as e:
+        print(f"Cannot read manifest: {e}", file=sys.stderr)
+        return 2
+    media_root = args.media_root or (os.path.commonpath([os.path.dirname(job["video"]) for job in jobs]) if jobs else os.getcwd())
+    os.makedirs(args.cache_dir, exist_ok=True)
+    media_index = MediaIndex(os.path.join(args.cache_dir, "media_index.sqlite3"), media_root, set())
+    if args.work_dir:
+        os.makedirs(args.work_dir, exist_ok=True)
+    results_path = args.results or f"{os.path.splitext(args.manifest)[0]}.results.jsonl"
+    with open(results_path, "a" if args.resume else "w") as results_file:
+        runner = BatchRunner(
+            results_file, args.jobs, media_index,
+            beat_cache=BeatCache(args.beat_cache) if args.beat_cache else None,
+            extraction_workers=args.extraction_workers, ffmpeg_threads=args.ffmpeg_threads,
+            job_timeout=args.job_timeout,
+            work_queue=job_queue.open_work_queue(args.queue) if args.queue else None,
+            work_dir=args.work_dir
+        )
+        try:
+            counts = runner.run(jobs, resume=args.resume)
+        except KeyboardInterrupt:
+            return 130
+    print(f"{counts['ok']} ok, {counts['error']} failed, {counts['skipped']} skipped; results in {results_path}", file=sys.stderr)
+    return 1 if counts["error"] else 0
@@ -0,0 +1,184 @@
+# beat_detection.py
+import os
+import subprocess
+import tempfile
+import threading
+import logging
+
+try:
+    import numpy as np
+except ImportError: # Beat detection is unavailable without NumPy; label files still work
+    np = None
+
+import montage_maker
+from render_cache import file_content_hash
+
+logger = logging.getLogger(__name__)
+
+DETECTOR_VERSION = 1 # Bump when the detector or its parameters change; invalidates cached beats
+SAMPLE_RATE = 22050
+FRAME_SIZE = 1024 # Samples per STFT frame
+HOP_SIZE = 512 # Samples between frames (~23 ms)
+CHUNK_FRAMES = 512 # Frames decoded per pipe read (~12 s of audio, 1 MB of PCM)
+LOG_COMPRESSION = 100.0 # Magnitudes go through log1p(LOG_COMPRESSION * |X|) before differencing
+PEAK_MAX_WINDOW = 0.03 # Seconds on each side an onset must be the local flux maximum over
+PEAK_MEAN_WINDOW = 0.1 # Seconds on each side of the local flux mean used as threshold
+PEAK_DELTA = 0.07 # Threshold above the local mean, relative to the loudest flux seen so far
+MIN_ONSET_INTERVAL = 0.1 # Seconds; closer onsets are dropped
+
+def _seconds_to_frames(seconds):
+    return max(1, int(round(seconds * SAMPLE_RATE / HOP_SIZE)))
+
+class _OnsetPicker:
+    """Streaming peak picking over the spectral flux, one chunk of frames at a time.
+
+    Keeps only the frames still needed as context for undecided ones, so memory does
+    not grow with the track length.
+    """
+    def __init__(self):
+        self.max_window = _seconds_to_frames(PEAK_MAX_WINDOW)
+        self.mean_window = _seconds_to_frames(PEAK_MEAN_WINDOW)
+        self.context = max(self.max_window, self.mean_window)
+        self.min_gap = _seconds_to_frames(MIN_ONSET_INTERVAL)
+        # Zero flux before the first frame, so the first frames get full windows too
+        self.flux = np.zeros(self.context)
+        self.flux_start = -self.context # Frame number of self.flux[0]
+        self.next_frame = 0 # First frame not yet decided
+        self.peak_level = 0.0
+        self.last_onset = None
+        self.onset_frames = []
+
+    def feed(self, flux, final=False):
+        if len(flux):
+            self.peak_level = max(self.peak_level, float(flux.max()))
+        self.flux = np.concatenate((self.flux, flux))
+        if final: # Mirror the last frames to close the remaining windows without biasing the local mean
+            self.flux = np.concatenate((self.flux, self.flux[::-1][:self.context]))
+        last_decidable = self.flux_start + len(self.flux) - 1 - self.context
+        if last_decidable < self.next_frame:
+            return
+
+        first = self.next_frame - self.flux_start
+        last = last_decidable - self.flux_start
+        candidates = self.flux[first:last + 1]
+        max_width = 2 * self.max_window + 1
+        local_max = np.lib.stride_tricks.sliding_window_view(
+            self.flux[first - self.max_window:last + self.max_window + 1], max_width
+        ).max(axis=1)
+        cumulative = np.concatenate(([0.0], np.cumsum(self.flux[first - self.mean_window:last + self.mean_window + 1])))
+        mean_width = 2 * self.mean_window + 1
+        local_mean = (cumulative[mean_width:] - cumulative[:-mean_width]) / mean_width
+        is_peak = (candidates > 0) & (candidates == local_max) & (candidates >= local_mean + PEAK_DELTA * self.peak_level)
+
+        for offset in np.flatnonzero(is_peak).tolist():
+            frame = self.next_frame + offset
+            if self.last_onset is None or frame - self.last_onset >= self.min_gap:
+                self.onset_frames.append(frame)
+                self.last_onset = frame
+        self.next_frame = last_decidable + 1
+        keep_from = self.next_frame - self.context - self.flux_start
+        self.flux = self.flux[keep_from:]
+        self.flux_start += keep_from
+
+def detect_beats(audio_path, progress_callback=None, task_id=None):
+    """Onset times (seconds) of the first audio track in audio_path, via spectral flux.
+
+    PCM is decoded by ffmpeg into a pipe and analysed in fixed-size chunks, so memory
+    stays constant regardless of track length. The result has the same shape as
+    parse_audacity_labels: sorted, unique, rounded to Audacity's 6 decimals.
+    """
+    if np is None:
+        raise montage_maker.MontageError("Beat detection requires NumPy. Install it or provide a label file.")
+    if progress_callback and task_id:
+        progress_callback(task_id, {"status": "processing", "message": f"Detecting beats in {os.path.basename(audio_path)}..."})
+    cmd = [
+        "ffmpeg", "-nostdin", "-v", "error", "-i", audio_path, "-map", "0:a:0",
+        "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "f32le", "pipe:1"
+    ]
+    window = np.hanning(FRAME_SIZE).astype(np.float32)
+    picker = _OnsetPicker()
+    chunk_bytes = CHUNK_FRAMES * HOP_SIZE * 4
+    samples = np.zeros(FRAME_SIZE // 2, dtype=np.float32) # Leading silence centres frame k on k * HOP_SIZE; then the unanalysed tail
+    previous_spectrum = np.zeros(FRAME_SIZE // 2 + 1) # Silence before the track, so an onset at 0 counts
+    with tempfile.TemporaryFile() as stderr_file:
+        process = montage_maker.start_child_process(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+        montage_maker.ACTIVE_FFMPEG.inc()
+        with montage_maker.ChildSupervision(process, task_id, montage_maker.stage_timeout("beat_detection", task_id)) as supervision:
+            try:
+                while True:
+                    data = process.stdout.read(chunk_bytes)
+                    if not data:
+                        break
+                    samples = np.concatenate((samples, np.frombuffer(data[:len(data) - len(data) % 4], dtype='<f4')))
+                    if len(samples) < FRAME_SIZE:
+                        continue
+                    num_frames = (len(samples) - FRAME_SIZE) // HOP_SIZE + 1
+                    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_SIZE)[::HOP_SIZE][:num_frames]
+                    spectra = np.log1p(LOG_COMPRESSION * np.abs(np.fft.rfft(frames * window, axis=1)))
+                    differences = np.diff(np.vstack((previous_spectrum, spectra)), axis=0)
+                    picker.feed(np.maximum(differences, 0).mean(axis=1))
+                    previous_spectrum = spectra[-1]
+                    samples = samples[num_frames * HOP_SIZE:]
+                process.stdout.close()
+                return_code = montage_maker.wait_child_process(process)
+            except BaseException:
+                montage_maker.kill_process_group(process)
+                montage_maker.wait_child_process(process)
+                raise
+            finally:
+                montage_maker.ACTIVE_FFMPEG.dec()
+        if return_code != 0:
+            supervision.raise_if_stopped(f"beat detection in '{os.path.basename(audio_path)}'")
+            stderr_file.seek(0)
+            error_output = stderr_file.read().decode(errors='replace').strip()
+            if progress_callback and task_id:
+                progress_callback(task_id, {"status": "error", "message": f"Could not decode audio of '{os.path.basename(audio_path)}' for beat detection. Does it have an audio track?"})
+            raise montage_maker.MontageError(f"ffmpeg failed to decode audio of '{audio_path}' for beat detection: {error_output[-2000:]}")
+    picker.feed(np.zeros(0), final=True)
+
+    beat_timestamps = sorted({round(frame * HOP_SIZE / SAMPLE_RATE, 6) for frame in picker.onset_frames})
+    if progress_callback and task_id:
+        progress_callback(task_id, {"status": "processing", "message": f"Detected {len(beat_timestamps)} beats."})
+    return beat_timestamps
+
+class BeatCache:
+    """Detected beats stored as Audacity label files, keyed by the audio's content hash.
+
+    The same soundtrack reused across jobs is only analysed once; the cached files can
+    also be opened in Audacity to inspect or correct the detection.
+    """
+    def __init__(self, cache_folder):
+        self.cache_folder = cache_folder
+        self._lock = threading.Lock()
+        self._key_locks = {} # cache key -> [Lock, number of callers using it], so concurrent jobs on one track detect once
+        os.makedirs(cache_folder, exist_ok=True)
+
+    def label_path_for(self, audio_path):
+        return os.path.join(self.cache_folder, f"{file_content_hash(audio_path)}.v{DETECTOR_VERSION}.txt")
+
+    def get_beats(self, audio_path, progress_callback=None, task_id=None):
+        """Beat timestamps of audio_path, detected on first use and read from the cache after."""
+        label_path = self.label_path_for(audio_path)
+        with self._lock:
+            key_entry = self._key_locks.setdefault(label_path, [threading.Lock(), 0])
+            key_entry[1] += 1
+        key_lock = key_entry[0]
+        try:
+            with key_lock:
+                if os.path.exists(label_path):
+                    if progress_callback and task_id:
+                        progress_callback(task_id, {"status": "processing", "message": "Using cached beats for this audio."})
+                    return montage_maker.parse_audacity_labels_np(label_path, progress_callback, task_id)
+                beat_timestamps = detect_beats(audio_path, progress_callback, task_id)
+                partial_path = f"{label_path}.partial"
+                with open(partial_path, 'w') as f:
+                    for timestamp in beat_timestamps:
+                        f.write(f"{timestamp:.6f}\t{timestamp:.6f}\tbeat\n")
+                os.replace(partial_path, label_path)
+                logger.info(f"Cached {len(beat_timestamps)} detected beats for {os.path.basename(audio_path)}")
+                return beat_timestamps
+        finally:
+            with self._lock:
+                key_entry[1] -= 1
+                if key_entry[1] == 0: # Dropped only by the last caller, so waiters keep sharing it
+                    del self._key_locks[label_path]
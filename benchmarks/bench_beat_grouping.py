@@ -0,0 +1,63 @@
+# bench_beat_grouping.py
+"""Micro-benchmark: pure-Python vs NumPy label parsing and beat grouping.
+
+Usage: python benchmarks/bench_beat_grouping.py [--sizes 1000,10000,100000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import montage_maker
+
+def write_label_file(path, num_beats, rng):
+    """Writes an Audacity point-label track with onsets roughly 50-400 ms apart."""
+    timestamp = 0.0
+    with open(path, 'w') as f:
+        for i in range(num_beats):
+            timestamp += rng.uniform(0.05, 0.4)
+            f.write(f"{timestamp:.6f}\t{timestamp:.6f}\tonset {i}\n")
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000,500000", help="Comma-separated label counts")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement; the best is reported")
+    parser.add_argument("--min-duration", type=float, default=montage_maker.DEFAULT_MIN_BEAT_GROUPED_SCENE_DURATION)
+    args = parser.parse_args()
+    if montage_maker.np is None:
+        print("NumPy is not installed; both columns measure the pure-Python path.")
+
+    rng = random.Random(0)
+    print(f"{'labels':>8} {'parse py':>10} {'parse np':>10} {'group py':>10} {'group np':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for num_beats in (int(size) for size in args.sizes.split(',')):
+            label_path = os.path.join(temp_dir, f"labels_{num_beats}.txt")
+            write_label_file(label_path, num_beats, rng)
+
+            parse_py, beats = best_time(lambda: montage_maker.parse_audacity_labels(label_path), args.repeat)
+            parse_np, beats_np = best_time(lambda: montage_maker.parse_audacity_labels_np(label_path), args.repeat)
+            group_py, durations = best_time(
+                lambda: montage_maker.generate_beat_grouped_scene_durations(beats, 0, args.min_duration), args.repeat
+            )
+            group_np, durations_np = best_time(
+                lambda: montage_maker.generate_beat_grouped_scene_durations_np(beats, 0, args.min_duration), args.repeat
+            )
+            if beats_np != beats or durations_np != durations:
+                raise SystemExit(f"Mismatch between the Python and NumPy paths at {num_beats} labels")
+            speedup = (parse_py + group_py) / (parse_np + group_np)
+            print(f"{num_beats:>8} {parse_py * 1000:>9.1f}ms {parse_np * 1000:>9.1f}ms "
+                  f"{group_py * 1000:>9.1f}ms {group_np * 1000:>9.1f}ms {speedup:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
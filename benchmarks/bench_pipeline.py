@@ -0,0 +1,213 @@
+# bench_pipeline.py
+"""End-to-end benchmark of create_rhythmic_montage_ffmpeg on synthetic media.
+
+Sources come from ffmpeg's lavfi test sources (testsrc2 + sine) at several resolutions,
+durations and GOP sizes; label files are generated at several beat densities. Each case
+runs in its own process, so peak RSS and child CPU time belong to that case alone.
+
+Usage: python benchmarks/bench_pipeline.py [--output results.json] [--filter 720p] [--repeat 3]
+"""
+import argparse
+import collections
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import montage_maker
+
+# name -> (width, height, duration in seconds, GOP size)
+SOURCES = {
+    "360p_60s_gop12": (640, 360, 60, 12),
+    "720p_60s_gop48": (1280, 720, 60, 48),
+    "1080p_60s_gop250": (1920, 1080, 60, 250),
+    "720p_300s_gop250": (1280, 720, 300, 250),
+}
+# name -> beats per minute; beats are jittered by up to 10% of the interval
+BEAT_DENSITIES = {"sparse": 60, "medium": 120, "dense": 240}
+DEFAULT_RENDER = {
+    "output_resolution": "1280x720",
+    "target_duration": 30.0,
+    "min_scene_duration": montage_maker.DEFAULT_MIN_BEAT_GROUPED_SCENE_DURATION,
+    "extraction_workers": 4,
+    "ffmpeg_threads": 2,
+    "cut_mode": "reencode",
+    "seed": 1234,
+}
+
+def make_source(work_dir, name):
+    width, height, duration, gop_size = SOURCES[name]
+    path = os.path.join(work_dir, f"{name}.mp4")
+    if not os.path.exists(path):
+        subprocess.run([
+            "ffmpeg", "-v", "error", "-y",
+            "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate=30:duration={duration}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=44100:duration={duration}",
+            "-c:v", "libx264", "-preset", "veryfast", "-g", str(gop_size), "-keyint_min", str(gop_size),
+            "-pix_fmt", "yuv420p", "-c:a", "aac", "-shortest", f"{path}.partial.mp4"
+        ], check=True)
+        os.replace(f"{path}.partial.mp4", path)
+    return path
+
+def make_labels(work_dir, density, duration):
+    path = os.path.join(work_dir, f"labels_{density}_{duration}s.txt")
+    if not os.path.exists(path):
+        rng = random.Random(f"{density}-{duration}")
+        interval = 60.0 / BEAT_DENSITIES[density]
+        timestamp = interval
+        with open(path, 'w') as f:
+            while timestamp < duration:
+                f.write(f"{timestamp:.6f}\t{timestamp:.6f}\tbeat\n")
+                timestamp += interval * rng.uniform(0.9, 1.1)
+    return path
+
+def build_cases(engines):
+    cases = []
+    for source in SOURCES:
+        for density in BEAT_DENSITIES:
+            for engine in engines:
+                cases.append(dict(DEFAULT_RENDER, name=f"{source}-{density}-{engine}", source=source, density=density, render_engine=engine))
+    return cases
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime, children.ru_utime + children.ru_stime
+
+def stage_totals():
+    """Per-stage span count, summed span wall time and ffmpeg/ffprobe CPU from the stage metrics."""
+    totals = collections.defaultdict(lambda: {"count": 0, "stage_sec": 0.0, "ffmpeg_cpu_sec": 0.0})
+    for suffix, (stage,), _, value in montage_maker.STAGE_SECONDS.samples():
+        if suffix == "_count":
+            totals[stage]["count"] = value
+        elif suffix == "_sum":
+            totals[stage]["stage_sec"] = value
+    for _, (stage,), _, value in montage_maker.STAGE_CHILD_CPU.samples():
+        totals[stage]["ffmpeg_cpu_sec"] = value
+    return dict(totals)
+
+class StageClock:
+    """Splits a run's time by pipeline stage from the stage_span metrics (STAGE_SECONDS, STAGE_CHILD_CPU).
+
+    stage_sec sums the wall time of every span of a stage, so stages whose spans run in
+    parallel (extract_scene) can exceed the run's wall time.
+    """
+    def __init__(self):
+        self._started = stage_totals()
+
+    def finish(self):
+        stages = {}
+        for stage, totals in stage_totals().items():
+            before = self._started.get(stage, {})
+            delta = {key: value - before.get(key, 0) for key, value in totals.items()}
+            if delta["count"]:
+                stages[stage] = {key: round(value, 3) for key, value in delta.items()}
+        return stages
+
+def run_case(case, work_dir):
+    """Runs one case in this process and returns its measurements."""
+    source_path = make_source(work_dir, case["source"])
+    label_path = make_labels(work_dir, case["density"], SOURCES[case["source"]][2])
+    output_path = os.path.join(work_dir, "out", f"{case['name']}.mp4")
+
+    clock = StageClock()
+    started_wall, started_cpu = time.perf_counter(), cpu_seconds()
+    montage_maker.create_rhythmic_montage_ffmpeg(
+        input_video_path=source_path,
+        output_video_path=output_path,
+        label_file_path=label_path,
+        output_resolution_str=case["output_resolution"],
+        target_total_output_duration_sec=case["target_duration"],
+        target_total_num_scenes=0,
+        min_beat_grouped_scene_duration=case["min_scene_duration"],
+        task_id=case["name"],
+        render_engine=case["render_engine"],
+        extraction_workers=case["extraction_workers"],
+        ffmpeg_threads=case["ffmpeg_threads"],
+        cut_mode=case["cut_mode"],
+        seed=case["seed"],
+    )
+    wall_sec = time.perf_counter() - started_wall
+    ended_cpu = cpu_seconds()
+    stages = clock.finish()
+
+    # Same inputs and seed give the same plan create_rhythmic_montage_ffmpeg rendered
+    plan = montage_maker.plan_montage_scenes(
+        SOURCES[case["source"]][2], montage_maker.parse_audacity_labels_np(label_path),
+        case["target_duration"], 0, case["min_scene_duration"], case["seed"]
+    )
+    output_seconds = montage_maker.get_video_duration(output_path) or 0.0
+    return {
+        "case": case,
+        "wall_sec": round(wall_sec, 3),
+        "cpu_sec": round((ended_cpu[0] - started_cpu[0]) + (ended_cpu[1] - started_cpu[1]), 3),
+        "ffmpeg_cpu_sec": round(ended_cpu[1] - started_cpu[1], 3),
+        "stages": stages,
+        "scene_count": plan["scene_count"],
+        "scenes_per_sec": round(plan["scene_count"] / wall_sec, 3),
+        "output_seconds": round(output_seconds, 3),
+        "output_seconds_per_wall_sec": round(output_seconds / wall_sec, 3),
+        "peak_rss_kb": {
+            "harness": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "ffmpeg": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        },
+    }
+
+def host_info():
+    try:
+        ffmpeg_version = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        ffmpeg_version = None
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": ffmpeg_version,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file to write")
+    parser.add_argument("--work-dir", default=os.path.join("benchmarks", ".work"), help="Generated sources, labels and outputs")
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this")
+    parser.add_argument("--engines", default=",".join(montage_maker.RENDER_ENGINES), help="Comma-separated render engines")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS) # Internal: run one JSON-encoded case, print its result
+    args = parser.parse_args()
+    os.makedirs(os.path.join(args.work_dir, "out"), exist_ok=True)
+
+    if args.run_case:
+        print(json.dumps(run_case(json.loads(args.run_case), args.work_dir)))
+        return
+
+    cases = [case for case in build_cases(args.engines.split(',')) if args.filter in case["name"]]
+    results = []
+    for case in cases:
+        for run in range(args.repeat):
+            process = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--work-dir", args.work_dir, "--run-case", json.dumps(case)],
+                capture_output=True, text=True
+            )
+            if process.returncode != 0:
+                print(f"{case['name']} run {run + 1}: FAILED\n{process.stderr[-2000:]}", file=sys.stderr)
+                results.append({"case": case, "run": run + 1, "error": process.stderr[-2000:]})
+                continue
+            result = json.loads(process.stdout.strip().splitlines()[-1])
+            result["run"] = run + 1
+            results.append(result)
+            print(f"{case['name']} run {run + 1}: {result['wall_sec']:.2f}s wall, {result['cpu_sec']:.2f}s CPU, "
+                  f"{result['scenes_per_sec']:.1f} scenes/s, {result['output_seconds_per_wall_sec']:.2f} output-s/s, "
+                  f"peak ffmpeg RSS {result['peak_rss_kb']['ffmpeg'] / 1024:.0f} MB")
+
+    with open(args.output, 'w') as f:
+        json.dump({"host": host_info(), "results": results}, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Wrote {len(results)} results to {args.output}")
+
+if __name__ == "__main__":
+    main()
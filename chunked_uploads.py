@@ -0,0 +1,223 @@
+# chunked_uploads.py
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+import logging
+
+from render_cache import link_or_copy, remember_file_hash
+
+logger = logging.getLogger(__name__)
+
+STREAM_READ_SIZE = 1024 * 1024
+METADATA_FILENAME = "upload.json"
+
+class UploadError(Exception):
+    """Client-side problem with a chunked upload (unknown id, wrong offset, size mismatch)."""
+    def __init__(self, message, status_code=400, current_offset=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.current_offset = current_offset
+
+class UploadStore:
+    """Resumable uploads written straight to their final location and hashed as they arrive.
+
+    Chunks must arrive in order (offset == bytes received so far); a client that lost its
+    connection asks for the current offset and continues from there. On completion a file
+    whose SHA-256 matches an earlier upload or an indexed server video is replaced by a
+    hardlink to that file, so identical content is stored once.
+    """
+    def __init__(self, upload_folder, media_index=None):
+        self.upload_folder = upload_folder
+        self.media_index = media_index
+        self._lock = threading.Lock()
+        self._upload_locks = {}
+        self._hash_states = {} # upload_id -> (bytes hashed, hashlib object); lost on restart, rebuilt on demand
+        self._completed_by_hash = {} # sha256 -> path of a completed upload
+        os.makedirs(upload_folder, exist_ok=True)
+        self._load_completed()
+
+    def _upload_dir(self, upload_id):
+        if not upload_id or not all(c in "0123456789abcdef" for c in upload_id):
+            raise UploadError("Unknown upload.", 404)
+        return os.path.join(self.upload_folder, upload_id)
+
+    def _read_metadata(self, upload_id):
+        try:
+            with open(os.path.join(self._upload_dir(upload_id), METADATA_FILENAME)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise UploadError("Unknown upload.", 404)
+
+    def _write_metadata(self, upload_id, metadata):
+        metadata_path = os.path.join(self._upload_dir(upload_id), METADATA_FILENAME)
+        with open(metadata_path + ".tmp", 'w') as f:
+            json.dump(metadata, f)
+        os.replace(metadata_path + ".tmp", metadata_path)
+
+    def _load_completed(self):
+        with os.scandir(self.upload_folder) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    continue
+                try:
+                    metadata = self._read_metadata(entry.name)
+                except UploadError:
+                    continue
+                if metadata.get("sha256") and os.path.exists(metadata["path"]):
+                    self._completed_by_hash.setdefault(metadata["sha256"], metadata["path"])
+
+    def _lock_for(self, upload_id):
+        with self._lock:
+            return self._upload_locks.setdefault(upload_id, threading.Lock())
+
+    def create(self, filename, total_size):
+        upload_id = uuid.uuid4().hex
+        upload_dir = self._upload_dir(upload_id)
+        os.makedirs(upload_dir)
+        path = os.path.join(upload_dir, filename)
+        open(path, 'wb').close()
+        self._write_metadata(upload_id, {
+            "upload_id": upload_id, "filename": filename, "path": path, "total_size": total_size,
+            "sha256": None, "deduplicated_from": None, "created_at": time.time(),
+        })
+        return upload_id
+
+    def status(self, upload_id):
+        metadata = self._read_metadata(upload_id)
+        return {
+            "upload_id": upload_id,
+            "filename": metadata["filename"],
+            "offset": os.path.getsize(metadata["path"]),
+            "total_size": metadata["total_size"],
+            "complete": metadata["sha256"] is not None,
+            "sha256": metadata["sha256"],
+            "deduplicated": metadata["deduplicated_from"] is not None,
+        }
+
+    def _hash_state(self, upload_id, path, offset):
+        state = self._hash_states.get(upload_id)
+        if state and state[0] == offset:
+            return state[1]
+        # Server restarted mid-upload: rebuild the running hash from the bytes already on disk
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(STREAM_READ_SIZE), b''):
+                digest.update(chunk)
+        return digest
+
+    def append_chunk(self, upload_id, offset, stream):
+        """Append the bytes of stream at offset. Returns the new offset."""
+        with self._lock_for(upload_id):
+            metadata = self._read_metadata(upload_id)
+            if metadata["sha256"] is not None:
+                raise UploadError("Upload is already complete.", 409)
+            path = metadata["path"]
+            current_offset = os.path.getsize(path)
+            if offset != current_offset:
+                raise UploadError(f"Expected offset {current_offset}, got {offset}.", 409, current_offset)
+            digest = self._hash_state(upload_id, path, current_offset)
+            written = 0
+            try:
+                with open(path, 'ab') as f:
+                    while True:
+                        data = stream.read(STREAM_READ_SIZE)
+                        if not data:
+                            break
+                        if current_offset + written + len(data) > metadata["total_size"]:
+                            raise UploadError("Chunk goes past the declared file size.", 413)
+                        f.write(data)
+                        digest.update(data)
+                        written += len(data)
+            except Exception:
+                # Drop the partial chunk so the file and the running hash stay in step
+                with open(path, 'ab') as f:
+                    f.truncate(current_offset)
+                self._hash_states.pop(upload_id, None)
+                raise
+            self._hash_states[upload_id] = (current_offset + written, digest)
+            return current_offset + written
+
+    def complete(self, upload_id):
+        """Finish an upload, deduplicating it against earlier uploads and server videos."""
+        with self._lock_for(upload_id):
+            metadata = self._read_metadata(upload_id)
+            if metadata["sha256"] is not None:
+                return self.status(upload_id)
+            path = metadata["path"]
+            size = os.path.getsize(path)
+            if size != metadata["total_size"]:
+                raise UploadError(f"Upload incomplete: {size} of {metadata['total_size']} bytes received.", 409, size)
+            sha256 = self._hash_state(upload_id, path, size).hexdigest()
+            self._hash_states.pop(upload_id, None)
+
+            existing_path = self.media_index.find_by_content_hash(sha256) if self.media_index is not None else None
+            with self._lock:
+                if existing_path is None:
+                    existing_path = self._completed_by_hash.get(sha256)
+                    if existing_path and not os.path.exists(existing_path):
+                        existing_path = None
+                if existing_path is None:
+                    self._completed_by_hash[sha256] = path
+            if existing_path:
+                link_or_copy(existing_path, path) # Hardlink: identical bytes are stored once
+                metadata["deduplicated_from"] = existing_path
+                logger.info(f"Upload {upload_id} matches '{existing_path}', stored as a link.")
+            metadata["sha256"] = sha256
+            self._write_metadata(upload_id, metadata)
+            remember_file_hash(path, sha256) # Render cache keys need no second pass over the file
+            return self.status(upload_id)
+
+    def completed_path(self, upload_id):
+        """Path of a completed upload, for use as a montage input."""
+        metadata = self._read_metadata(upload_id)
+        if metadata["sha256"] is None:
+            raise UploadError("Upload is not complete.", 409)
+        return metadata["path"]
+
+    def _last_activity(self, metadata):
+        """When the upload was created or last received a chunk."""
+        try:
+            return max(metadata.get("created_at", 0), os.path.getmtime(metadata["path"]))
+        except OSError:
+            return metadata.get("created_at", 0)
+
+    def is_receiving(self, upload_id, idle_sec):
+        """True while an incomplete upload is mid-chunk or had a chunk within the last idle_sec."""
+        with self._lock:
+            upload_lock = self._upload_locks.get(upload_id)
+        if upload_lock is not None and upload_lock.locked():
+            return True
+        try:
+            metadata = self._read_metadata(upload_id)
+        except UploadError:
+            return False
+        return metadata["sha256"] is None and time.time() - self._last_activity(metadata) < idle_sec
+
+    def expire(self, max_age_sec, is_in_use=None):
+        """Delete uploads idle for max_age_sec, except those is_in_use(upload_id) reports. Returns the number removed."""
+        removed = 0
+        now = time.time()
+        with os.scandir(self.upload_folder) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    continue
+                try:
+                    metadata = self._read_metadata(entry.name)
+                except UploadError:
+                    continue
+                if now - self._last_activity(metadata) < max_age_sec or self.is_receiving(entry.name, max_age_sec):
+                    continue
+                if is_in_use is not None and is_in_use(entry.name): # Input of a queued or running task
+                    continue
+                with self._lock:
+                    if self._completed_by_hash.get(metadata.get("sha256")) == metadata["path"]:
+                        del self._completed_by_hash[metadata["sha256"]]
+                    self._hash_states.pop(entry.name, None)
+                    self._upload_locks.pop(entry.name, None)
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        return removed
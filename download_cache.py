@@ -0,0 +1,189 @@
+# download_cache.py
+import os
+import shutil
+import hashlib
+import subprocess
+import threading
+import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import montage_maker
+import metrics
+from janitor import entry_size
+
+logger = logging.getLogger(__name__)
+
+DOWNLOADS = metrics.counter("montage_url_downloads_total", "URL video requests by result (cached, downloaded, joined, failed).", ["result"])
+
+class DownloadCache:
+    """Videos downloaded with yt-dlp, keyed by URL, with LRU size-based eviction.
+
+    Concurrent requests for the same URL share one in-flight download (single-flight).
+    Every successful get() pins the entry until the matching release(), so a video is
+    never evicted while a task is still rendering from it.
+    """
+    def __init__(self, cache_folder, max_total_bytes, video_extensions, yt_dlp_path=None):
+        self.cache_folder = cache_folder
+        self.max_total_bytes = max_total_bytes
+        self.video_extensions = video_extensions
+        self.yt_dlp_path = yt_dlp_path or "yt-dlp"
+        self._lock = threading.Lock()
+        self._in_flight = {} # key -> Future of the video path, while its download runs
+        self._pins = {} # key -> number of tasks using the entry
+        os.makedirs(cache_folder, exist_ok=True)
+
+    @staticmethod
+    def key_for(url):
+        return hashlib.sha256(url.strip().encode()).hexdigest()[:32]
+
+    def _video_in(self, entry_dir):
+        try:
+            names = sorted(name for name in os.listdir(entry_dir) if name.rsplit('.', 1)[-1].lower() in self.video_extensions)
+        except OSError:
+            return None
+        return os.path.join(entry_dir, names[0]) if names else None
+
+    def get(self, url, progress_callback=None, task_id=None):
+        """Local path of the video at url, downloaded on first use. Pair with release(url).
+
+        A task waiting for another task's download stops waiting when its own job is
+        cancelled, and takes the download over when the other task's job is cancelled.
+        """
+        key = self.key_for(url)
+        entry_dir = os.path.join(self.cache_folder, key)
+        with self._lock:
+            self._pins[key] = self._pins.get(key, 0) + 1
+        try:
+            while True:
+                with self._lock:
+                    in_flight = self._in_flight.get(key)
+                    is_owner = False
+                    if in_flight is None:
+                        video_path = self._video_in(entry_dir)
+                        if video_path:
+                            os.utime(entry_dir) # mtime doubles as the LRU timestamp
+                            DOWNLOADS.inc(result="cached")
+                            if progress_callback and task_id:
+                                progress_callback(task_id, {"status": "processing", "message": f"Using cached download '{os.path.basename(video_path)}'."})
+                            return video_path
+                        in_flight = self._in_flight[key] = Future()
+                        is_owner = True
+                if is_owner:
+                    return self._download_in_flight(url, key, entry_dir, in_flight, progress_callback, task_id)
+                DOWNLOADS.inc(result="joined")
+                if progress_callback and task_id:
+                    progress_callback(task_id, {"status": "processing", "message": "Waiting for another task's download of the same URL..."})
+                try:
+                    return self._wait_for(in_flight, task_id)
+                except montage_maker.JobCancelled:
+                    control = montage_maker.job_control(task_id)
+                    if control is not None and control.cancelled:
+                        raise
+                    # Only the downloading task was cancelled; try again, as the owner if nobody else is
+        except BaseException:
+            self.release(url)
+            raise
+
+    def _download_in_flight(self, url, key, entry_dir, in_flight, progress_callback=None, task_id=None):
+        """Runs the download in_flight stands for, then settles it for the waiting tasks."""
+        try:
+            video_path = self._download(url, entry_dir, progress_callback, task_id)
+        except BaseException as e:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            DOWNLOADS.inc(result="failed")
+            in_flight.set_exception(e)
+            raise
+        with self._lock:
+            self._in_flight.pop(key, None)
+        DOWNLOADS.inc(result="downloaded")
+        in_flight.set_result(video_path)
+        self.evict()
+        return video_path
+
+    @staticmethod
+    def _wait_for(in_flight, task_id=None):
+        control = montage_maker.job_control(task_id)
+        while True:
+            if control is not None:
+                control.check()
+            try:
+                return in_flight.result(timeout=0.5)
+            except FutureTimeoutError:
+                continue
+
+    def release(self, url):
+        key = self.key_for(url)
+        with self._lock:
+            remaining = self._pins.get(key, 0) - 1
+            if remaining > 0:
+                self._pins[key] = remaining
+            else:
+                self._pins.pop(key, None)
+
+    def _download(self, url, entry_dir, progress_callback=None, task_id=None):
+        partial_dir = f"{entry_dir}.partial"
+        shutil.rmtree(partial_dir, ignore_errors=True) # Left over from an interrupted download
+        os.makedirs(partial_dir)
+        cmd = [
+            self.yt_dlp_path, '-f', 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best',
+            '--merge-output-format', 'mp4', '-o', os.path.join(partial_dir, '%(title)s.%(ext)s'), url
+        ]
+        logger.info(f"Executing yt-dlp: {' '.join(cmd)}")
+        if progress_callback and task_id:
+            progress_callback(task_id, {"status": "processing", "message": "Downloading video from URL..."})
+        try:
+            # A new process group, so a cancel or timeout also kills the ffmpeg yt-dlp merges with
+            process = montage_maker.start_child_process(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            with montage_maker.ChildSupervision(process, task_id, montage_maker.stage_timeout("download", task_id)) as supervision:
+                try:
+                    _, stderr = process.communicate()
+                except BaseException:
+                    montage_maker.kill_process_group(process)
+                    process.wait()
+                    raise
+            if process.returncode != 0:
+                supervision.raise_if_stopped("yt-dlp download")
+                error_message = f"yt-dlp error: {stderr[:500]}"
+                if progress_callback and task_id:
+                    progress_callback(task_id, {"status": "error", "message": error_message})
+                raise montage_maker.MontageError(error_message)
+            if not self._video_in(partial_dir):
+                raise montage_maker.MontageError("yt-dlp ran, but no video file was found.")
+            shutil.rmtree(entry_dir, ignore_errors=True) # An entry whose video was removed by hand
+            os.replace(partial_dir, entry_dir)
+        finally:
+            shutil.rmtree(partial_dir, ignore_errors=True)
+        video_path = self._video_in(entry_dir)
+        if progress_callback and task_id:
+            progress_callback(task_id, {"status": "processing", "message": f"Video '{os.path.basename(video_path)}' downloaded."})
+        return video_path
+
+    def evict(self):
+        """Delete least recently used downloads until the cache fits in max_total_bytes. Pinned entries stay.
+
+        The lock is held from the pin check to the last delete, so a get() cannot pin or
+        return an entry that is about to be removed.
+        """
+        with self._lock:
+            protected = set(self._pins) | set(self._in_flight)
+            entries = []
+            total_bytes = 0
+            with os.scandir(self.cache_folder) as it:
+                for entry in it:
+                    key = entry.name.split('.', 1)[0]
+                    if not entry.is_dir():
+                        continue
+                    if entry.name.endswith(".partial") and key not in protected: # Interrupted by a crash or restart
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                        continue
+                    size = entry_size(entry.path)
+                    total_bytes += size
+                    if key not in protected:
+                        entries.append((entry.stat().st_mtime, size, entry.path))
+            for _, size, path in sorted(entries):
+                if total_bytes <= self.max_total_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total_bytes -= size
+                logger.info(f"Evicted cached download {os.path.basename(path)}")
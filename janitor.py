@@ -0,0 +1,125 @@
+# janitor.py
+import os
+import time
+import shutil
+import tempfile
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+def entry_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+def enforce_folder_quota(entries, max_age_sec, max_total_bytes, is_protected):
+    """Delete entries (paths) older than max_age_sec, then the oldest ones until they fit in max_total_bytes.
+
+    Entries for which is_protected(path) is true are never deleted. Returns the deleted paths.
+    """
+    now = time.time()
+    candidates = []
+    for path in entries:
+        try:
+            candidates.append((os.path.getmtime(path), entry_size(path), path))
+        except OSError:
+            continue
+    total_bytes = sum(size for _, size, _ in candidates)
+    deleted = []
+    for mtime, size, path in sorted(candidates):
+        too_old = max_age_sec is not None and now - mtime > max_age_sec
+        over_quota = max_total_bytes is not None and total_bytes > max_total_bytes
+        if not (too_old or over_quota) or is_protected(path):
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+        total_bytes -= size
+        deleted.append(path)
+    return deleted
+
+def child_paths(folder, exclude=()):
+    try:
+        return [os.path.join(folder, name) for name in os.listdir(folder) if name not in exclude]
+    except OSError:
+        return []
+
+class Janitor:
+    """Periodically expires old tasks and enforces age/size quotas on outputs, uploads and temp dirs."""
+    def __init__(self, task_store, config, is_task_active, upload_store=None, on_tasks_expired=None, is_upload_in_use=None):
+        self.task_store = task_store
+        self.config = config
+        self.is_task_active = is_task_active
+        self.upload_store = upload_store
+        self.on_tasks_expired = on_tasks_expired
+        self.is_upload_in_use = is_upload_in_use
+        self._thread = None
+
+    def _is_active_task_path(self, path):
+        return self.is_task_active(os.path.basename(path))
+
+    def _is_active_upload_path(self, path):
+        """Chunked upload folders are named by upload id, not task id."""
+        upload_id = os.path.basename(path)
+        if self.is_upload_in_use is not None and self.is_upload_in_use(upload_id):
+            return True
+        return self.upload_store is not None and self.upload_store.is_receiving(upload_id, self.config['UPLOAD_MAX_AGE'])
+
+    def run_once(self):
+        config = self.config
+        expired_task_ids = self.task_store.expire(config['TASK_TTL'])
+        if expired_task_ids and self.on_tasks_expired:
+            self.on_tasks_expired(expired_task_ids)
+
+        output_folder = config['OUTPUT_FOLDER']
+        render_cache_name = os.path.basename(os.path.normpath(config['RENDER_CACHE_FOLDER']))
+        deleted = enforce_folder_quota(
+            child_paths(output_folder, exclude=(render_cache_name,)), # The render cache evicts on its own
+            config['OUTPUT_MAX_AGE'], config['OUTPUT_MAX_BYTES'], self._is_active_task_path
+        )
+
+        upload_folder = config['UPLOAD_FOLDER']
+        chunked_folder = config['CHUNKED_UPLOADS_FOLDER']
+        if self.upload_store is not None:
+            self.upload_store.expire(config['UPLOAD_MAX_AGE'], self.is_upload_in_use)
+        chunked_entries = child_paths(chunked_folder)
+        upload_entries = child_paths(upload_folder, exclude=(os.path.basename(chunked_folder),)) + chunked_entries
+        deleted += enforce_folder_quota(
+            upload_entries, config['UPLOAD_MAX_AGE'], config['UPLOAD_MAX_BYTES'],
+            lambda path: self._is_active_upload_path(path) if path in chunked_entries else self._is_active_task_path(path)
+        )
+
+        # Temp dirs of renders killed without running their cleanup (crash, OOM kill, restart)
+        temp_folders = [tempfile.gettempdir()]
+        if config.get('WORK_FOLDER'): # Distributed renders
+            temp_folders.append(config['WORK_FOLDER'])
+        orphaned_temp_dirs = [p for folder in temp_folders for p in child_paths(folder) if os.path.basename(p).startswith("rhythmic_montage_")]
+        deleted += enforce_folder_quota(orphaned_temp_dirs, config['TEMP_DIR_MAX_AGE'], None, lambda path: False)
+
+        if expired_task_ids or deleted:
+            logger.info(f"Janitor: expired {len(expired_task_ids)} task(s), deleted {len(deleted)} file(s)/folder(s).")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        def janitor_loop():
+            while True:
+                try:
+                    self.run_once()
+                except Exception:
+                    logger.exception("Janitor run failed")
+                time.sleep(self.config['JANITOR_INTERVAL'])
+        self._thread = threading.Thread(target=janitor_loop, name="janitor", daemon=True)
+        self._thread.start()
@@ -0,0 +1,280 @@
+# job_queue.py
+import abc
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+try:
+    import redis
+except ImportError: # Optional: only needed for redis:// work queues
+    redis = None
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+DEFAULT_MAX_ATTEMPTS = 3 # Claims of a job whose worker died (lease expired) before it is failed
+
+class WorkQueue(abc.ABC):
+    """Interface of the queue shared by the montage coordinators and render workers.
+
+    Jobs belong to a group (one montage). A claimed job is leased to its worker, which
+    keeps the lease alive with heartbeat(); a job whose lease runs out goes back to the
+    queue, and fails after max_attempts claims. Payloads and results are JSON values.
+    Results of a job the worker no longer owns (purged or reassigned) are dropped.
+    """
+    @abc.abstractmethod
+    def enqueue(self, group_id, kind, payload):
+        """Add a job; returns its job_id."""
+
+    @abc.abstractmethod
+    def claim(self, worker_id, lease_seconds, wait_seconds=0):
+        """Oldest runnable job as a dict (job_id, group_id, kind, payload, attempts), or None.
+
+        Waits up to wait_seconds for one to arrive.
+        """
+
+    @abc.abstractmethod
+    def heartbeat(self, job_id, worker_id, lease_seconds):
+        """Extend the lease. False if the worker should stop: the job was purged or reassigned."""
+
+    @abc.abstractmethod
+    def complete(self, job_id, worker_id, result=None):
+        """Mark the job done with result, unless the worker no longer owns it."""
+
+    @abc.abstractmethod
+    def fail(self, job_id, worker_id, error):
+        """Mark the job failed with str(error), unless the worker no longer owns it."""
+
+    @abc.abstractmethod
+    def group_jobs(self, group_id):
+        """{job_id: {"state", "result", "error"}} of every job in the group."""
+
+    @abc.abstractmethod
+    def purge_group(self, group_id):
+        """Forget the group and its jobs. Queued ones never run; running ones stop at their next heartbeat."""
+
+class SQLiteWorkQueue(WorkQueue):
+    """Work queue in a SQLite file, for coordinators and workers on one host (or a shared filesystem with working locks)."""
+    def __init__(self, db_path, max_attempts=DEFAULT_MAX_ATTEMPTS, poll_interval=0.5):
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT UNIQUE NOT NULL,"
+            " group_id TEXT NOT NULL, kind TEXT NOT NULL, payload TEXT NOT NULL, state TEXT NOT NULL,"
+            " worker_id TEXT, lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0, result TEXT, error TEXT,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, seq)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_group ON jobs (group_id)")
+
+    def enqueue(self, group_id, kind, payload):
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, group_id, kind, payload, state, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, group_id, kind, json.dumps(payload), QUEUED, time.time())
+            )
+        return job_id
+
+    def _claim_once(self, worker_id, lease_seconds):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE") # Serializes claims across processes
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET state = ?, error = ? WHERE state = ? AND lease_until < ? AND attempts >= ?",
+                    (FAILED, f"Worker lost {self.max_attempts} times", RUNNING, now, self.max_attempts)
+                )
+                row = self._conn.execute(
+                    "SELECT job_id, group_id, kind, payload, attempts FROM jobs"
+                    " WHERE state = ? OR (state = ? AND lease_until < ?) ORDER BY seq LIMIT 1",
+                    (QUEUED, RUNNING, now)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET state = ?, worker_id = ?, lease_until = ?, attempts = attempts + 1 WHERE job_id = ?",
+                        (RUNNING, worker_id, now + lease_seconds, row[0])
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job_id, group_id, kind, payload, attempts = row
+        return {"job_id": job_id, "group_id": group_id, "kind": kind, "payload": json.loads(payload), "attempts": attempts + 1}
+
+    def claim(self, worker_id, lease_seconds, wait_seconds=0):
+        deadline = time.monotonic() + wait_seconds
+        while True:
+            job = self._claim_once(worker_id, lease_seconds)
+            if job is not None or time.monotonic() >= deadline:
+                return job
+            time.sleep(self.poll_interval)
+
+    def heartbeat(self, job_id, worker_id, lease_seconds):
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE job_id = ? AND state = ? AND worker_id = ?",
+                (time.time() + lease_seconds, job_id, RUNNING, worker_id)
+            )
+            return cursor.rowcount > 0
+
+    def _finish(self, job_id, worker_id, state, result=None, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, result = ?, error = ? WHERE job_id = ? AND state = ? AND worker_id = ?",
+                (state, json.dumps(result), error, job_id, RUNNING, worker_id)
+            )
+
+    def complete(self, job_id, worker_id, result=None):
+        self._finish(job_id, worker_id, DONE, result=result)
+
+    def fail(self, job_id, worker_id, error):
+        self._finish(job_id, worker_id, FAILED, error=str(error))
+
+    def group_jobs(self, group_id):
+        with self._lock:
+            rows = self._conn.execute("SELECT job_id, state, result, error FROM jobs WHERE group_id = ?", (group_id,)).fetchall()
+        return {job_id: {"state": state, "result": json.loads(result) if result else None, "error": error} for job_id, state, result, error in rows}
+
+    def purge_group(self, group_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE group_id = ?", (group_id,))
+
+class RedisWorkQueue(WorkQueue):
+    """Work queue in Redis, for workers on several hosts.
+
+    client is a redis-py compatible client; only basic list, hash, set and sorted set
+    commands and WATCH/MULTI transactions are used, so any Redis-protocol server or
+    in-process stand-in works. Every write to an existing job hash runs in a transaction
+    that watches it, so a purge_group in between makes the write retry and find the job
+    gone instead of recreating a hash with no group or TTL.
+    """
+    def __init__(self, client, prefix="montage:", max_attempts=DEFAULT_MAX_ATTEMPTS, group_ttl=24 * 3600):
+        self.client = client
+        self.prefix = prefix
+        self.max_attempts = max_attempts
+        self.group_ttl = group_ttl # Groups a crashed coordinator never purged expire after this
+
+    def _key(self, *parts):
+        return self.prefix + ":".join(parts)
+
+    def enqueue(self, group_id, kind, payload):
+        job_id = uuid.uuid4().hex
+        pipe = self.client.pipeline()
+        pipe.hset(self._key("job", job_id), mapping={"group_id": group_id, "kind": kind, "payload": json.dumps(payload), "state": QUEUED, "attempts": 0})
+        pipe.expire(self._key("job", job_id), self.group_ttl)
+        pipe.sadd(self._key("group", group_id), job_id)
+        pipe.expire(self._key("group", group_id), self.group_ttl)
+        pipe.lpush(self._key("queue"), job_id)
+        pipe.execute()
+        return job_id
+
+    def _requeue_expired(self):
+        """Put jobs whose worker stopped heartbeating back at the head of the queue."""
+        for job_id in self.client.zrangebyscore(self._key("leases"), "-inf", time.time()):
+            job_id = _text(job_id)
+            if not self.client.zrem(self._key("leases"), job_id): # Another worker got to it first
+                continue
+            job_key = self._key("job", job_id)
+            def requeue(pipe):
+                state, attempts = (_text(value) for value in pipe.hmget(job_key, ["state", "attempts"]))
+                if state != RUNNING: # Purged, or finished just before its lease ran out
+                    return
+                pipe.multi()
+                if int(attempts or 0) >= self.max_attempts:
+                    pipe.hset(job_key, mapping={"state": FAILED, "error": f"Worker lost {self.max_attempts} times"})
+                else:
+                    pipe.hset(job_key, "state", QUEUED)
+                    pipe.rpush(self._key("queue"), job_id) # The consumer end, so it runs next
+            self.client.transaction(requeue, job_key)
+
+    def claim(self, worker_id, lease_seconds, wait_seconds=0):
+        self._requeue_expired()
+        deadline = time.monotonic() + wait_seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                popped = self.client.brpop([self._key("queue")], timeout=max(1, int(remaining)))
+                job_id = popped[1] if popped else None
+            else:
+                job_id = self.client.rpop(self._key("queue"))
+            if job_id is None:
+                return None
+            job_id = _text(job_id)
+            job_key = self._key("job", job_id)
+            def mark_running(pipe):
+                job = {_text(k): _text(v) for k, v in pipe.hgetall(job_key).items()}
+                if job.get("state") != QUEUED: # Purged while waiting
+                    return None
+                pipe.multi()
+                pipe.hset(job_key, mapping={"state": RUNNING, "worker_id": worker_id})
+                pipe.hincrby(job_key, "attempts", 1)
+                pipe.zadd(self._key("leases"), {job_id: time.time() + lease_seconds})
+                return job
+            job = self.client.transaction(mark_running, job_key, value_from_callable=True)
+            if job is None:
+                continue
+            return {"job_id": job_id, "group_id": job["group_id"], "kind": job["kind"], "payload": json.loads(job["payload"]), "attempts": int(job["attempts"]) + 1}
+
+    def _owns(self, client, job_id, worker_id):
+        state, owner = (_text(value) for value in client.hmget(self._key("job", job_id), ["state", "worker_id"]))
+        return state == RUNNING and owner == worker_id
+
+    def heartbeat(self, job_id, worker_id, lease_seconds):
+        if not self._owns(self.client, job_id, worker_id):
+            return False
+        self.client.zadd(self._key("leases"), {job_id: time.time() + lease_seconds}, xx=True)
+        return True
+
+    def _finish(self, job_id, worker_id, fields):
+        job_key = self._key("job", job_id)
+        def finish(pipe):
+            if not self._owns(pipe, job_id, worker_id):
+                return
+            pipe.multi()
+            pipe.zrem(self._key("leases"), job_id)
+            pipe.hset(job_key, mapping=fields)
+        self.client.transaction(finish, job_key)
+
+    def complete(self, job_id, worker_id, result=None):
+        self._finish(job_id, worker_id, {"state": DONE, "result": json.dumps(result)})
+
+    def fail(self, job_id, worker_id, error):
+        self._finish(job_id, worker_id, {"state": FAILED, "error": str(error)})
+
+    def group_jobs(self, group_id):
+        jobs = {}
+        for job_id in self.client.smembers(self._key("group", group_id)):
+            job_id = _text(job_id)
+            job = {_text(k): _text(v) for k, v in self.client.hgetall(self._key("job", job_id)).items()}
+            if job:
+                jobs[job_id] = {"state": job["state"], "result": json.loads(job["result"]) if job.get("result") else None, "error": job.get("error")}
+        return jobs
+
+    def purge_group(self, group_id):
+        job_ids = [_text(job_id) for job_id in self.client.smembers(self._key("group", group_id))]
+        pipe = self.client.pipeline()
+        for job_id in job_ids:
+            pipe.delete(self._key("job", job_id))
+            pipe.zrem(self._key("leases"), job_id)
+        pipe.delete(self._key("group", group_id))
+        pipe.execute()
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+def open_work_queue(url):
+    """WorkQueue for a URL: sqlite:///path/to/queue.sqlite3 or redis://host:port/db."""
+    if url.startswith("sqlite:///"):
+        return SQLiteWorkQueue(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        if redis is None:
+            raise RuntimeError("Redis work queues require the 'redis' package.")
+        return RedisWorkQueue(redis.Redis.from_url(url))
+    raise ValueError(f"Unsupported work queue URL '{url}'. Use sqlite:///path or redis://host:port/db.")
@@ -0,0 +1,91 @@
+# job_scheduler.py
+import heapq
+import itertools
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the scheduler queue is at its maximum depth."""
+    pass
+
+class JobScheduler:
+    """Fixed-size worker pool fed from a bounded priority queue.
+
+    Jobs with a higher priority run first; jobs with equal priority run in FIFO order.
+    """
+    def __init__(self, num_workers, max_queue_depth):
+        self.num_workers = num_workers
+        self.max_queue_depth = max_queue_depth
+        self._queue = [] # Heap of (-priority, sequence, job_id, func, args)
+        self._sequence = itertools.count()
+        self._active_jobs = set()
+        self._condition = threading.Condition()
+        self._workers = []
+
+    def start(self):
+        with self._condition:
+            if self._workers:
+                return
+            for i in range(self.num_workers):
+                worker = threading.Thread(target=self._worker_loop, name=f"montage_worker_{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def is_full(self):
+        with self._condition:
+            return len(self._queue) >= self.max_queue_depth
+
+    def submit(self, job_id, func, args=(), priority=0):
+        """Queue func(*args) and return the job's 1-based queue position."""
+        with self._condition:
+            if len(self._queue) >= self.max_queue_depth:
+                raise QueueFullError(f"Job queue is full ({self.max_queue_depth} jobs waiting).")
+            heapq.heappush(self._queue, (-priority, next(self._sequence), job_id, func, args))
+            self._condition.notify()
+            return self._position_locked(job_id)
+
+    def cancel(self, job_id):
+        """Drop a waiting job from the queue. False if it is running, finished or unknown."""
+        with self._condition:
+            remaining = [entry for entry in self._queue if entry[2] != job_id]
+            if len(remaining) == len(self._queue):
+                return False
+            heapq.heapify(remaining)
+            self._queue = remaining
+            return True
+
+    def queue_position(self, job_id):
+        """1-based position of a waiting job, or None if it is running or unknown."""
+        with self._condition:
+            return self._position_locked(job_id)
+
+    def queue_depth(self):
+        with self._condition:
+            return len(self._queue)
+
+    def active_count(self):
+        with self._condition:
+            return len(self._active_jobs)
+
+    def _position_locked(self, job_id):
+        for position, entry in enumerate(sorted(self._queue), start=1):
+            if entry[2] == job_id:
+                return position
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                _, _, job_id, func, args = heapq.heappop(self._queue)
+                self._active_jobs.add(job_id)
+            try:
+                func(*args)
+            except Exception:
+                logger.exception(f"Unhandled error in scheduled job {job_id}")
+            finally:
+                with self._condition:
+                    self._active_jobs.discard(job_id)
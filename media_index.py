@@ -0,0 +1,243 @@
+# media_index.py
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+
+import montage_maker
+from render_cache import file_content_hash
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    duration REAL,
+    width INTEGER,
+    height INTEGER,
+    video_codec TEXT,
+    pix_fmt TEXT,
+    frame_rate TEXT,
+    audio_codec TEXT,
+    audio_sample_rate INTEGER,
+    has_audio INTEGER,
+    streams_json TEXT,
+    keyframes_indexed INTEGER NOT NULL DEFAULT 0,
+    indexed_at REAL,
+    content_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS keyframes (
+    path TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS keyframes_path_ts ON keyframes (path, ts);
+"""
+
+INFO_COLUMNS = ("duration", "width", "height", "video_codec", "pix_fmt", "frame_rate", "audio_codec", "audio_sample_rate", "has_audio")
+
+class MediaIndex:
+    """SQLite-backed cache of ffprobe results and keyframe tables for the server video library.
+
+    Entries are keyed by absolute path and only trusted while the file's size and mtime
+    are unchanged. Files outside videos_folder are probed but not persisted, since uploads
+    and downloads are transient.
+    """
+    def __init__(self, db_path, videos_folder, allowed_extensions):
+        self.db_path = db_path
+        self.videos_folder = os.path.abspath(videos_folder)
+        self.allowed_extensions = allowed_extensions
+        self._lock = threading.Lock()
+        self._indexer_thread = None
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(media)")}
+            if "content_hash" not in columns: # Index created before content hashes were stored
+                self._conn.execute("ALTER TABLE media ADD COLUMN content_hash TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS media_content_hash ON media (content_hash)")
+            self._conn.commit()
+
+    def _is_indexed_location(self, abs_path):
+        # Anything under videos_folder (including generated proxies) is persistent
+        return os.path.commonpath([abs_path, self.videos_folder]) == self.videos_folder
+
+    def _is_library_file(self, abs_path):
+        return os.path.dirname(abs_path) == self.videos_folder
+
+    def _is_video_name(self, filename):
+        return '.' in filename and filename.rsplit('.', 1)[1].lower() in self.allowed_extensions
+
+    def _fresh_row(self, abs_path, stat_result):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM media WHERE path = ?", (abs_path,)).fetchone()
+        if row and row["size"] == stat_result.st_size and row["mtime"] == stat_result.st_mtime:
+            return row
+        return None
+
+    @staticmethod
+    def _row_to_info(row):
+        info = {column: row[column] for column in INFO_COLUMNS}
+        info["has_audio"] = bool(info["has_audio"])
+        info["streams"] = json.loads(row["streams_json"] or "[]")
+        return info
+
+    def get_info(self, video_path, task_id=None):
+        """Probe info for video_path, served from the index when the file is unchanged."""
+        abs_path = os.path.abspath(video_path)
+        try:
+            stat_result = os.stat(abs_path)
+        except OSError as e:
+            raise montage_maker.MontageError(f"Input video file not found: '{video_path}' ({e})")
+        if not self._is_indexed_location(abs_path):
+            return montage_maker.probe_video_info(abs_path, task_id)
+        row = self._fresh_row(abs_path, stat_result)
+        if row:
+            return self._row_to_info(row)
+        info = montage_maker.probe_video_info(abs_path, task_id)
+        self._store_info(abs_path, stat_result, info)
+        return info
+
+    def get_keyframes(self, video_path, task_id=None):
+        """Keyframe timestamps for video_path, indexing them on first use."""
+        abs_path = os.path.abspath(video_path)
+        if not self._is_indexed_location(abs_path):
+            return montage_maker.probe_keyframe_times(abs_path, task_id)
+        self.get_info(abs_path, task_id) # Makes sure the media row is current before trusting its keyframes
+        with self._lock:
+            row = self._conn.execute("SELECT keyframes_indexed FROM media WHERE path = ?", (abs_path,)).fetchone()
+            if row and row["keyframes_indexed"]:
+                return [r["ts"] for r in self._conn.execute("SELECT ts FROM keyframes WHERE path = ? ORDER BY ts", (abs_path,))]
+        keyframe_times = montage_maker.probe_keyframe_times(abs_path, task_id)
+        with self._lock:
+            self._conn.execute("DELETE FROM keyframes WHERE path = ?", (abs_path,))
+            self._conn.executemany("INSERT INTO keyframes (path, ts) VALUES (?, ?)", [(abs_path, ts) for ts in keyframe_times])
+            self._conn.execute("UPDATE media SET keyframes_indexed = 1 WHERE path = ?", (abs_path,))
+            self._conn.commit()
+        return keyframe_times
+
+    def get_content_hash(self, video_path):
+        """SHA-256 of the file content, stored in the index for files under videos_folder."""
+        abs_path = os.path.abspath(video_path)
+        if not self._is_indexed_location(abs_path):
+            return file_content_hash(abs_path)
+        self.get_info(abs_path) # Makes sure the media row is current before trusting its hash
+        with self._lock:
+            row = self._conn.execute("SELECT content_hash FROM media WHERE path = ?", (abs_path,)).fetchone()
+        if row and row["content_hash"]:
+            return row["content_hash"]
+        digest = file_content_hash(abs_path)
+        with self._lock:
+            self._conn.execute("UPDATE media SET content_hash = ? WHERE path = ?", (digest, abs_path))
+            self._conn.commit()
+        return digest
+
+    def find_by_content_hash(self, digest):
+        """Path of an indexed library video with this content hash, or None."""
+        with self._lock:
+            rows = self._conn.execute("SELECT path, size, mtime FROM media WHERE content_hash = ?", (digest,)).fetchall()
+        for row in rows:
+            try:
+                stat_result = os.stat(row["path"])
+            except OSError:
+                continue
+            if self._is_library_file(row["path"]) and stat_result.st_size == row["size"] and stat_result.st_mtime == row["mtime"]:
+                return row["path"]
+        return None
+
+    def _store_info(self, abs_path, stat_result, info):
+        with self._lock:
+            self._conn.execute("DELETE FROM keyframes WHERE path = ?", (abs_path,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO media (path, size, mtime, duration, width, height, video_codec, pix_fmt, frame_rate,"
+                " audio_codec, audio_sample_rate, has_audio, streams_json, keyframes_indexed, indexed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?)",
+                (abs_path, stat_result.st_size, stat_result.st_mtime, info["duration"], info["width"], info["height"],
+                 info["video_codec"], info["pix_fmt"], info["frame_rate"], info["audio_codec"], info["audio_sample_rate"],
+                 int(info["has_audio"]), json.dumps(info["streams"]), time.time())
+            )
+            self._conn.commit()
+
+    def list_videos(self):
+        """Sorted file names of the videos in videos_folder.
+
+        Read from the folder itself, so new files, files still waiting for the indexer and
+        files ffprobe cannot read are all listed.
+        """
+        try:
+            with os.scandir(self.videos_folder) as entries:
+                return sorted(entry.name for entry in entries if entry.is_file() and self._is_video_name(entry.name))
+        except OSError:
+            return []
+
+    def refresh(self, with_keyframes=True, with_hashes=True):
+        """Incrementally sync the index with videos_folder: probe new/changed files, drop deleted ones.
+
+        The folder is scanned (names, sizes, mtimes) before anything is probed, and metadata
+        for every file is stored before any keyframe table or content hash is computed.
+        """
+        library = [] # (abs path, stat result) of every video in the folder
+        with os.scandir(self.videos_folder) as entries:
+            for entry in entries:
+                if not entry.is_file() or not self._is_video_name(entry.name):
+                    continue
+                try:
+                    library.append((os.path.abspath(entry.path), entry.stat()))
+                except OSError as e:
+                    logger.warning(f"Media index: could not stat '{entry.name}': {e}")
+
+        seen_paths = []
+        changed = 0
+        for abs_path, stat_result in library:
+            try:
+                if self._fresh_row(abs_path, stat_result) is None:
+                    self._store_info(abs_path, stat_result, montage_maker.probe_video_info(abs_path))
+                    changed += 1
+                seen_paths.append(abs_path)
+            except (OSError, montage_maker.MontageError) as e:
+                logger.warning(f"Media index: could not index '{os.path.basename(abs_path)}': {e}")
+
+        with self._lock:
+            indexed_paths = [row["path"] for row in self._conn.execute("SELECT path FROM media")]
+            seen = {abs_path for abs_path, _ in library}
+            removed = [p for p in indexed_paths if (p not in seen if self._is_library_file(p) else not os.path.exists(p))]
+            for path in removed:
+                self._conn.execute("DELETE FROM media WHERE path = ?", (path,))
+                self._conn.execute("DELETE FROM keyframes WHERE path = ?", (path,))
+            self._conn.commit()
+        if changed or removed:
+            logger.info(f"Media index: {changed} file(s) (re)indexed, {len(removed)} removed.")
+
+        if with_keyframes:
+            for abs_path in seen_paths:
+                try:
+                    self.get_keyframes(abs_path)
+                except (OSError, montage_maker.MontageError) as e:
+                    logger.warning(f"Media index: could not read keyframes of '{os.path.basename(abs_path)}': {e}")
+
+        if with_hashes:
+            for abs_path in seen_paths:
+                try:
+                    self.get_content_hash(abs_path)
+                except (OSError, montage_maker.MontageError) as e:
+                    logger.warning(f"Media index: could not hash '{os.path.basename(abs_path)}': {e}")
+
+    def start_background_indexer(self, interval_sec):
+        if self._indexer_thread is not None:
+            return
+        def indexer_loop():
+            while True:
+                try:
+                    self.refresh()
+                except Exception:
+                    logger.exception("Media index refresh failed")
+                time.sleep(interval_sec)
+        self._indexer_thread = threading.Thread(target=indexer_loop, name="media_indexer", daemon=True)
+        self._indexer_thread.start()
@@ -5,27 +5,82 @@ import os
 import json
 import tempfile
 import shutil # For shutil.which
+import time
+import bisect
+import collections
+import threading
+import queue
+import errno
+import signal
+import math
+import warnings
+import contextlib
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+import job_queue
+
+try:
+    import numpy as np
+except ImportError: # Optional: the *_np helpers fall back to the pure-Python versions
+    np = None
 
 DEFAULT_MIN_BEAT_GROUPED_SCENE_DURATION = 0.6
+NUMPY_LABEL_PARSE_MIN_BYTES = 256 * 1024 # Smaller label files (~8000 labels) parse faster line by line than through np.loadtxt's setup
 MIN_FINAL_SCENE_WARN = 0.1
+RENDER_ENGINES = ("clips", "filtergraph", "pipe") # clips: one ffmpeg per scene + concat; filtergraph: single ffmpeg pass; pipe: clips streamed to the muxer
+FILTERGRAPH_MAX_INPUTS = 64 # The filtergraph engine opens one demuxer+decoder per scene, all at once; longer plans render with the clips engine
+PIPE_CHUNK_BYTES = 256 * 1024 # Read size when relaying scene streams in the pipe engine
+PIPE_BUFFER_CHUNKS = 16 # Chunks held per scene and variant before its extractor blocks
+STDERR_TAIL_LINES = 200 # ffmpeg stderr kept per process for error reports
+CUT_MODES = ("reencode", "copy") # copy: keyframe-snapped starts, stream copy where the source already matches the output
+OUTPUT_MODES = ("mp4", "hls") # hls: scenes also published as a live HLS playlist while rendering
+HLS_PLAYLIST_NAME = "playlist.m3u8"
+MP4_FASTSTART = True # Final MP4s get their moov atom up front, so players start and seek before the whole file is fetched
+STAGE_TIMEOUTS = { # Wall-clock limit in seconds of one child process, by pipeline stage; a job can override them
+    "probe": 120,
+    "keyframes": 600,
+    "beat_detection": 900,
+    "download": 2 * 3600,
+    "extract_scene": 900,
+    "render": 4 * 3600,
+    "assemble": 4 * 3600, # The pipe engine's muxers run for the whole render
+    "proxy_build": 2 * 3600, # Background proxy encodes; a hung one would block every later build
+}
+X264_PRESETS = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow")
+
+STAGE_SECONDS = metrics.histogram("montage_stage_duration_seconds", "Wall time of montage pipeline stages.", ["stage"])
+STAGE_CHILD_CPU = metrics.counter("montage_stage_child_cpu_seconds_total", "User+system CPU time of ffmpeg/ffprobe processes, by pipeline stage.", ["stage"])
+STAGE_FAILURES = metrics.counter("montage_stage_failures_total", "Pipeline stages that raised an error.", ["stage"])
+CHILD_CPU = metrics.counter("montage_child_cpu_seconds_total", "User+system CPU time of all ffmpeg/ffprobe processes.")
+ACTIVE_FFMPEG = metrics.gauge("montage_ffmpeg_processes", "ffmpeg processes currently running.")
+
+_span_state = threading.local() # .stack: open stage spans of the current thread
 
 class MontageError(Exception):
     """Custom exception for montage errors."""
     pass
 
+class JobCancelled(MontageError):
+    """Raised inside a job that was cancelled or ran past its time limit."""
+    pass
+
 def check_command_exists(command_name):
     return shutil.which(command_name) is not None
 
 def get_video_duration(video_path, progress_callback=None, task_id=None):
     cmd = ["ffprobe", "-v", "quiet", "-print_format", "json", "-show_format", video_path]
     try:
-        process = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        process = run_child_process(cmd, task_id)
         metadata = json.loads(process.stdout)
         if 'format' in metadata and 'duration' in metadata['format']:
             return float(metadata['format']['duration'])
         if progress_callback and task_id:
             progress_callback(task_id, {"status": "error", "message": f"Error: Could not retrieve duration from ffprobe output for '{os.path.basename(video_path)}'."})
         raise MontageError(f"Error: Could not retrieve duration from ffprobe output for '{os.path.basename(video_path)}'.")
+    except JobCancelled:
+        raise
     except subprocess.CalledProcessError as e:
         if progress_callback and task_id:
             progress_callback(task_id, {"status": "error", "message": f"ffprobe error for '{os.path.basename(video_path)}': {e.stderr}"})
@@ -36,18 +91,371 @@ def get_video_duration(video_path, progress_callback=None, task_id=None):
         raise MontageError(f"Error getting video duration for '{os.path.basename(video_path)}': {e}")
 
 
-def run_ffmpeg_command(cmd_list, operation_desc, progress_callback=None, task_id=None):
+class ProcessRegistry:
+    """Tracks the running ffmpeg processes of one job so a failing scene can kill its siblings."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._processes = set()
+        self.aborted = False
+
+    def register(self, process):
+        with self._lock:
+            if not self.aborted:
+                self._processes.add(process)
+                return True
+        kill_process_group(process) # Started after the job was aborted
+        return False
+
+    def unregister(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+    def abort(self):
+        with self._lock:
+            self.aborted = True
+            processes = list(self._processes)
+        for process in processes:
+            if process.poll() is None:
+                kill_process_group(process)
+
+def start_child_process(cmd, **popen_kwargs):
+    """subprocess.Popen in a new session, so kill_process_group() also reaches anything the child spawned."""
+    return subprocess.Popen(cmd, start_new_session=True, **popen_kwargs)
+
+def kill_process_group(process):
+    if process.returncode is not None: # Reaped; its pid may belong to someone else by now
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+class JobControl:
+    """Cancellation and time limits of one job, shared by all of its child processes.
+
+    cancel() kills the process group of every registered child and sets every registered
+    event, which wakes wait loops of the job; processes started later are killed, and
+    events registered later set, on registration. With timeout set, the job cancels itself once start_timer()
+    was called that many seconds ago. stage_timeouts overrides STAGE_TIMEOUTS for this job.
+    """
+    def __init__(self, task_id, timeout=None, stage_timeouts=None):
+        self.task_id = task_id
+        self.timeout = timeout
+        self.stage_timeouts = dict(STAGE_TIMEOUTS, **(stage_timeouts or {}))
+        self.reason = None
+        self.timed_out = False
+        self._lock = threading.Lock()
+        self._processes = set()
+        self._events = set()
+        self._timer = None
+
+    @property
+    def cancelled(self):
+        return self.reason is not None
+
+    def start_timer(self):
+        if self.timeout and self._timer is None:
+            self._timer = threading.Timer(self.timeout, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _expire(self):
+        self.cancel(f"The job took longer than {self.timeout:g}s and was stopped.", timed_out=True)
+
+    def check(self):
+        if self.reason is not None:
+            raise JobCancelled(self.reason)
+
+    def register(self, process):
+        with self._lock:
+            if self.reason is None:
+                self._processes.add(process)
+                return True
+        kill_process_group(process)
+        return False
+
+    def unregister(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+    def register_event(self, event):
+        with self._lock:
+            if self.reason is None:
+                self._events.add(event)
+                return
+        event.set()
+
+    def unregister_event(self, event):
+        with self._lock:
+            self._events.discard(event)
+
+    def cancel(self, reason="The job was cancelled.", timed_out=False):
+        """Returns False if the job was already cancelled."""
+        with self._lock:
+            if self.reason is not None:
+                return False
+            self.reason, self.timed_out = reason, timed_out
+            processes = list(self._processes)
+            events = list(self._events)
+        for process in processes:
+            kill_process_group(process)
+        for event in events:
+            event.set()
+        return True
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+
+_job_controls = {} # task_id -> JobControl of the jobs started with start_job()
+_job_controls_lock = threading.Lock()
+
+def start_job(task_id, timeout=None, stage_timeouts=None):
+    """Register the JobControl that cancel_job(task_id) reaches. Pair with finish_job(task_id)."""
+    control = JobControl(task_id, timeout, stage_timeouts)
+    with _job_controls_lock:
+        _job_controls[task_id] = control
+    return control
+
+def finish_job(task_id):
+    with _job_controls_lock:
+        control = _job_controls.pop(task_id, None)
+    if control is not None:
+        control.close()
+
+def job_control(task_id):
+    if task_id is None:
+        return None
+    with _job_controls_lock:
+        return _job_controls.get(task_id)
+
+def cancel_job(task_id, reason="The job was cancelled."):
+    """Cancel a job started with start_job(). False if it is unknown or already cancelled."""
+    control = job_control(task_id)
+    return control.cancel(reason) if control is not None else False
+
+def stage_timeout(stage, task_id=None):
+    control = job_control(task_id)
+    return (control.stage_timeouts if control is not None else STAGE_TIMEOUTS).get(stage)
+
+class ChildSupervision:
+    """Context manager tying a child process to its job's JobControl, with a timeout watchdog.
+
+    After the process exits, raise_if_stopped() turns a kill by cancellation or by the
+    watchdog into the matching error.
+    """
+    def __init__(self, process, task_id=None, timeout=None):
+        self.process = process
+        self.control = job_control(task_id)
+        self.timeout = timeout
+        self.timed_out = False
+        self._watchdog = None
+
+    def _expire(self):
+        self.timed_out = True
+        kill_process_group(self.process)
+
+    def __enter__(self):
+        if self.control is not None:
+            self.control.register(self.process)
+        if self.timeout:
+            self._watchdog = threading.Timer(self.timeout, self._expire)
+            self._watchdog.daemon = True
+            self._watchdog.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+        if self.control is not None:
+            self.control.unregister(self.process)
+        return False
+
+    def raise_if_stopped(self, operation_desc):
+        if self.control is not None:
+            self.control.check()
+        if self.timed_out:
+            raise MontageError(f"{operation_desc} took longer than {self.timeout:g}s and was stopped.")
+
+class RenderProgress:
+    """Turns the -progress reports of a job's ffmpeg processes into an overall percentage.
+
+    stages is an ordered list of (name, weight, expected output seconds); weights sum to 1.
+    Updates reach progress_callback at most every min_interval seconds, and on stage changes.
+    """
+    def __init__(self, stages, progress_callback=None, task_id=None, min_interval=0.5):
+        self.stages = stages
+        self.progress_callback = progress_callback
+        self.task_id = task_id
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._done_seconds = {name: {} for name, _, _ in stages} # stage -> {item key: output seconds done}
+        self._last_emit = 0.0
+        self._last_stage = None
+
+    def percent(self, stage_name):
+        total = 0.0
+        for name, weight, expected_seconds in self.stages:
+            done = sum(self._done_seconds[name].values())
+            total += weight * (min(1.0, done / expected_seconds) if expected_seconds > 0 else 0.0)
+            if name == stage_name:
+                break
+        return min(100.0, 100.0 * total)
+
+    def update(self, stage_name, item_key, out_time_sec, fps=None, force=False):
+        with self._lock:
+            self._done_seconds[stage_name][item_key] = max(out_time_sec, self._done_seconds[stage_name].get(item_key, 0.0))
+            now = time.monotonic()
+            stage_changed = stage_name != self._last_stage
+            if not (force or stage_changed or now - self._last_emit >= self.min_interval):
+                return
+            self._last_emit, self._last_stage = now, stage_name
+            percent = self.percent(stage_name)
+        if self.progress_callback and self.task_id:
+            update = {"status": "processing", "stage": stage_name, "progress": round(percent, 1)}
+            if fps is not None:
+                update["fps"] = fps
+            self.progress_callback(self.task_id, update)
+
+    def reporter(self, stage_name, item_key):
+        """on_progress callable for run_ffmpeg_command."""
+        return lambda out_time_sec, fps: self.update(stage_name, item_key, out_time_sec, fps)
+
+@contextlib.contextmanager
+def stage_span(stage_name):
+    """Times a pipeline stage into the stage metrics.
+
+    CPU time of child processes reaped by this thread inside the span is credited to it.
+    """
+    spans = _span_state.__dict__.setdefault("stack", [])
+    span = {"child_cpu": 0.0}
+    spans.append(span)
+    started_at = time.perf_counter()
+    try:
+        yield span
+    except BaseException:
+        STAGE_FAILURES.inc(stage=stage_name)
+        raise
+    finally:
+        spans.pop()
+        STAGE_SECONDS.observe(time.perf_counter() - started_at, stage=stage_name)
+        STAGE_CHILD_CPU.inc(span["child_cpu"], stage=stage_name)
+
+def wait_child_process(process):
+    """process.wait(), recording the child's CPU time (os.wait4 rusage) in the metrics.
+
+    Per-child rusage keeps concurrent jobs apart, unlike RUSAGE_CHILDREN deltas.
+    """
+    if not hasattr(os, "wait4"):
+        return process.wait()
+    try:
+        _, status, usage = os.wait4(process.pid, 0)
+    except ChildProcessError: # Already reaped, e.g. by a poll() from ProcessRegistry.abort
+        return process.wait()
+    process.returncode = os.waitstatus_to_exitcode(status)
+    cpu_seconds = usage.ru_utime + usage.ru_stime
+    CHILD_CPU.inc(cpu_seconds)
+    spans = getattr(_span_state, "stack", None)
+    if spans:
+        spans[-1]["child_cpu"] += cpu_seconds
+    return process.returncode
+
+def run_child_process(cmd, task_id=None, stage="probe"):
+    """subprocess.run(cmd, capture_output=True, text=True, check=True) with CPU accounting.
+
+    The process is killed when the job of task_id is cancelled, or after the stage's timeout.
+    """
+    process = start_child_process(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    stderr_tail = collections.deque(maxlen=STDERR_TAIL_LINES)
+    stderr_reader = threading.Thread(target=_read_stderr_tail, args=(process.stderr, stderr_tail), daemon=True)
+    stderr_reader.start()
+    with ChildSupervision(process, task_id, stage_timeout(stage, task_id)) as supervision:
+        try:
+            stdout = process.stdout.read()
+            stderr_reader.join()
+        except BaseException:
+            kill_process_group(process)
+            raise
+        finally:
+            wait_child_process(process)
+    stderr = ''.join(stderr_tail)
+    if process.returncode != 0:
+        supervision.raise_if_stopped(f"{os.path.basename(cmd[0])} ({stage})")
+        raise subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+def _read_stderr_tail(stream, tail):
+    for line in stream:
+        tail.append(line)
+
+def run_ffmpeg_command(cmd_list, operation_desc, progress_callback=None, task_id=None, process_registry=None, on_progress=None, stage=None, pass_fds=(), timeout=None):
+    """Runs ffmpeg with -progress on stdout, calling on_progress(out_time_sec, fps) per report.
+
+    Only the last STDERR_TAIL_LINES lines of stderr are kept, for error messages.
+    With stage set, the run is timed as that pipeline stage in the metrics, and ffmpeg is
+    killed after the stage's timeout unless timeout is given. Cancelling the job of task_id
+    kills it too. pass_fds are inherited by ffmpeg, for pipe:N outputs.
+    """
+    if stage is not None:
+        with stage_span(stage):
+            return run_ffmpeg_command(
+                cmd_list, operation_desc, progress_callback, task_id, process_registry, on_progress,
+                pass_fds=pass_fds, timeout=timeout or stage_timeout(stage, task_id)
+            )
+    control = job_control(task_id)
+    if control is not None:
+        control.check() # Don't start new work for a cancelled job
     if progress_callback and task_id:
         progress_callback(task_id, {"status": "processing", "message": f"Executing FFmpeg for {operation_desc}..."})
     # print(f"Executing FFmpeg for {operation_desc}: {' '.join(cmd_list)}") # Keep for server log
+    cmd_list = [cmd_list[0], "-nostats", "-progress", "pipe:1"] + cmd_list[1:]
     try:
-        process = subprocess.run(cmd_list, capture_output=True, text=True, check=False) # check=False to handle errors manually
+        process = start_child_process(cmd_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, pass_fds=pass_fds)
+        ACTIVE_FFMPEG.inc()
+        if process_registry is not None and not process_registry.register(process):
+            process.communicate()
+            ACTIVE_FFMPEG.dec()
+            raise MontageError(f"{operation_desc} aborted because another ffmpeg process of this job failed.")
+        stderr_tail = collections.deque(maxlen=STDERR_TAIL_LINES)
+        stderr_reader = threading.Thread(target=_read_stderr_tail, args=(process.stderr, stderr_tail), daemon=True)
+        stderr_reader.start()
+        supervision = ChildSupervision(process, task_id, timeout)
+        try:
+            with supervision:
+                report = {}
+                for line in process.stdout:
+                    key, _, value = line.strip().partition('=')
+                    report[key] = value
+                    if key != "progress":
+                        continue
+                    out_time_us = report.get("out_time_us", report.get("out_time_ms", "N/A")) # out_time_ms is in microseconds too
+                    if on_progress and out_time_us not in ("", "N/A"):
+                        try:
+                            fps = float(report.get("fps", "0") or 0)
+                            on_progress(max(0.0, int(out_time_us) / 1_000_000), fps)
+                        except ValueError:
+                            pass
+                    report = {}
+                wait_child_process(process)
+                stderr_reader.join()
+        finally:
+            if process_registry is not None:
+                process_registry.unregister(process)
+            if process.returncode is None: # Left early on an error; don't leave ffmpeg running
+                kill_process_group(process)
+                wait_child_process(process)
+            ACTIVE_FFMPEG.dec()
         if process.returncode != 0:
-            error_message = f"Error during {operation_desc}:\nCommand: {' '.join(cmd_list)}\nReturn code: {process.returncode}\nSTDOUT:\n{process.stdout}\nSTDERR:\n{process.stderr}"
+            supervision.raise_if_stopped(operation_desc)
+            if process_registry is not None and process_registry.aborted: # Killed by us, not an ffmpeg failure
+                raise MontageError(f"{operation_desc} aborted because another ffmpeg process of this job failed.")
+            error_message = f"Error during {operation_desc}:\nCommand: {' '.join(cmd_list)}\nReturn code: {process.returncode}\nSTDERR (last {STDERR_TAIL_LINES} lines):\n{''.join(stderr_tail)}"
             if progress_callback and task_id:
                 progress_callback(task_id, {"status": "error", "message": f"Error during {operation_desc}. Check server logs."})
             raise MontageError(error_message)
         return True
+    except MontageError:
+        raise
     except FileNotFoundError as e: # Handle case where ffmpeg itself is not found
         error_message = f"FFmpeg command not found: {cmd_list[0]}. Ensure FFmpeg is installed and in PATH. Error: {e}"
         if progress_callback and task_id:
@@ -129,12 +537,862 @@ def generate_beat_grouped_scene_durations(
         if current_interval_start_beat_idx >= len(beat_timestamps) -1 : break
     return grouped_scene_durations
 
-def create_rhythmic_montage_ffmpeg(
-    input_video_path, output_video_path, label_file_path,
-    output_resolution_str, target_total_output_duration_sec, target_total_num_scenes,
-    min_beat_grouped_scene_duration, audio_file_path=None, audio_mix_behavior="replace",
-    progress_callback=None, task_id=None # Added for progress
+def parse_audacity_labels_np(label_file_path, progress_callback=None, task_id=None):
+    """Bulk-parses the label start times with NumPy; same result as parse_audacity_labels.
+
+    Files under NUMPY_LABEL_PARSE_MIN_BYTES, files that need per-line handling
+    (unparsable lines, padded fields, NaN) and installs without NumPy go through
+    parse_audacity_labels, so warnings are unchanged.
+    """
+    try:
+        small_file = os.path.getsize(label_file_path) < NUMPY_LABEL_PARSE_MIN_BYTES
+    except OSError: # parse_audacity_labels reports the missing file
+        small_file = True
+    if np is None or small_file:
+        return parse_audacity_labels(label_file_path, progress_callback, task_id)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore") # loadtxt warns on empty files; handled below
+            start_times = np.loadtxt(label_file_path, dtype=np.float64, delimiter='\t', usecols=0, comments=None, ndmin=1)
+    except (ValueError, IndexError, UnicodeDecodeError):
+        return parse_audacity_labels(label_file_path, progress_callback, task_id)
+    if not start_times.size or np.isnan(start_times).any():
+        return parse_audacity_labels(label_file_path, progress_callback, task_id)
+    return np.unique(start_times).tolist()
+
+class LabelCache:
+    """Parsed label files shared across jobs, keyed by path and only trusted while size and mtime are unchanged."""
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict() # (abs path, size, mtime_ns) -> beat timestamps, least recently used first
+
+    def parse(self, label_file_path, progress_callback=None, task_id=None):
+        try:
+            stat_result = os.stat(label_file_path)
+        except OSError: # parse_audacity_labels reports the missing file
+            return parse_audacity_labels_np(label_file_path, progress_callback, task_id)
+        key = (os.path.abspath(label_file_path), stat_result.st_size, stat_result.st_mtime_ns)
+        with self._lock:
+            beat_timestamps = self._entries.get(key)
+            if beat_timestamps is not None:
+                self._entries.move_to_end(key)
+                return list(beat_timestamps)
+        beat_timestamps = parse_audacity_labels_np(label_file_path, progress_callback, task_id)
+        if beat_timestamps is not None:
+            with self._lock:
+                self._entries[key] = tuple(beat_timestamps)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return beat_timestamps
+
+def generate_beat_grouped_scene_durations_np(
+    beat_timestamps,
+    start_processing_from_beat_index,
+    min_grouped_duration,
+    progress_callback=None, task_id=None
+):
+    """Array version of generate_beat_grouped_scene_durations for strictly increasing beats.
+
+    Each beat's group end (the first later beat at least min_grouped_duration away, else
+    the last beat) is found for all beats at once; only the chain of group starts is
+    walked in Python. Inputs with repeated or out-of-order beats, where the original
+    resets its group start, are delegated to the original.
+    """
+    if np is None or not beat_timestamps or start_processing_from_beat_index >= len(beat_timestamps) - 1:
+        return generate_beat_grouped_scene_durations(
+            beat_timestamps, start_processing_from_beat_index, min_grouped_duration, progress_callback, task_id
+        )
+    beats = np.asarray(beat_timestamps, dtype=np.float64)
+    if not (np.diff(beats) > 0).all():
+        return generate_beat_grouped_scene_durations(
+            beat_timestamps, start_processing_from_beat_index, min_grouped_duration, progress_callback, task_id
+        )
+
+    num_beats = len(beats)
+    beat_indices = np.arange(num_beats)
+    group_end = np.maximum(np.searchsorted(beats, beats + min_grouped_duration, side='left'), beat_indices + 1)
+    # beats + min may round differently from the original's (next - start) >= min test;
+    # nudge each end until it is the first beat satisfying the test exactly.
+    while True:
+        too_short = (group_end < num_beats) & (beats[np.minimum(group_end, num_beats - 1)] - beats < min_grouped_duration)
+        if not too_short.any(): break
+        group_end[too_short] += 1
+    while True:
+        earlier = group_end - 1
+        too_long = (earlier > beat_indices) & (beats[np.minimum(earlier, num_beats - 1)] - beats >= min_grouped_duration)
+        if not too_long.any(): break
+        group_end[too_long] -= 1
+    group_end = np.minimum(group_end, num_beats - 1) # No beat far enough: the group takes the last interval
+    group_durations = (beats[group_end] - beats).tolist()
+    group_end = group_end.tolist()
+
+    grouped_scene_durations = []
+    current_interval_start_beat_idx = start_processing_from_beat_index
+    while current_interval_start_beat_idx < num_beats - 1:
+        grouped_scene_durations.append(group_durations[current_interval_start_beat_idx])
+        current_interval_start_beat_idx = group_end[current_interval_start_beat_idx]
+    return grouped_scene_durations
+
+def probe_video_info(video_path, task_id=None):
+    """Returns duration, resolution and codec details of a media file from one ffprobe call."""
+    cmd = ["ffprobe", "-v", "quiet", "-print_format", "json", "-show_format", "-show_streams", video_path]
+    try:
+        process = run_child_process(cmd, task_id)
+        metadata = json.loads(process.stdout)
+    except subprocess.CalledProcessError as e:
+        raise MontageError(f"ffprobe error for '{os.path.basename(video_path)}': {e.stderr}")
+    except ValueError as e:
+        raise MontageError(f"Could not parse ffprobe output for '{os.path.basename(video_path)}': {e}")
+    if 'format' not in metadata or 'duration' not in metadata['format']:
+        raise MontageError(f"Error: Could not retrieve duration from ffprobe output for '{os.path.basename(video_path)}'.")
+
+    streams = metadata.get('streams', [])
+    video_stream = next((s for s in streams if s.get('codec_type') == 'video'), {})
+    audio_stream = next((s for s in streams if s.get('codec_type') == 'audio'), {})
+    return {
+        "duration": float(metadata['format']['duration']),
+        "width": video_stream.get('width'),
+        "height": video_stream.get('height'),
+        "video_codec": video_stream.get('codec_name'),
+        "pix_fmt": video_stream.get('pix_fmt'),
+        "frame_rate": video_stream.get('avg_frame_rate'),
+        "audio_codec": audio_stream.get('codec_name'),
+        "audio_sample_rate": int(audio_stream['sample_rate']) if audio_stream.get('sample_rate') else None,
+        "has_audio": bool(audio_stream),
+        "streams": [
+            {k: s.get(k) for k in ("index", "codec_type", "codec_name", "width", "height", "sample_rate", "channels")}
+            for s in streams
+        ],
+    }
+
+def probe_keyframe_times(video_path, task_id=None):
+    """Returns the sorted presentation times of the video keyframes, read from packet flags (no decoding)."""
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", video_path]
+    try:
+        process = run_child_process(cmd, task_id, stage="keyframes")
+    except subprocess.CalledProcessError as e:
+        raise MontageError(f"ffprobe error while reading keyframes of '{os.path.basename(video_path)}': {e.stderr}")
+    keyframe_times = []
+    for line in process.stdout.splitlines():
+        parts = line.strip().split(',')
+        if len(parts) >= 2 and 'K' in parts[1] and parts[0] not in ('', 'N/A'):
+            keyframe_times.append(float(parts[0]))
+    return sorted(keyframe_times)
+
+def snap_start_to_keyframe(keyframe_times, max_start_time, rng=random):
+    """Random keyframe time in [0, max_start_time], or None when no keyframe fits."""
+    eligible = keyframe_times[:bisect.bisect_right(keyframe_times, max_start_time)]
+    eligible = [t for t in eligible if t >= 0]
+    return rng.choice(eligible) if eligible else None
+
+def stream_copy_compatibility(source_info, output_width, output_height):
+    """Which source streams can be stream-copied into clips matching the re-encoded clip format."""
+    copy_video = (
+        source_info.get("video_codec") == "h264" and source_info.get("pix_fmt") == "yuv420p"
+        and source_info.get("width") == output_width and source_info.get("height") == output_height
+    )
+    copy_audio = source_info.get("audio_codec") == "aac" and source_info.get("audio_sample_rate") == 44100
+    return copy_video, copy_audio
+
+def has_audio_stream(video_path, task_id=None):
+    cmd = ["ffprobe", "-v", "quiet", "-print_format", "json", "-select_streams", "a", "-show_entries", "stream=index", video_path]
+    try:
+        process = run_child_process(cmd, task_id)
+        return bool(json.loads(process.stdout).get('streams'))
+    except (subprocess.CalledProcessError, ValueError) as e:
+        raise MontageError(f"ffprobe error while checking audio streams of '{os.path.basename(video_path)}': {e}")
+
+def scale_pad_filter(output_width, output_height):
+    return f"scale={output_width}:{output_height}:force_original_aspect_ratio=decrease,pad={output_width}:{output_height}:(ow-iw)/2:(oh-ih)/2:color=black,setsar=1"
+
+def scale_variants_filter(input_label, variants, output_prefix):
+    """Filter chains scaling one decoded video stream to every variant's size via split.
+
+    Returns (filter parts, output labels), one label per variant in order.
+    """
+    output_labels = [f"[{output_prefix}{k}]" for k in range(len(variants))]
+    if len(variants) == 1:
+        return [f"{input_label}{scale_pad_filter(variants[0]['width'], variants[0]['height'])}{output_labels[0]}"], output_labels
+    split_labels = [f"[{output_prefix}{k}split]" for k in range(len(variants))]
+    filter_parts = [f"{input_label}split={len(variants)}{''.join(split_labels)}"]
+    for split_label, variant, output_label in zip(split_labels, variants, output_labels):
+        filter_parts.append(f"{split_label}{scale_pad_filter(variant['width'], variant['height'])}{output_label}")
+    return filter_parts, output_labels
+
+def split_audio_filter(input_label, count, output_prefix):
+    """A filter graph output can only be mapped once; asplit it when several outputs need it."""
+    if count == 1:
+        return [], [input_label]
+    output_labels = [f"[{output_prefix}{k}]" for k in range(count)]
+    return [f"{input_label}asplit={count}{''.join(output_labels)}"], output_labels
+
+def scene_output_options(variants, copy_audio=False, ffmpeg_threads=0):
+    """Shared part of the per-scene extraction commands of the clips and pipe engines.
+
+    Returns (filter_complex parts, output options per variant). The scene is decoded once
+    and split into every variant's scale/encode chain; a variant with copy_video set (and
+    copy_audio) stream-copies that stream instead.
+    """
+    encoded_variants = [variant for variant in variants if not variant["copy_video"]]
+    filter_parts, scaled_labels = scale_variants_filter("[0:v:0]", encoded_variants, "v") if encoded_variants else ([], [])
+    scaled_labels = iter(scaled_labels)
+    if copy_audio:
+        audio_opts = ["-c:a", "copy"]
+    else:
+        audio_opts = ["-c:a", "aac", "-b:a", "128k", "-ar", "44100"] # Added sample rate
+    variant_opts = []
+    for variant in variants:
+        if variant["copy_video"]:
+            video_opts = ["-map", "0:v:0", "-c:v", "copy"]
+        else:
+            video_opts = ["-map", next(scaled_labels)] + video_encoder_opts(variant, 23)
+        copy_opts = ["-avoid_negative_ts", "make_zero"] if variant["copy_video"] or copy_audio else []
+        variant_opts.append(video_opts + ["-map", "0:a:0?"] + audio_opts + copy_opts + ["-threads", str(ffmpeg_threads)])
+    return filter_parts, variant_opts
+
+def scene_extraction_command(input_video_path, scene, filter_parts, variant_opts, outputs):
+    """ffmpeg command cutting one scene into outputs (one per variant, each a list of options ending in the target)."""
+    cmd = ["ffmpeg", "-ss", str(scene["start"]), "-i", input_video_path]
+    if filter_parts:
+        cmd.extend(["-filter_complex", ";".join(filter_parts)])
+    for opts, output in zip(variant_opts, outputs):
+        cmd.extend(["-t", str(scene["duration"])] + opts + output)
+    return cmd
+
+def mp4_output_options():
+    """Muxer options of every final MP4 output."""
+    return ["-movflags", "+faststart"] if MP4_FASTSTART else []
+
+def concat_assembly_command(concat_list_path, variant, audio_file_path=None, audio_mix_behavior="replace", progress_callback=None, task_id=None):
+    """ffmpeg command joining the scene clips of a concat list into variant's output, adding any external audio."""
+    ffmpeg_final_cmd = ["ffmpeg", "-f", "concat", "-safe", "0", "-i", concat_list_path]
+
+    if audio_file_path:
+        ffmpeg_final_cmd.extend(["-i", audio_file_path]) # Add external audio as second input
+        if audio_mix_behavior == "mix":
+            if progress_callback and task_id:
+                progress_callback(task_id, {"status": "processing", "message": f"Mixing concatenated video audio with external audio: {os.path.basename(audio_file_path)}"})
+            # Input 0 is concat video, Input 1 is external audio
+            # [0:a] is audio from concat, [1:a] is audio from external
+            ffmpeg_final_cmd.extend([
+                "-filter_complex", "[0:a][1:a]amix=inputs=2:duration=first:dropout_transition=3[aout]", # Mix audio
+                "-map", "0:v:0",      # Video from concat (input 0)
+                "-map", "[aout]"      # Mixed audio output
+            ])
+            ffmpeg_final_cmd.extend(video_encoder_opts(variant, 22)) # Re-encode video for good quality
+            ffmpeg_final_cmd.extend(["-c:a", "aac", "-b:a", "192k", "-ar", "44100"]) # Encode mixed audio
+        elif audio_mix_behavior == "replace":
+            if progress_callback and task_id:
+                progress_callback(task_id, {"status": "processing", "message": f"Replacing concatenated video audio with external audio: {os.path.basename(audio_file_path)}"})
+            ffmpeg_final_cmd.extend(["-map", "0:v:0", "-map", "1:a:0"]) # Video from concat, audio from external
+            ffmpeg_final_cmd.extend(["-c:v", "copy"]) # Try to copy video if compatible
+            ffmpeg_final_cmd.extend(["-c:a", "aac", "-b:a", "192k", "-ar", "44100"]) # Re-encode external audio to aac
+            ffmpeg_final_cmd.append("-shortest") # Trim to shorter of video/audio
+    else:
+        # No external audio, just copy the stream from concatenated clips (which now have audio)
+        ffmpeg_final_cmd.extend(["-c", "copy"])
+
+    ffmpeg_final_cmd.extend(mp4_output_options() + ["-y", variant["output_path"]])
+    return ffmpeg_final_cmd
+
+def render_scenes_clips(
+    input_video_path, variants, scene_plan, temp_dir,
+    audio_file_path=None, audio_mix_behavior="replace",
+    progress_callback=None, task_id=None,
+    extraction_workers=1, ffmpeg_threads=0,
+    copy_audio=False, render_progress=None
 ):
+    """Per-clip engine: one ffmpeg process per scene into temp files, then a concat pass per variant.
+
+    With extraction_workers > 1 the scenes are extracted concurrently, each ffmpeg limited
+    to ffmpeg_threads threads (0 lets ffmpeg decide). With copy_video/copy_audio stream
+    copies, scene starts should sit on keyframes.
+    """
+    filter_parts, variant_opts = scene_output_options(variants, copy_audio, ffmpeg_threads)
+    scene_jobs = [] # (temp clip path per variant, ffmpeg command, description), in output order
+    for i, scene in enumerate(scene_plan):
+        scene_paths = [os.path.join(temp_dir, f"scene_{i:03d}_{variant['resolution']}.mp4") for variant in variants]
+        ffmpeg_cmd_scene = scene_extraction_command(input_video_path, scene, filter_parts, variant_opts, [["-y", path] for path in scene_paths])
+        scene_jobs.append((scene_paths, ffmpeg_cmd_scene, f"extracting {scene['desc']}"))
+
+    def scene_reporter(i):
+        return render_progress.reporter("extracting", i) if render_progress else None
+
+    if extraction_workers > 1 and len(scene_jobs) > 1:
+        if progress_callback and task_id:
+            progress_callback(task_id, {"status": "processing", "message": f"Extracting {len(scene_jobs)} scenes with {extraction_workers} parallel ffmpeg workers ({ffmpeg_threads or 'auto'} threads each)..."})
+        process_registry = ProcessRegistry()
+        with ThreadPoolExecutor(max_workers=extraction_workers, thread_name_prefix="scene_extract") as executor:
+            futures = [
+                executor.submit(run_ffmpeg_command, cmd, desc, progress_callback, task_id, process_registry, scene_reporter(i), stage="extract_scene")
+                for i, (_, cmd, desc) in enumerate(scene_jobs)
+            ]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except Exception:
+                # Fail fast: drop queued scenes and kill the ones still running
+                for future in futures:
+                    future.cancel()
+                process_registry.abort()
+                raise
+    else:
+        for i, (_, cmd, desc) in enumerate(scene_jobs):
+            run_ffmpeg_command(cmd, desc, progress_callback, task_id, on_progress=scene_reporter(i), stage="extract_scene")
+
+    for k, variant in enumerate(variants):
+        temp_scene_files_for_concat = [scene_paths[k] for scene_paths, _, _ in scene_jobs]
+        concat_list_path = os.path.join(temp_dir, f"concat_list_{variant['resolution']}.txt")
+        with open(concat_list_path, 'w') as f:
+            for p in temp_scene_files_for_concat: f.write(f"file '{os.path.relpath(p, temp_dir)}'\n") # Use relative paths for concat list
+
+        ffmpeg_final_cmd = concat_assembly_command(concat_list_path, variant, audio_file_path, audio_mix_behavior, progress_callback, task_id)
+
+        assembly_reporter = render_progress.reporter("assembling", k) if render_progress else None
+        if not run_ffmpeg_command(ffmpeg_final_cmd, f"final {variant['resolution']} video assembly", progress_callback, task_id, on_progress=assembly_reporter, stage="assemble"):
+            # Error handled by run_ffmpeg_command
+            raise MontageError("Failed to create final video.")
+    return variants[0]["output_path"]
+
+def _relay_scene_stream(read_fd, chunk_queue, abort_event):
+    """Moves one scene stream from its pipe into chunk_queue, then None; gives up once the job is aborted."""
+    with os.fdopen(read_fd, 'rb', buffering=0) as pipe:
+        while True:
+            chunk = pipe.read(PIPE_CHUNK_BYTES)
+            while True:
+                try:
+                    chunk_queue.put(chunk or None, timeout=0.2)
+                    break
+                except queue.Full:
+                    if abort_event.is_set():
+                        return # Closing the pipe ends the extractor with EPIPE, if it wasn't killed already
+            if not chunk:
+                return
+
+def _open_fifo_for_writing(fifo_path, abort_event, reader_exited):
+    """Opens fifo_path once the muxer opens it for reading. None if the job is aborted or the muxer exits first."""
+    while not (abort_event.is_set() or reader_exited.is_set()):
+        try:
+            fd = os.open(fifo_path, os.O_WRONLY | os.O_NONBLOCK) # Non-blocking so an abort can't leave us hanging in open()
+        except OSError as e:
+            if e.errno != errno.ENXIO: # ENXIO: no reader yet
+                raise
+            time.sleep(0.01)
+            continue
+        os.set_blocking(fd, True)
+        return fd
+    return None
+
+def render_scenes_pipe(
+    input_video_path, variants, scene_plan, temp_dir,
+    audio_file_path=None, audio_mix_behavior="replace",
+    progress_callback=None, task_id=None,
+    extraction_workers=1, ffmpeg_threads=0,
+    copy_audio=False, render_progress=None
+):
+    """Streaming engine: the clips engine's commands, with scenes piped into running muxers.
+
+    One muxer per variant reads a concat list of FIFOs while the scenes are extracted,
+    up to extraction_workers at a time, as NUT streams on anonymous pipes. Finished scenes
+    wait in memory (at most PIPE_BUFFER_CHUNKS chunks per scene and variant) until their
+    muxer opens their FIFO, so nothing but the outputs is written to disk.
+    """
+    filter_parts, variant_opts = scene_output_options(variants, copy_audio, ffmpeg_threads)
+    fifo_paths = [] # Per variant: FIFO per scene, in output order
+    mux_jobs = [] # (ffmpeg command, description) per variant
+    for variant in variants:
+        paths = [os.path.join(temp_dir, f"scene_{i:03d}_{variant['resolution']}.nut") for i in range(len(scene_plan))]
+        concat_list_path = os.path.join(temp_dir, f"concat_list_{variant['resolution']}.txt")
+        with open(concat_list_path, 'w') as f:
+            for path, scene in zip(paths, scene_plan):
+                os.mkfifo(path)
+                # A FIFO can't be probed for its length, so give the concat demuxer each scene's duration
+                f.write(f"file '{os.path.relpath(path, temp_dir)}'\nduration {scene['duration']}\n")
+        fifo_paths.append(paths)
+        mux_cmd = concat_assembly_command(concat_list_path, variant, audio_file_path, audio_mix_behavior, progress_callback, task_id)
+        mux_jobs.append((mux_cmd, f"streaming {variant['resolution']} video assembly"))
+
+    process_registry = ProcessRegistry()
+    abort_event = threading.Event()
+    scene_queues = [[queue.Queue(PIPE_BUFFER_CHUNKS) for _ in variants] for _ in scene_plan]
+    window = threading.Condition() # Scene i may start once every variant has written scene i - extraction_workers
+    scenes_written = [0] * len(variants)
+    muxers_exited = [threading.Event() for _ in variants] # Normally after the last scene; earlier with -shortest
+
+    def run_muxer(k, reporter):
+        cmd, desc = mux_jobs[k]
+        try:
+            return run_ffmpeg_command(cmd, desc, progress_callback, task_id, process_registry, reporter, stage="assemble")
+        finally:
+            muxers_exited[k].set()
+
+    def extract_scene(i):
+        with window:
+            while i >= min(scenes_written) + extraction_workers:
+                if abort_event.is_set():
+                    return
+                window.wait(0.2)
+        if all(exited.is_set() for exited in muxers_exited): # No muxer reads this scene any more
+            for chunk_queue in scene_queues[i]:
+                chunk_queue.put(None)
+            return
+        pipes = [os.pipe() for _ in variants]
+        try:
+            for k, (read_fd, _) in enumerate(pipes):
+                threading.Thread(target=_relay_scene_stream, args=(read_fd, scene_queues[i][k], abort_event), daemon=True).start()
+            cmd = scene_extraction_command(input_video_path, scene_plan[i], filter_parts, variant_opts, [["-f", "nut", f"pipe:{write_fd}"] for _, write_fd in pipes])
+            run_ffmpeg_command(cmd, f"extracting {scene_plan[i]['desc']}", progress_callback, task_id, process_registry, stage="extract_scene", pass_fds=[write_fd for _, write_fd in pipes])
+        finally:
+            for _, write_fd in pipes:
+                os.close(write_fd)
+
+    def feed_muxer(k):
+        """Writes variant k's scenes into its FIFOs; once its muxer stops reading, drains them instead.
+
+        A muxer ends early with -shortest and an audio track shorter than the plan. The
+        remaining scenes are still consumed, so the extractors shared with the other
+        variants finish and the window keeps moving. A muxer that failed reports its
+        own error.
+        """
+        muxer_reading = True
+        for i in range(len(scene_plan)):
+            fd = _open_fifo_for_writing(fifo_paths[k][i], abort_event, muxers_exited[k]) if muxer_reading else None
+            if abort_event.is_set():
+                return
+            fifo = os.fdopen(fd, 'wb') if fd is not None else None
+            muxer_reading = fifo is not None
+            try:
+                while True:
+                    try:
+                        chunk = scene_queues[i][k].get(timeout=0.2)
+                    except queue.Empty:
+                        if abort_event.is_set():
+                            return
+                        continue
+                    if chunk is None:
+                        break
+                    if muxer_reading:
+                        try:
+                            fifo.write(chunk)
+                        except BrokenPipeError:
+                            muxer_reading = False
+            finally:
+                if fifo is not None:
+                    try:
+                        fifo.close()
+                    except BrokenPipeError: # Buffered bytes the muxer no longer wanted
+                        muxer_reading = False
+            with window:
+                scenes_written[k] = i + 1
+                window.notify_all()
+
+    if progress_callback and task_id:
+        progress_callback(task_id, {"status": "processing", "message": f"Streaming {len(scene_plan)} scenes into {len(variants)} muxer(s) with {extraction_workers} parallel ffmpeg workers ({ffmpeg_threads or 'auto'} threads each)..."})
+    rendering_reporter = render_progress.reporter("rendering", 0) if render_progress else None
+    control = job_control(task_id)
+    if control is not None:
+        control.register_event(abort_event) # A cancel also wakes the window, relay and FIFO waits
+    try:
+        with ThreadPoolExecutor(max_workers=2 * len(variants), thread_name_prefix="pipe_mux") as mux_executor, \
+                ThreadPoolExecutor(max_workers=extraction_workers, thread_name_prefix="scene_extract") as extract_executor:
+            futures = [mux_executor.submit(run_muxer, k, rendering_reporter if k == 0 else None) for k in range(len(variants))]
+            futures += [mux_executor.submit(feed_muxer, k) for k in range(len(variants))]
+            futures += [extract_executor.submit(extract_scene, i) for i in range(len(scene_plan))]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except Exception:
+                # Fail fast: stop feeding, drop queued scenes and kill every extractor and muxer
+                abort_event.set()
+                for future in futures:
+                    future.cancel()
+                process_registry.abort()
+                raise
+    finally:
+        if control is not None:
+            control.unregister_event(abort_event)
+    if control is not None:
+        control.check() # Cancelled while the threads were waiting, with no process left to kill
+    return variants[0]["output_path"]
+
+def wait_for_work(work_queue, group_id, job_items, on_done=None, task_id=None, poll_interval=0.5):
+    """Blocks until every job of job_items (job_id -> item) is done, calling on_done(item) as each one finishes.
+
+    Raises as soon as one fails, or when the job of task_id is cancelled.
+    """
+    control = job_control(task_id)
+    pending = dict(job_items)
+    while pending:
+        if control is not None:
+            control.check()
+        jobs = work_queue.group_jobs(group_id)
+        for job_id in list(pending):
+            job = jobs.get(job_id)
+            if job is None:
+                raise MontageError(f"Render job {job_id} disappeared from the work queue.")
+            if job["state"] == job_queue.DONE:
+                item = pending.pop(job_id)
+                if on_done:
+                    on_done(item)
+            elif job["state"] == job_queue.FAILED:
+                raise MontageError(f"A render worker failed: {job['error']}")
+        if pending:
+            time.sleep(poll_interval)
+
+def render_scenes_distributed(
+    input_video_path, variants, scene_plan, temp_dir, work_queue,
+    audio_file_path=None, audio_mix_behavior="replace",
+    progress_callback=None, task_id=None, ffmpeg_threads=0,
+    copy_audio=False, render_progress=None
+):
+    """Clips engine run by render workers (python -m montage_maker worker) through work_queue.
+
+    Every scene is a queue job, so the scenes of one montage spread over all workers; once
+    they all exist, each variant is assembled by a worker too. temp_dir, the inputs and the
+    outputs must be on storage every worker mounts at the same path.
+    """
+    group_id = f"{task_id or 'montage'}-{uuid.uuid4().hex[:8]}"
+    input_video_path = os.path.abspath(input_video_path) # Workers don't share our working directory
+    audio_file_path = os.path.abspath(audio_file_path) if audio_file_path else None
+    variants = [dict(variant, output_path=os.path.abspath(variant["output_path"])) for variant in variants]
+    temp_dir = os.path.abspath(temp_dir)
+
+    scene_paths = [] # Temp clip path per variant, per scene
+    scene_jobs = {} # job_id -> scene index
+    for i, scene in enumerate(scene_plan):
+        paths = [os.path.join(temp_dir, f"scene_{i:03d}_{variant['resolution']}.mp4") for variant in variants]
+        scene_paths.append(paths)
+        job_id = work_queue.enqueue(group_id, "extract_scene", {
+            "input_video_path": input_video_path, "scene": scene, "variants": variants, "output_paths": paths,
+            "copy_audio": copy_audio, "ffmpeg_threads": ffmpeg_threads
+        })
+        scene_jobs[job_id] = i
+    if progress_callback and task_id:
+        progress_callback(task_id, {"status": "processing", "message": f"Queued {len(scene_plan)} scenes for the render workers..."})
+
+    def scene_done(i):
+        if render_progress:
+            render_progress.update("extracting", i, scene_plan[i]["duration"])
+
+    def variant_done(k):
+        if render_progress:
+            render_progress.update("assembling", k, sum(scene["duration"] for scene in scene_plan))
+
+    try:
+        wait_for_work(work_queue, group_id, scene_jobs, scene_done, task_id)
+        assembly_jobs = {} # job_id -> variant index
+        for k, variant in enumerate(variants):
+            concat_list_path = os.path.join(temp_dir, f"concat_list_{variant['resolution']}.txt")
+            with open(concat_list_path, 'w') as f:
+                for paths in scene_paths: f.write(f"file '{os.path.relpath(paths[k], temp_dir)}'\n")
+            job_id = work_queue.enqueue(group_id, "assemble", {
+                "concat_list_path": concat_list_path, "variant": variant,
+                "audio_file_path": audio_file_path, "audio_mix_behavior": audio_mix_behavior
+            })
+            assembly_jobs[job_id] = k
+        wait_for_work(work_queue, group_id, assembly_jobs, variant_done, task_id)
+    finally:
+        work_queue.purge_group(group_id) # After a failure, also stops the scenes still queued or running
+    return variants[0]["output_path"]
+
+def render_scenes_filtergraph(
+    input_video_path, variants, scene_plan, temp_dir,
+    audio_file_path=None, audio_mix_behavior="replace",
+    progress_callback=None, task_id=None, ffmpeg_threads=0, source_has_audio=None, render_progress=None
+):
+    """Single-pass engine: every scene is a seeked/trimmed input of one ffmpeg process.
+
+    Scaling, padding and concatenation happen inside one filter graph, so each output
+    frame is encoded exactly once regardless of scene count or audio mode. With several
+    variants the scenes are concatenated at source size and the result split per variant.
+    Every input's decoder runs for the whole pass, so render_planned_scenes only uses this
+    engine for plans of up to FILTERGRAPH_MAX_INPUTS scenes.
+    """
+    if source_has_audio is None:
+        source_has_audio = has_audio_stream(input_video_path, task_id)
+
+    # Declare the inputs in source-offset order so the demuxers open with forward seeks
+    # through the file; the concat filter still consumes them in plan order.
+    input_order = sorted(range(len(scene_plan)), key=lambda idx: scene_plan[idx]["start"])
+    input_index_for_scene = {}
+    ffmpeg_final_cmd = ["ffmpeg"]
+    for input_idx, scene_idx in enumerate(input_order):
+        scene = scene_plan[scene_idx]
+        ffmpeg_final_cmd.extend(["-ss", str(scene["start"]), "-t", str(scene["duration"]), "-i", input_video_path])
+        input_index_for_scene[scene_idx] = input_idx
+    external_audio_idx = len(scene_plan)
+    if audio_file_path:
+        ffmpeg_final_cmd.extend(["-i", audio_file_path])
+
+    filter_parts = []
+    concat_pads = ""
+    scale_per_scene = len(variants) == 1 # Otherwise scale once per variant after the concat
+    concat_audio = source_has_audio and (not audio_file_path or audio_mix_behavior == "mix") # Replaced scene audio would be an unconnected output
+    for scene_idx in range(len(scene_plan)):
+        input_idx = input_index_for_scene[scene_idx]
+        scale = f"{scale_pad_filter(variants[0]['width'], variants[0]['height'])}," if scale_per_scene else ""
+        filter_parts.append(f"[{input_idx}:v:0]{scale}setpts=PTS-STARTPTS[v{scene_idx}]")
+        concat_pads += f"[v{scene_idx}]"
+        if concat_audio:
+            filter_parts.append(f"[{input_idx}:a:0]aresample=44100,asetpts=PTS-STARTPTS[a{scene_idx}]")
+            concat_pads += f"[a{scene_idx}]"
+    concat_outputs = "[vout][acat]" if concat_audio else "[vout]"
+    filter_parts.append(f"{concat_pads}concat=n={len(scene_plan)}:v=1:a={1 if concat_audio else 0}{concat_outputs}")
+    if scale_per_scene:
+        video_labels = ["[vout]"]
+    else:
+        scale_parts, video_labels = scale_variants_filter("[vout]", variants, "vout")
+        filter_parts.extend(scale_parts)
+
+    audio_maps = [[] for _ in variants] # Per variant: audio -map options
+    if audio_file_path and audio_mix_behavior == "mix" and source_has_audio:
+        if progress_callback and task_id:
+            progress_callback(task_id, {"status": "processing", "message": f"Mixing scene audio with external audio: {os.path.basename(audio_file_path)}"})
+        filter_parts.append(f"[acat][{external_audio_idx}:a:0]amix=inputs=2:duration=first:dropout_transition=3[aout]")
+        split_parts, audio_labels = split_audio_filter("[aout]", len(variants), "aout")
+        filter_parts.extend(split_parts)
+        audio_maps = [["-map", label] for label in audio_labels]
+    elif audio_file_path:
+        if progress_callback and task_id:
+            progress_callback(task_id, {"status": "processing", "message": f"Replacing scene audio with external audio: {os.path.basename(audio_file_path)}"})
+        audio_maps = [["-map", f"{external_audio_idx}:a:0", "-shortest"] for _ in variants] # Trim to shorter of video/audio
+    elif source_has_audio:
+        split_parts, audio_labels = split_audio_filter("[acat]", len(variants), "acat")
+        filter_parts.extend(split_parts)
+        audio_maps = [["-map", label] for label in audio_labels]
+
+    # Hundreds of scenes make the graph too long for a command line, so pass it as a script
+    filter_script_path = os.path.join(temp_dir, "filter_graph.txt")
+    with open(filter_script_path, 'w') as f:
+        f.write(";\n".join(filter_parts))
+
+    ffmpeg_final_cmd.extend(["-filter_complex_script", filter_script_path])
+    for variant, video_label, audio_map in zip(variants, video_labels, audio_maps):
+        ffmpeg_final_cmd.extend(["-map", video_label] + audio_map)
+        ffmpeg_final_cmd.extend(video_encoder_opts(variant, 22))
+        ffmpeg_final_cmd.extend(["-c:a", "aac", "-b:a", "192k", "-ar", "44100"])
+        ffmpeg_final_cmd.extend(["-threads", str(ffmpeg_threads)] + mp4_output_options() + ["-y", variant["output_path"]])
+
+    rendering_reporter = render_progress.reporter("rendering", 0) if render_progress else None
+    if not run_ffmpeg_command(ffmpeg_final_cmd, f"single-pass rendering of {len(scene_plan)} scenes", progress_callback, task_id, on_progress=rendering_reporter, stage="render"):
+        raise MontageError("Failed to create final video.")
+    return variants[0]["output_path"]
+
+def hls_dir_for(output_video_path):
+    """Folder holding the HLS playlist and segments published next to an output video."""
+    return f"{os.path.splitext(output_video_path)[0]}_hls"
+
+class HLSPlaylist:
+    """Live EVENT playlist: segments are appended in output order as they finish.
+
+    Segments may finish out of order (parallel extraction); each is held back until all
+    earlier ones are listed. The file is replaced atomically on every change.
+    """
+    def __init__(self, hls_dir, segment_durations):
+        self.path = os.path.join(hls_dir, HLS_PLAYLIST_NAME)
+        self.segment_durations = segment_durations
+        self._finished = set()
+        self.listed_count = 0
+        self.ended = False
+        self._write()
+
+    def segment_name(self, index):
+        return f"segment_{index:04d}.ts"
+
+    def mark_finished(self, index):
+        """Returns True when this made new segments visible in the playlist."""
+        self._finished.add(index)
+        listed_before = self.listed_count
+        while self.listed_count in self._finished:
+            self.listed_count += 1
+        if self.listed_count == listed_before:
+            return False
+        self._write()
+        return True
+
+    def end(self):
+        self.ended = True
+        self._write()
+
+    def _write(self):
+        target_duration = max(1, math.ceil(max(self.segment_durations, default=1)))
+        lines = [
+            "#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-PLAYLIST-TYPE:EVENT",
+            f"#EXT-X-TARGETDURATION:{target_duration}", "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        for index in range(self.listed_count):
+            lines.extend([f"#EXTINF:{self.segment_durations[index]:.6f},", self.segment_name(index)])
+        if self.ended:
+            lines.append("#EXT-X-ENDLIST")
+        partial_path = f"{self.path}.partial"
+        with open(partial_path, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(partial_path, self.path)
+
+def render_scenes_hls(
+    input_video_path, variants, scene_plan, temp_dir,
+    audio_file_path=None, audio_mix_behavior="replace",
+    progress_callback=None, task_id=None,
+    extraction_workers=1, ffmpeg_threads=0,
+    copy_audio=False, source_has_audio=None, render_progress=None
+):
+    """HLS engine: every scene becomes an MPEG-TS segment on a live playlist per variant, then the MP4s.
+
+    Segments carry their output timestamps (-output_ts_offset) and any external audio is
+    cut per scene, so the playlists play while later scenes are still rendering. Each MP4
+    is a stream-copy concat of its variant's segments.
+    """
+    if source_has_audio is None:
+        source_has_audio = has_audio_stream(input_video_path, task_id)
+    playlists = []
+    for variant in variants:
+        hls_dir = hls_dir_for(variant["output_path"])
+        if os.path.isdir(hls_dir):
+            shutil.rmtree(hls_dir)
+        os.makedirs(hls_dir)
+        playlists.append(HLSPlaylist(hls_dir, [scene["duration"] for scene in scene_plan]))
+    primary_output_dir = os.path.dirname(os.path.abspath(variants[0]["output_path"]))
+    hls_playlist_relpath = os.path.relpath(playlists[0].path, primary_output_dir)
+
+    encoded_variants = [variant for variant in variants if not variant["copy_video"]]
+    video_filter_parts, scaled_labels = scale_variants_filter("[0:v:0]", encoded_variants, "v") if encoded_variants else ([], [])
+    scaled_labels = iter(scaled_labels)
+    video_opts = [] # Per variant: video -map and codec options
+    for variant in variants:
+        if variant["copy_video"]:
+            video_opts.append(["-map", "0:v:0", "-c:v", "copy"])
+        else:
+            video_opts.append(["-map", next(scaled_labels)] + video_encoder_opts(variant, 23))
+    audio_codec_opts = ["-c:a", "copy"] if copy_audio and not audio_file_path else ["-c:a", "aac", "-b:a", "128k", "-ar", "44100"]
+
+    scene_jobs = [] # (segment path per variant, ffmpeg command, description), in output order
+    output_start = 0.0
+    for i, scene in enumerate(scene_plan):
+        segment_paths = [os.path.join(os.path.dirname(playlist.path), playlist.segment_name(i)) for playlist in playlists]
+        cmd = ["ffmpeg", "-ss", str(scene["start"]), "-t", str(scene["duration"]), "-i", input_video_path]
+        filter_parts = list(video_filter_parts)
+        audio_maps = [[] for _ in variants]
+        if audio_file_path:
+            cmd.extend(["-ss", str(output_start), "-t", str(scene["duration"]), "-i", audio_file_path])
+            if audio_mix_behavior == "mix" and source_has_audio:
+                filter_parts.append("[0:a:0][1:a:0]amix=inputs=2:duration=first:dropout_transition=0[a]")
+                split_parts, audio_labels = split_audio_filter("[a]", len(variants), "a")
+                filter_parts.extend(split_parts)
+                audio_maps = [["-map", label] for label in audio_labels]
+            else:
+                audio_maps = [["-map", "1:a:0"] for _ in variants]
+        elif source_has_audio:
+            audio_maps = [["-map", "0:a:0"] for _ in variants]
+        if filter_parts:
+            cmd.extend(["-filter_complex", ";".join(filter_parts)])
+        for segment_path, variant_video_opts, audio_map in zip(segment_paths, video_opts, audio_maps):
+            cmd.extend(variant_video_opts + audio_map)
+            if audio_map:
+                cmd.extend(audio_codec_opts)
+            cmd.extend([
+                "-output_ts_offset", str(output_start), "-muxdelay", "0", "-threads", str(ffmpeg_threads),
+                "-f", "mpegts", "-y", segment_path
+            ])
+        scene_jobs.append((segment_paths, cmd, f"rendering HLS segment for {scene['desc']}"))
+        output_start += scene["duration"]
+
+    def publish(index):
+        first_segment = playlists[0].listed_count == 0
+        for playlist in playlists[1:]:
+            playlist.mark_finished(index)
+        if playlists[0].mark_finished(index) and first_segment and progress_callback and task_id:
+            progress_callback(task_id, {"status": "processing", "message": "Preview playlist is live.", "hls_playlist": hls_playlist_relpath})
+
+    def scene_reporter(i):
+        return render_progress.reporter("extracting", i) if render_progress else None
+
+    if extraction_workers > 1 and len(scene_jobs) > 1:
+        process_registry = ProcessRegistry()
+        with ThreadPoolExecutor(max_workers=extraction_workers, thread_name_prefix="scene_extract") as executor:
+            future_indices = {
+                executor.submit(run_ffmpeg_command, cmd, desc, progress_callback, task_id, process_registry, scene_reporter(i), stage="extract_scene"): i
+                for i, (_, cmd, desc) in enumerate(scene_jobs)
+            }
+            try:
+                for future in as_completed(future_indices):
+                    future.result()
+                    publish(future_indices[future])
+            except Exception:
+                for future in future_indices:
+                    future.cancel()
+                process_registry.abort()
+                raise
+    else:
+        for i, (_, cmd, desc) in enumerate(scene_jobs):
+            run_ffmpeg_command(cmd, desc, progress_callback, task_id, on_progress=scene_reporter(i), stage="extract_scene")
+            publish(i)
+    for playlist in playlists:
+        playlist.end()
+
+    for k, variant in enumerate(variants):
+        concat_list_path = os.path.join(temp_dir, f"concat_list_{variant['resolution']}.txt")
+        with open(concat_list_path, 'w') as f:
+            for segment_paths, _, _ in scene_jobs:
+                f.write(f"file '{os.path.abspath(segment_paths[k])}'\n")
+        ffmpeg_final_cmd = ["ffmpeg", "-f", "concat", "-safe", "0", "-i", concat_list_path, "-c", "copy"]
+        if audio_file_path or source_has_audio:
+            ffmpeg_final_cmd.extend(["-bsf:a", "aac_adtstoasc"])
+        ffmpeg_final_cmd.extend(mp4_output_options() + ["-y", variant["output_path"]])
+        assembly_reporter = render_progress.reporter("assembling", k) if render_progress else None
+        run_ffmpeg_command(ffmpeg_final_cmd, f"{variant['resolution']} MP4 assembly from HLS segments", progress_callback, task_id, on_progress=assembly_reporter, stage="assemble")
+    return variants[0]["output_path"]
+
+def parse_resolution(output_resolution_str):
+    """'1280x720' -> (1280, 720)"""
+    try:
+        out_w_str, out_h_str = output_resolution_str.lower().split('x')
+        output_width, output_height = int(out_w_str), int(out_h_str)
+        if output_width <= 0 or output_height <= 0: raise ValueError
+    except ValueError:
+        raise MontageError("Invalid output resolution format. Use WxH.")
+    return output_width, output_height
+
+def parse_output_variants(output_resolution_str):
+    """'1920x1080:crf=20,1080x1920:preset=fast' -> one dict per output variant, primary first.
+
+    Each comma-separated entry is WxH optionally followed by :crf=N and/or :preset=NAME;
+    settings left out use the engine's defaults.
+    """
+    variants = []
+    for spec in (entry.strip() for entry in output_resolution_str.split(',')):
+        resolution, *settings = spec.split(':')
+        output_width, output_height = parse_resolution(resolution)
+        variant = {"spec": spec, "resolution": f"{output_width}x{output_height}", "width": output_width, "height": output_height, "crf": None, "preset": None}
+        for setting in settings:
+            name, _, value = setting.partition('=')
+            if name == "crf" and value.isdigit() and 0 <= int(value) <= 51:
+                variant["crf"] = int(value)
+            elif name == "preset" and value in X264_PRESETS:
+                variant["preset"] = value
+            else:
+                raise MontageError(f"Invalid encoder setting '{setting}' for {resolution}. Use crf=0-51 or preset={'|'.join(X264_PRESETS)}.")
+        if any(other["resolution"] == variant["resolution"] for other in variants):
+            raise MontageError(f"Output resolution {variant['resolution']} is listed twice.")
+        variants.append(variant)
+    return variants
+
+def variant_output_path(output_video_path, variants, index):
+    """Output file of variants[index]; the primary (first) variant writes output_video_path itself."""
+    if index == 0:
+        return output_video_path
+    stem, extension = os.path.splitext(output_video_path)
+    return f"{stem}_{variants[index]['resolution']}{extension}"
+
+def video_encoder_opts(variant, default_crf):
+    return ["-c:v", "libx264", "-preset", variant["preset"] or "ultrafast", "-crf", str(default_crf if variant["crf"] is None else variant["crf"])]
+
+def validate_render_options(
+    input_video_path, output_resolution_str, audio_file_path=None, audio_mix_behavior="replace",
+    render_engine="clips", cut_mode="reencode", extraction_workers=1, ffmpeg_threads=0,
+    progress_callback=None, task_id=None, output_mode="mp4"
+):
+    """Checks shared by every render entry point. Returns the output variants (see parse_output_variants)."""
     # --- 0. Checks ---
     if not all(check_command_exists(cmd) for cmd in ["ffmpeg", "ffprobe"]):
         if progress_callback and task_id:
@@ -142,7 +1400,7 @@ def create_rhythmic_montage_ffmpeg(
         raise MontageError("ffmpeg or ffprobe not found.")
     # Removed random.py check as it's not relevant for module usage
 
-    # --- 1. Validate Inputs & Get Video Info ---
+    # --- 1. Validate Inputs ---
     if not os.path.exists(input_video_path):
         if progress_callback and task_id:
             progress_callback(task_id, {"status": "error", "message": f"Error: Input video file not found: '{os.path.basename(input_video_path)}'"})
@@ -155,199 +1413,433 @@ def create_rhythmic_montage_ffmpeg(
         if progress_callback and task_id:
             progress_callback(task_id, {"status": "error", "message": f"Error: Invalid audio_mix_behavior '{audio_mix_behavior}'. Must be 'replace' or 'mix'."})
         raise MontageError(f"Invalid audio_mix_behavior '{audio_mix_behavior}'. Must be 'replace' or 'mix'.")
+    if render_engine not in RENDER_ENGINES:
+        if progress_callback and task_id:
+            progress_callback(task_id, {"status": "error", "message": f"Error: Invalid render_engine '{render_engine}'. Must be one of {', '.join(RENDER_ENGINES)}."})
+        raise MontageError(f"Invalid render_engine '{render_engine}'. Must be one of {', '.join(RENDER_ENGINES)}.")
+    if cut_mode not in CUT_MODES:
+        if progress_callback and task_id:
+            progress_callback(task_id, {"status": "error", "message": f"Error: Invalid cut_mode '{cut_mode}'. Must be one of {', '.join(CUT_MODES)}."})
+        raise MontageError(f"Invalid cut_mode '{cut_mode}'. Must be one of {', '.join(CUT_MODES)}.")
+    if output_mode not in OUTPUT_MODES:
+        if progress_callback and task_id:
+            progress_callback(task_id, {"status": "error", "message": f"Error: Invalid output_mode '{output_mode}'. Must be one of {', '.join(OUTPUT_MODES)}."})
+        raise MontageError(f"Invalid output_mode '{output_mode}'. Must be one of {', '.join(OUTPUT_MODES)}.")
+    if extraction_workers < 1 or ffmpeg_threads < 0:
+        if progress_callback and task_id:
+            progress_callback(task_id, {"status": "error", "message": "Error: extraction_workers must be >= 1 and ffmpeg_threads must be >= 0."})
+        raise MontageError("extraction_workers must be >= 1 and ffmpeg_threads must be >= 0.")
 
     try:
-        out_w_str, out_h_str = output_resolution_str.lower().split('x')
-        output_width, output_height = int(out_w_str), int(out_h_str)
-        if output_width <= 0 or output_height <= 0: raise ValueError
-    except ValueError:
+        return parse_output_variants(output_resolution_str)
+    except MontageError as e:
         if progress_callback and task_id:
-            progress_callback(task_id, {"status": "error", "message": "Error: Invalid output resolution format. Use WxH (e.g., 1280x720)." })
-        raise MontageError("Invalid output resolution format. Use WxH.")
+            progress_callback(task_id, {"status": "error", "message": f"Error: {e} (e.g., 1280x720 or 1920x1080,1080x1920)"})
+        raise
+
+def resolve_render_source(
+    input_video_path, output_width, output_height, media_index=None, proxy_cache=None,
+    progress_callback=None, task_id=None
+):
+    """Swaps in a ready proxy when there is one and probes the source. Returns (video_path, source_info).
+
+    A proxy swapped in stays pinned in proxy_cache until proxy_cache.release(video_path).
+    """
+    if proxy_cache is not None:
+        proxy_path = proxy_cache.acquire(input_video_path, output_width, output_height) # Pinned until the caller releases it
+        if proxy_path:
+            if progress_callback and task_id:
+                progress_callback(task_id, {"status": "processing", "message": f"Using cached {output_width}x{output_height} proxy of {os.path.basename(input_video_path)}."})
+            input_video_path = proxy_path
 
     if progress_callback and task_id:
         progress_callback(task_id, {"status": "processing", "message": f"Getting duration of input video: {os.path.basename(input_video_path)}..."})
-    input_video_duration = get_video_duration(input_video_path, progress_callback, task_id)
-    if input_video_duration is None: return # Error handled in get_video_duration
+    try:
+        source_info = media_index.get_info(input_video_path, task_id) if media_index is not None else probe_video_info(input_video_path, task_id)
+    except MontageError as e:
+        if progress_callback and task_id:
+            progress_callback(task_id, {"status": "error", "message": str(e)})
+        raise
     if progress_callback and task_id:
-        progress_callback(task_id, {"status": "processing", "message": f"Input video duration: {input_video_duration:.2f} seconds"})
+        progress_callback(task_id, {"status": "processing", "message": f"Input video duration: {source_info['duration']:.2f} seconds"})
+    return input_video_path, source_info
 
-    # --- 2. Parse Audacity Labels ---
+def load_keyframe_times(input_video_path, media_index=None, progress_callback=None, task_id=None):
     if progress_callback and task_id:
-        progress_callback(task_id, {"status": "processing", "message": f"Parsing Audacity labels: {os.path.basename(label_file_path)}..."})
-    all_beat_timestamps = parse_audacity_labels(label_file_path, progress_callback, task_id)
-    if all_beat_timestamps is None: return # Error handled in parse_audacity_labels
+        progress_callback(task_id, {"status": "processing", "message": "Reading source keyframes for keyframe-snapped cuts..."})
+    keyframe_times = media_index.get_keyframes(input_video_path, task_id) if media_index is not None else probe_keyframe_times(input_video_path, task_id)
+    if not keyframe_times and progress_callback and task_id:
+        progress_callback(task_id, {"status": "processing", "message": "Warning: No keyframes found in source. Falling back to random start times."})
+    return keyframe_times
 
-    # --- 3. Plan the Output Structure ---
-    temp_scene_files_for_concat = []
-    actual_total_output_duration = 0.0
-    initial_scene_actual_duration = 0.0
+def plan_montage_scenes(
+    input_video_duration, beat_timestamps, target_total_output_duration_sec, target_total_num_scenes,
+    min_beat_grouped_scene_duration, seed=None, keyframe_times=None,
+    progress_callback=None, task_id=None
+):
+    """Computes the scene plan without touching any media file.
 
-    audio_opts_for_temp_clips = ["-c:a", "aac", "-b:a", "128k", "-ar", "44100"] # Added sample rate
+    Returns a JSON-serializable dict whose "scenes" list holds, in output order, each
+    scene's source offset ("start"), "duration", "output_start" and a "desc" label.
+    Scene starts snap to keyframe_times when given.
+    """
+    rng = random.Random(seed)
+    def pick_scene_start(max_start_time):
+        max_start_time = max(0, max_start_time)
+        if keyframe_times:
+            snapped_start = snap_start_to_keyframe(keyframe_times, max_start_time, rng)
+            if snapped_start is not None:
+                return snapped_start
+        return rng.uniform(0, max_start_time)
 
-    # Use a temporary directory that will be cleaned up
-    with tempfile.TemporaryDirectory(prefix="rhythmic_montage_") as temp_dir:
+    scene_plan = [] # Ordered list of {"start": offset in source, "duration": seconds, "desc": label for messages}
+    planned_total_duration = 0.0
+    initial_scene_actual_duration = 0.0
+
+    # --- 3a. Determine Initial Scene (up to first beat) ---
+    if not beat_timestamps:
         if progress_callback and task_id:
-            progress_callback(task_id, {"status": "processing", "message": f"Created temporary directory: {temp_dir}"})
+            progress_callback(task_id, {"status": "processing", "message": "Warning: Label file empty or no valid beats. Output might be a single random clip."})
+        initial_scene_duration_from_beats = target_total_output_duration_sec if target_total_output_duration_sec > 0 else 5.0
+        if initial_scene_duration_from_beats <=0 : initial_scene_duration_from_beats = 5.0
+    else:
+        initial_scene_duration_from_beats = beat_timestamps[0]
+        if initial_scene_duration_from_beats <= 0: # If first beat is at 0.0 or negative
+            if target_total_output_duration_sec <= 0 and not (len(beat_timestamps) > 1 and target_total_num_scenes > 1) :
+                # If no target duration/scenes, and this is potentially the only scene
+                initial_scene_duration_from_beats = MIN_FINAL_SCENE_WARN # Small positive duration
+                if progress_callback and task_id:
+                    progress_callback(task_id, {"status": "processing", "message": f"First beat at/before 0s. Setting initial scene to {initial_scene_duration_from_beats}s."})
+            else: # Other scenes will follow, so this initial scene can be 0
+                 initial_scene_duration_from_beats = 0
+                 if progress_callback and task_id:
+                    progress_callback(task_id, {"status": "processing", "message": "First beat at 0s. No separate initial scene before first beat."})
 
-        # --- 3a. Determine and Create Initial Scene (up to first beat) ---
-        if not all_beat_timestamps:
-            if progress_callback and task_id:
-                progress_callback(task_id, {"status": "processing", "message": "Warning: Label file empty or no valid beats. Output might be a single random clip."})
-            initial_scene_duration_from_beats = target_total_output_duration_sec if target_total_output_duration_sec > 0 else 5.0
-            if initial_scene_duration_from_beats <=0 : initial_scene_duration_from_beats = 5.0
+    if initial_scene_duration_from_beats > 0:
+        initial_scene_actual_duration = min(input_video_duration, initial_scene_duration_from_beats)
+        if input_video_duration <= initial_scene_actual_duration : # Video too short for this segment
+            random_start_for_initial = 0
+            initial_scene_actual_duration = input_video_duration # Use full video if it's shorter than desired
         else:
-            initial_scene_duration_from_beats = all_beat_timestamps[0]
-            if initial_scene_duration_from_beats <= 0: # If first beat is at 0.0 or negative
-                if target_total_output_duration_sec <= 0 and not (len(all_beat_timestamps) > 1 and target_total_num_scenes > 1) :
-                    # If no target duration/scenes, and this is potentially the only scene
-                    initial_scene_duration_from_beats = MIN_FINAL_SCENE_WARN # Small positive duration
-                    if progress_callback and task_id:
-                        progress_callback(task_id, {"status": "processing", "message": f"First beat at/before 0s. Setting initial scene to {initial_scene_duration_from_beats}s."})
-                else: # Other scenes will follow, so this initial scene can be 0
-                     initial_scene_duration_from_beats = 0
-                     if progress_callback and task_id:
-                        progress_callback(task_id, {"status": "processing", "message": "First beat at 0s. No separate initial scene before first beat."})
-
-        if initial_scene_duration_from_beats > 0:
-            initial_scene_actual_duration = min(input_video_duration, initial_scene_duration_from_beats)
-            if input_video_duration <= initial_scene_actual_duration : # Video too short for this segment
-                random_start_for_initial = 0
-                initial_scene_actual_duration = input_video_duration # Use full video if it's shorter than desired
-            else:
-                 random_start_for_initial = random.uniform(0, input_video_duration - initial_scene_actual_duration)
-
-            initial_clip_path = os.path.join(temp_dir, "initial_scene_000.mp4")
-            ffmpeg_cmd_initial = [
-                "ffmpeg", "-ss", str(random_start_for_initial), "-i", input_video_path,
-                "-t", str(initial_scene_actual_duration),
-                "-vf", f"scale={output_width}:{output_height}:force_original_aspect_ratio=decrease,pad={output_width}:{output_height}:(ow-iw)/2:(oh-ih)/2:color=black,setsar=1",
-                "-c:v", "libx264", "-preset", "ultrafast", "-crf", "23"
-            ] + audio_opts_for_temp_clips + ["-threads", "0", "-y", initial_clip_path]
-
-            if run_ffmpeg_command(ffmpeg_cmd_initial, "extracting initial scene", progress_callback, task_id):
-                temp_scene_files_for_concat.append(initial_clip_path)
-                actual_total_output_duration += initial_scene_actual_duration
-            else: initial_scene_actual_duration = 0 # Failed to create
-
-        # --- 3b. Generate and Select Beat-Grouped Scene Durations for Subsequent Part ---
-        beat_grouped_durations_for_rest = []
-        if len(all_beat_timestamps) > 1: # Need at least two beats to form an interval
-            # Determine start_index for grouping: if initial scene was based on first beat, start from 1st beat (index 0).
-            # If initial scene was >0 (i.e. beat_timestamps[0] > 0), then we still process from beat 0.
-            # generate_beat_grouped_scene_durations handles the intervals *between* beats.
-            start_beat_idx_for_grouping = 0
-            beat_grouped_durations_for_rest = generate_beat_grouped_scene_durations(
-                all_beat_timestamps, start_beat_idx_for_grouping, min_beat_grouped_scene_duration,
-                progress_callback, task_id
-            )
+             random_start_for_initial = pick_scene_start(input_video_duration - initial_scene_actual_duration)
 
-        selected_beat_scene_durations = []
-        target_duration_for_beat_part = max(0, target_total_output_duration_sec - actual_total_output_duration) if target_total_output_duration_sec > 0 else float('inf') # Effectively no limit if target_total_output_duration_sec is 0
-        num_beat_scenes_to_select = max(0, target_total_num_scenes - (1 if initial_scene_actual_duration > 0 else 0)) if target_total_num_scenes > 0 else float('inf')
+        scene_plan.append({"start": random_start_for_initial, "duration": initial_scene_actual_duration, "desc": "initial scene"})
+        planned_total_duration += initial_scene_actual_duration
 
-        if beat_grouped_durations_for_rest:
-            current_beat_part_duration = 0.0
-            scenes_selected_count = 0
-            for i, dur in enumerate(beat_grouped_durations_for_rest):
-                if scenes_selected_count >= num_beat_scenes_to_select:
-                    break
-                if target_total_output_duration_sec > 0: # Only apply duration limit if one is set
-                    if current_beat_part_duration + dur <= target_duration_for_beat_part:
-                        selected_beat_scene_durations.append(dur)
-                        current_beat_part_duration += dur
-                        scenes_selected_count += 1
-                    else: # Adding full `dur` would exceed target
-                        remaining_time = target_duration_for_beat_part - current_beat_part_duration
-                        if remaining_time > MIN_FINAL_SCENE_WARN: # Add a final truncated scene
-                            selected_beat_scene_durations.append(remaining_time)
-                            scenes_selected_count += 1
-                        break # Reached target duration for beat part
-                else: # No target duration, add based on scene count or all available
+    # --- 3b. Generate and Select Beat-Grouped Scene Durations for Subsequent Part ---
+    beat_grouped_durations_for_rest = []
+    if len(beat_timestamps) > 1: # Need at least two beats to form an interval
+        # Determine start_index for grouping: if initial scene was based on first beat, start from 1st beat (index 0).
+        # If initial scene was >0 (i.e. beat_timestamps[0] > 0), then we still process from beat 0.
+        # generate_beat_grouped_scene_durations handles the intervals *between* beats.
+        start_beat_idx_for_grouping = 0
+        beat_grouped_durations_for_rest = generate_beat_grouped_scene_durations_np(
+            beat_timestamps, start_beat_idx_for_grouping, min_beat_grouped_scene_duration,
+            progress_callback, task_id
+        )
+
+    selected_beat_scene_durations = []
+    target_duration_for_beat_part = max(0, target_total_output_duration_sec - planned_total_duration) if target_total_output_duration_sec > 0 else float('inf') # Effectively no limit if target_total_output_duration_sec is 0
+    num_beat_scenes_to_select = max(0, target_total_num_scenes - (1 if initial_scene_actual_duration > 0 else 0)) if target_total_num_scenes > 0 else float('inf')
+
+    if beat_grouped_durations_for_rest:
+        current_beat_part_duration = 0.0
+        scenes_selected_count = 0
+        for i, dur in enumerate(beat_grouped_durations_for_rest):
+            if scenes_selected_count >= num_beat_scenes_to_select:
+                break
+            if target_total_output_duration_sec > 0: # Only apply duration limit if one is set
+                if current_beat_part_duration + dur <= target_duration_for_beat_part:
                     selected_beat_scene_durations.append(dur)
+                    current_beat_part_duration += dur
                     scenes_selected_count += 1
-        
-        if selected_beat_scene_durations:
-            if progress_callback and task_id:
-                progress_callback(task_id, {"status": "processing", "message": f"Selected {len(selected_beat_scene_durations)} subsequent beat-synced scenes."})
-            for i, scene_duration in enumerate(selected_beat_scene_durations):
-                if scene_duration <=0: continue # Skip zero or negative duration scenes
-                scene_num_display = i + 1 + (1 if initial_scene_actual_duration > 0 else 0) # For user message
-
-                if input_video_duration < scene_duration:
-                    if progress_callback and task_id:
-                         progress_callback(task_id, {"status": "processing", "message": f"Warning: Scene {scene_num_display} duration ({scene_duration:.2f}s) is longer than input video ({input_video_duration:.2f}s). Skipping this scene."})
-                    continue # Skip if source video is too short for this scene
-
-                max_start_time = input_video_duration - scene_duration
-                random_start_in_visual_src = random.uniform(0, max_start_time if max_start_time > 0 else 0)
-                beat_scene_path = os.path.join(temp_dir, f"beat_scene_{i:03d}.mp4")
-
-                ffmpeg_cmd_beat = [
-                    "ffmpeg", "-ss", str(random_start_in_visual_src), "-i", input_video_path,
-                    "-t", str(scene_duration),
-                    "-vf", f"scale={output_width}:{output_height}:force_original_aspect_ratio=decrease,pad={output_width}:{output_height}:(ow-iw)/2:(oh-ih)/2:color=black,setsar=1",
-                    "-c:v", "libx264", "-preset", "ultrafast", "-crf", "23"
-                ] + audio_opts_for_temp_clips + ["-threads", "0", "-y", beat_scene_path]
-                if run_ffmpeg_command(ffmpeg_cmd_beat, f"extracting beat-synced scene {scene_num_display}", progress_callback, task_id):
-                    temp_scene_files_for_concat.append(beat_scene_path)
-                    actual_total_output_duration += scene_duration
-                else: pass # Error handled by run_ffmpeg_command
-
-        # --- 4. Concatenate All Clips & Optionally Add External Audio ---
-        if not temp_scene_files_for_concat:
-            if progress_callback and task_id:
-                progress_callback(task_id, {"status": "error", "message": "Error: No video clips were generated. This could be due to very short input video or restrictive parameters."})
-            raise MontageError("No video clips generated.")
-
-        concat_list_path = os.path.join(temp_dir, "concat_list.txt")
-        with open(concat_list_path, 'w') as f:
-            for p in temp_scene_files_for_concat: f.write(f"file '{os.path.relpath(p, temp_dir)}'\n") # Use relative paths for concat list
+                else: # Adding full `dur` would exceed target
+                    remaining_time = target_duration_for_beat_part - current_beat_part_duration
+                    if remaining_time > MIN_FINAL_SCENE_WARN: # Add a final truncated scene
+                        selected_beat_scene_durations.append(remaining_time)
+                        scenes_selected_count += 1
+                    break # Reached target duration for beat part
+            else: # No target duration, add based on scene count or all available
+                selected_beat_scene_durations.append(dur)
+                scenes_selected_count += 1
 
-        ffmpeg_final_cmd = ["ffmpeg", "-f", "concat", "-safe", "0", "-i", concat_list_path]
-        
-        # Make sure output directory exists
-        os.makedirs(os.path.dirname(output_video_path), exist_ok=True)
+    if selected_beat_scene_durations:
+        if progress_callback and task_id:
+            progress_callback(task_id, {"status": "processing", "message": f"Selected {len(selected_beat_scene_durations)} subsequent beat-synced scenes."})
+        for i, scene_duration in enumerate(selected_beat_scene_durations):
+            if scene_duration <=0: continue # Skip zero or negative duration scenes
+            scene_num_display = i + 1 + (1 if initial_scene_actual_duration > 0 else 0) # For user message
 
-        if audio_file_path:
-            ffmpeg_final_cmd.extend(["-i", audio_file_path]) # Add external audio as second input
-            if audio_mix_behavior == "mix":
-                if progress_callback and task_id:
-                    progress_callback(task_id, {"status": "processing", "message": f"Mixing concatenated video audio with external audio: {os.path.basename(audio_file_path)}"})
-                # Input 0 is concat video, Input 1 is external audio
-                # [0:a] is audio from concat, [1:a] is audio from external
-                ffmpeg_final_cmd.extend([
-                    "-filter_complex", "[0:a][1:a]amix=inputs=2:duration=first:dropout_transition=3[aout]", # Mix audio
-                    "-map", "0:v:0",      # Video from concat (input 0)
-                    "-map", "[aout]"      # Mixed audio output
-                ])
-                ffmpeg_final_cmd.extend(["-c:v", "libx264", "-preset", "ultrafast", "-crf", "22"]) # Re-encode video for good quality
-                ffmpeg_final_cmd.extend(["-c:a", "aac", "-b:a", "192k", "-ar", "44100"]) # Encode mixed audio
-            elif audio_mix_behavior == "replace":
+            if input_video_duration < scene_duration:
                 if progress_callback and task_id:
-                    progress_callback(task_id, {"status": "processing", "message": f"Replacing concatenated video audio with external audio: {os.path.basename(audio_file_path)}"})
-                ffmpeg_final_cmd.extend(["-map", "0:v:0", "-map", "1:a:0"]) # Video from concat, audio from external
-                ffmpeg_final_cmd.extend(["-c:v", "copy"]) # Try to copy video if compatible
-                ffmpeg_final_cmd.extend(["-c:a", "aac", "-b:a", "192k", "-ar", "44100"]) # Re-encode external audio to aac
-                ffmpeg_final_cmd.append("-shortest") # Trim to shorter of video/audio
-        else:
-            # No external audio, just copy the stream from concatenated clips (which now have audio)
-            ffmpeg_final_cmd.extend(["-c", "copy"])
+                     progress_callback(task_id, {"status": "processing", "message": f"Warning: Scene {scene_num_display} duration ({scene_duration:.2f}s) is longer than input video ({input_video_duration:.2f}s). Skipping this scene."})
+                continue # Skip if source video is too short for this scene
 
-        ffmpeg_final_cmd.extend(["-y", output_video_path])
+            max_start_time = input_video_duration - scene_duration
+            random_start_in_visual_src = pick_scene_start(max_start_time)
+            scene_plan.append({"start": random_start_in_visual_src, "duration": scene_duration, "desc": f"beat-synced scene {scene_num_display}"})
+            planned_total_duration += scene_duration
 
-        if not run_ffmpeg_command(ffmpeg_final_cmd, "final video assembly", progress_callback, task_id):
-            # Error handled by run_ffmpeg_command
-            raise MontageError("Failed to create final video.")
+    output_start = 0.0
+    for i, scene in enumerate(scene_plan):
+        scene["index"] = i
+        scene["output_start"] = output_start
+        output_start += scene["duration"]
+    return {
+        "input_duration": input_video_duration,
+        "seed": seed,
+        "total_duration": planned_total_duration,
+        "scene_count": len(scene_plan),
+        "scenes": scene_plan,
+    }
+
+def validate_scene_plan(plan, input_video_duration):
+    """Checks a (possibly user-edited) plan against the source. Returns its scene list."""
+    scenes = plan.get("scenes") if isinstance(plan, dict) else plan
+    if not isinstance(scenes, list) or not scenes:
+        raise MontageError("Scene plan has no scenes.")
+    validated_scenes = []
+    for i, scene in enumerate(scenes):
+        try:
+            start, duration = float(scene["start"]), float(scene["duration"])
+        except (KeyError, TypeError, ValueError):
+            raise MontageError(f"Scene {i} of the plan needs numeric 'start' and 'duration'.")
+        if not (math.isfinite(start) and math.isfinite(duration)) or start < 0 or duration <= 0 or start + duration > input_video_duration + 0.001: # 1 ms of rounding slack
+            raise MontageError(f"Scene {i} of the plan (start {start:.2f}s, duration {duration:.2f}s) does not fit the {input_video_duration:.2f}s source.")
+        validated_scenes.append({"start": start, "duration": duration, "desc": scene.get("desc") or f"scene {i + 1}"})
+    return validated_scenes
+
+def render_planned_scenes(
+    input_video_path, output_video_path, scene_plan, variants, source_info,
+    audio_file_path=None, audio_mix_behavior="replace", progress_callback=None, task_id=None,
+    render_engine="clips", extraction_workers=1, ffmpeg_threads=0, cut_mode="reencode", output_mode="mp4",
+    work_queue=None, work_dir=None
+):
+    # --- 4. Render the Planned Scenes & Optionally Add External Audio ---
+    # Make sure output directory exists
+    os.makedirs(os.path.dirname(output_video_path), exist_ok=True)
+    variants = [
+        dict(variant, output_path=variant_output_path(output_video_path, variants, k), copy_video=False)
+        for k, variant in enumerate(variants)
+    ]
+
+    if render_engine == "filtergraph" and output_mode == "mp4" and len(scene_plan) > FILTERGRAPH_MAX_INPUTS:
+        if progress_callback and task_id:
+            progress_callback(task_id, {"status": "processing", "message": f"{len(scene_plan)} scenes are more than the single-pass engine opens at once ({FILTERGRAPH_MAX_INPUTS}); rendering with the 'clips' engine."})
+        render_engine = "clips"
+
+    # With a work queue, clips-engine scenes are rendered by the workers, in a temp dir they share
+    distributed = work_queue is not None and render_engine == "clips" and output_mode == "mp4"
+    # Use a temporary directory that will be cleaned up
+    with tempfile.TemporaryDirectory(prefix="rhythmic_montage_", dir=work_dir if distributed else None) as temp_dir:
+        if progress_callback and task_id:
+            progress_callback(task_id, {"status": "processing", "message": f"Created temporary directory: {temp_dir}"})
+            if len(variants) > 1:
+                progress_callback(task_id, {"status": "processing", "message": f"Rendering {len(variants)} variants ({', '.join(v['resolution'] for v in variants)}) from one decode per scene."})
+
+        copy_audio = False
+        if work_queue is not None and not distributed and progress_callback and task_id:
+            progress_callback(task_id, {"status": "processing", "message": "Rendering locally: only the 'clips' engine with MP4 output runs on the render workers."})
+        if output_mode == "hls" and render_engine != "clips" and progress_callback and task_id:
+            progress_callback(task_id, {"status": "processing", "message": f"HLS output renders scene by scene; ignoring the '{render_engine}' engine."})
+        if cut_mode == "copy" and (render_engine in ("clips", "pipe") or output_mode == "hls"):
+            for variant in variants:
+                variant["copy_video"], copy_audio = stream_copy_compatibility(source_info, variant["width"], variant["height"]) # copy_audio is the same for every variant
+            copy_video = any(variant["copy_video"] for variant in variants)
+            if progress_callback and task_id:
+                progress_callback(task_id, {"status": "processing", "message": f"Fast cut mode: video {'stream-copied' if copy_video else 're-encoded (source does not match output)'}, audio {'stream-copied' if copy_audio else 're-encoded'}."})
+
+        planned_output_seconds = sum(scene["duration"] for scene in scene_plan)
+        render_started_at = time.monotonic()
+        if output_mode == "hls":
+            render_progress = RenderProgress([
+                ("extracting", 0.95, planned_output_seconds),
+                ("assembling", 0.05, planned_output_seconds * len(variants)),
+            ], progress_callback, task_id)
+            render_scenes_hls(
+                input_video_path, variants, scene_plan, temp_dir,
+                audio_file_path, audio_mix_behavior, progress_callback, task_id,
+                extraction_workers=extraction_workers, ffmpeg_threads=ffmpeg_threads, copy_audio=copy_audio,
+                source_has_audio=source_info["has_audio"] if source_info else None,
+                render_progress=render_progress
+            )
+        elif render_engine == "filtergraph":
+            render_progress = RenderProgress([("rendering", 1.0, planned_output_seconds)], progress_callback, task_id)
+            render_scenes_filtergraph(
+                input_video_path, variants, scene_plan, temp_dir,
+                audio_file_path, audio_mix_behavior, progress_callback, task_id,
+                ffmpeg_threads=ffmpeg_threads,
+                source_has_audio=source_info["has_audio"] if source_info else None,
+                render_progress=render_progress
+            )
+        elif render_engine == "pipe":
+            render_progress = RenderProgress([("rendering", 1.0, planned_output_seconds)], progress_callback, task_id)
+            render_scenes_pipe(
+                input_video_path, variants, scene_plan, temp_dir,
+                audio_file_path, audio_mix_behavior, progress_callback, task_id,
+                extraction_workers=extraction_workers, ffmpeg_threads=ffmpeg_threads,
+                copy_audio=copy_audio, render_progress=render_progress
+            )
+        else:
+            # Stream-copied extraction is cheap next to an assembly pass that re-encodes (mix mode)
+            extraction_weight = 0.85 if not all(variant["copy_video"] for variant in variants) else 0.5
+            render_progress = RenderProgress([
+                ("extracting", extraction_weight, planned_output_seconds),
+                ("assembling", 1.0 - extraction_weight, planned_output_seconds * len(variants)),
+            ], progress_callback, task_id)
+            if distributed:
+                render_scenes_distributed(
+                    input_video_path, variants, scene_plan, temp_dir, work_queue,
+                    audio_file_path, audio_mix_behavior, progress_callback, task_id,
+                    ffmpeg_threads=ffmpeg_threads, copy_audio=copy_audio, render_progress=render_progress
+                )
+            else:
+                render_scenes_clips(
+                    input_video_path, variants, scene_plan, temp_dir,
+                    audio_file_path, audio_mix_behavior, progress_callback, task_id,
+                    extraction_workers=extraction_workers, ffmpeg_threads=ffmpeg_threads,
+                    copy_audio=copy_audio, render_progress=render_progress
+                )
+        render_wall_time = time.monotonic() - render_started_at
 
         if progress_callback and task_id:
-            final_duration_check = get_video_duration(output_video_path, progress_callback, task_id)
+            with stage_span("final_probe"):
+                final_duration_check = get_video_duration(output_video_path, progress_callback, task_id)
             message = f"Output video created: {os.path.basename(output_video_path)}"
             if final_duration_check:
                 message += f" (Duration: {final_duration_check:.2f}s)"
-            progress_callback(task_id, {"status": "completed", "message": message, "output_file": output_video_path})
+            if len(variants) > 1:
+                message += f" and {len(variants) - 1} more variant{'s' if len(variants) > 2 else ''}"
+            message += f" [{len(scene_plan)} scenes, '{'hls' if output_mode == 'hls' else render_engine}' engine, rendered in {render_wall_time:.1f}s]"
+            completed_update = {"status": "completed", "message": message, "output_file": output_video_path, "progress": 100.0}
+            if len(variants) > 1:
+                completed_update["variants"] = [{"resolution": v["resolution"], "output_file": v["output_path"]} for v in variants]
+            progress_callback(task_id, completed_update)
 
         return output_video_path # Return path on success
 
     # Temp dir is cleaned up automatically when 'with' block exits
-    # No explicit cleanup needed here for temp_dir
\ No newline at end of file
+    # No explicit cleanup needed here for temp_dir
+
+def render_montage_from_plan(
+    input_video_path, output_video_path, plan, output_resolution_str,
+    audio_file_path=None, audio_mix_behavior="replace",
+    progress_callback=None, task_id=None,
+    render_engine="clips", extraction_workers=1, ffmpeg_threads=0,
+    media_index=None, cut_mode="reencode", proxy_cache=None, output_mode="mp4",
+    work_queue=None, work_dir=None
+):
+    """Renders a plan produced by plan_montage_scenes (e.g. tuned through the /plan endpoint)."""
+    variants = validate_render_options(
+        input_video_path, output_resolution_str, audio_file_path, audio_mix_behavior,
+        render_engine, cut_mode, extraction_workers, ffmpeg_threads, progress_callback, task_id, output_mode
+    )
+    source_path = input_video_path
+    with stage_span("probe"):
+        input_video_path, source_info = resolve_render_source(
+            input_video_path, variants[0]["width"], variants[0]["height"], media_index,
+            proxy_cache if len(variants) == 1 else None, # A proxy is scaled for one output size only
+            progress_callback, task_id
+        )
+    try:
+        try:
+            scene_plan = validate_scene_plan(plan, source_info["duration"])
+        except MontageError as e:
+            if progress_callback and task_id:
+                progress_callback(task_id, {"status": "error", "message": f"Error: {e}"})
+            raise
+        return render_planned_scenes(
+            input_video_path, output_video_path, scene_plan, variants, source_info,
+            audio_file_path, audio_mix_behavior, progress_callback, task_id,
+            render_engine, extraction_workers, ffmpeg_threads, cut_mode, output_mode, work_queue, work_dir
+        )
+    finally:
+        if input_video_path != source_path: # A pinned proxy replaced the source
+            proxy_cache.release(input_video_path)
+
+def create_rhythmic_montage_ffmpeg(
+    input_video_path, output_video_path, label_file_path,
+    output_resolution_str, target_total_output_duration_sec, target_total_num_scenes,
+    min_beat_grouped_scene_duration, audio_file_path=None, audio_mix_behavior="replace",
+    progress_callback=None, task_id=None, # Added for progress
+    render_engine="clips", extraction_workers=1, ffmpeg_threads=0,
+    media_index=None, # Optional MediaIndex; probe results are then read from / stored in the index
+    cut_mode="reencode",
+    proxy_cache=None, # Optional ProxyCache; a ready proxy at the output resolution replaces the source
+    seed=None, # Same seed + same inputs/options -> same scene plan
+    beat_detector=None, # Optional BeatCache; without a label file, beats are detected from the audio
+    output_mode="mp4", # "hls" also publishes a live playlist next to the output while rendering
+    work_queue=None, # Optional job_queue.WorkQueue; clips-engine scenes are then rendered by standalone workers
+    work_dir=None, # Folder for the scene clips that every worker mounts at the same path; default: local temp dir
+    label_cache=None # Optional LabelCache; label files shared by many jobs are parsed once
+):
+    beat_source_path = audio_file_path or input_video_path # Before a proxy may replace the input
+    variants = validate_render_options(
+        input_video_path, output_resolution_str, audio_file_path, audio_mix_behavior,
+        render_engine, cut_mode, extraction_workers, ffmpeg_threads, progress_callback, task_id, output_mode
+    )
+    source_path = input_video_path
+    with stage_span("probe"):
+        input_video_path, source_info = resolve_render_source(
+            input_video_path, variants[0]["width"], variants[0]["height"], media_index,
+            proxy_cache if len(variants) == 1 else None, # A proxy is scaled for one output size only
+            progress_callback, task_id
+        )
+    try:
+        keyframe_times = None
+        if cut_mode == "copy":
+            with stage_span("keyframes"):
+                keyframe_times = load_keyframe_times(input_video_path, media_index, progress_callback, task_id)
+
+        # --- 2. Parse Audacity Labels (or detect beats when there are none) ---
+        if label_file_path:
+            if progress_callback and task_id:
+                progress_callback(task_id, {"status": "processing", "message": f"Parsing Audacity labels: {os.path.basename(label_file_path)}..."})
+            with stage_span("labels"):
+                if label_cache is not None:
+                    all_beat_timestamps = label_cache.parse(label_file_path, progress_callback, task_id)
+                else:
+                    all_beat_timestamps = parse_audacity_labels_np(label_file_path, progress_callback, task_id)
+            if all_beat_timestamps is None: return # Error handled in parse_audacity_labels
+        elif beat_detector is not None:
+            with stage_span("beat_detection"):
+                all_beat_timestamps = beat_detector.get_beats(beat_source_path, progress_callback, task_id)
+        else:
+            if progress_callback and task_id:
+                progress_callback(task_id, {"status": "error", "message": "Error: A label file is required when beat detection is not available."})
+            raise MontageError("No label file given and no beat detector available.")
+
+        # --- 3. Plan the Output Structure ---
+        with stage_span("planning"):
+            plan = plan_montage_scenes(
+                source_info["duration"], all_beat_timestamps, target_total_output_duration_sec, target_total_num_scenes,
+                min_beat_grouped_scene_duration, seed, keyframe_times, progress_callback, task_id
+            )
+        if not plan["scenes"]:
+            if progress_callback and task_id:
+                progress_callback(task_id, {"status": "error", "message": "Error: No video clips were generated. This could be due to very short input video or restrictive parameters."})
+            raise MontageError("No video clips generated.")
+
+        return render_planned_scenes(
+            input_video_path, output_video_path, plan["scenes"], variants, source_info,
+            audio_file_path, audio_mix_behavior, progress_callback, task_id,
+            render_engine, extraction_workers, ffmpeg_threads, cut_mode, output_mode, work_queue, work_dir
+        )
+    finally:
+        if input_video_path != source_path: # A pinned proxy replaced the source
+            proxy_cache.release(input_video_path)
+
+COMMANDS = {"worker": "render_worker", "batch": "batch"} # Subcommand -> module whose main(argv) runs it, imported on use
+
+def main(argv=None):
+    """Entry point of `python -m montage_maker <command> ...`."""
+    import sys
+    import importlib
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in COMMANDS:
+        print(f"usage: python -m montage_maker {{{','.join(COMMANDS)}}} [options]", file=sys.stderr)
+        return 2
+    return importlib.import_module(COMMANDS[argv[0]]).main(argv[1:])
+
+if __name__ == "__main__":
+    raise SystemExit(main())
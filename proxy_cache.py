@@ -0,0 +1,139 @@
+# proxy_cache.py
+import os
+import time
+import queue
+import hashlib
+import threading
+import logging
+
+import montage_maker
+
+logger = logging.getLogger(__name__)
+
+class ProxyCache:
+    """Resolution-specific mezzanine transcodes of source videos, with LRU size-based eviction.
+
+    A proxy is already scaled/padded to the target resolution and encoded with a short,
+    fixed GOP, so montage scenes cut from it seek quickly and skip the full-resolution decode.
+    Proxy names embed a digest of the source path, size and mtime, so a changed source
+    never matches a stale proxy; stale files simply age out of the cache. A proxy handed
+    out by acquire() is never evicted before the matching release().
+    """
+    def __init__(self, proxy_folder, max_total_bytes, gop_size=12, build_threads=2):
+        self.proxy_folder = proxy_folder
+        self.max_total_bytes = max_total_bytes
+        self.gop_size = gop_size
+        self.build_threads = build_threads
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._pins = {} # proxy path -> number of renders reading it
+        self._build_queue = queue.Queue()
+        self._builder_thread = None
+        os.makedirs(proxy_folder, exist_ok=True)
+
+    def proxy_path_for(self, source_path, output_width, output_height):
+        stat_result = os.stat(source_path)
+        digest = hashlib.sha1(f"{os.path.abspath(source_path)}|{stat_result.st_size}|{stat_result.st_mtime}".encode()).hexdigest()[:12]
+        stem = os.path.splitext(os.path.basename(source_path))[0]
+        return os.path.join(self.proxy_folder, f"{stem}.{output_width}x{output_height}.{digest}.mp4")
+
+    def lookup(self, source_path, output_width, output_height):
+        """Path of a ready proxy for this source and resolution, or None. Marks the proxy as recently used."""
+        try:
+            proxy_path = self.proxy_path_for(source_path, output_width, output_height)
+        except OSError:
+            return None
+        if not os.path.isfile(proxy_path):
+            return None
+        try:
+            os.utime(proxy_path) # mtime doubles as the LRU timestamp
+        except OSError:
+            return None
+        return proxy_path
+
+    def acquire(self, source_path, output_width, output_height):
+        """Like lookup(), but pins the proxy until release(proxy_path), so eviction leaves it alone."""
+        with self._lock:
+            proxy_path = self.lookup(source_path, output_width, output_height)
+            if proxy_path:
+                self._pins[proxy_path] = self._pins.get(proxy_path, 0) + 1
+            return proxy_path
+
+    def release(self, proxy_path):
+        with self._lock:
+            remaining = self._pins.get(proxy_path, 0) - 1
+            if remaining > 0:
+                self._pins[proxy_path] = remaining
+            else:
+                self._pins.pop(proxy_path, None)
+
+    def build(self, source_path, output_width, output_height, progress_callback=None, task_id=None):
+        proxy_path = self.proxy_path_for(source_path, output_width, output_height)
+        if os.path.isfile(proxy_path):
+            return proxy_path
+        partial_path = proxy_path + ".partial.mp4"
+        ffmpeg_cmd = [
+            "ffmpeg", "-i", source_path,
+            "-vf", montage_maker.scale_pad_filter(output_width, output_height),
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "20", "-pix_fmt", "yuv420p",
+            "-g", str(self.gop_size), "-keyint_min", str(self.gop_size), "-sc_threshold", "0",
+            "-c:a", "aac", "-b:a", "128k", "-ar", "44100",
+            "-movflags", "+faststart", "-threads", str(self.build_threads), "-y", partial_path
+        ]
+        try:
+            montage_maker.run_ffmpeg_command(ffmpeg_cmd, f"building {output_width}x{output_height} proxy of {os.path.basename(source_path)}", progress_callback, task_id, stage="proxy_build")
+            os.replace(partial_path, proxy_path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        self.evict()
+        return proxy_path
+
+    def request_build(self, source_path, output_width, output_height):
+        """Queue a background proxy build unless one exists or is already pending."""
+        key = (os.path.abspath(source_path), output_width, output_height)
+        with self._lock:
+            if key in self._pending or self.lookup(source_path, output_width, output_height):
+                return False
+            self._pending.add(key)
+            if self._builder_thread is None:
+                self._builder_thread = threading.Thread(target=self._builder_loop, name="proxy_builder", daemon=True)
+                self._builder_thread.start()
+        self._build_queue.put(key)
+        return True
+
+    def _builder_loop(self):
+        while True:
+            key = self._build_queue.get()
+            source_path, output_width, output_height = key
+            try:
+                started_at = time.monotonic()
+                proxy_path = self.build(source_path, output_width, output_height)
+                logger.info(f"Built proxy {os.path.basename(proxy_path)} in {time.monotonic() - started_at:.1f}s")
+            except Exception as e:
+                logger.warning(f"Proxy build failed for '{source_path}' at {output_width}x{output_height}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+    def evict(self):
+        """Delete least recently used proxies until the cache fits in max_total_bytes. Pinned proxies stay."""
+        with self._lock: # Held throughout, so acquire() cannot pin a proxy that is being deleted
+            proxies = []
+            with os.scandir(self.proxy_folder) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.endswith(".mp4") and not entry.name.endswith(".partial.mp4"):
+                        stat_result = entry.stat()
+                        proxies.append((stat_result.st_mtime, stat_result.st_size, entry.path))
+            total_bytes = sum(size for _, size, _ in proxies)
+            for _, size, path in sorted(proxies):
+                if total_bytes <= self.max_total_bytes:
+                    break
+                if path in self._pins:
+                    continue
+                try:
+                    os.remove(path)
+                    total_bytes -= size
+                    logger.info(f"Evicted proxy {os.path.basename(path)}")
+                except OSError as e:
+                    logger.warning(f"Could not evict proxy '{path}': {e}")
@@ -0,0 +1,123 @@
+# render_cache.py
+import os
+import json
+import shutil
+import hashlib
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+# Options that change how fast a montage renders but not what it looks like
+NON_OUTPUT_OPTIONS = {"extraction_workers", "ffmpeg_threads", "audio_file_path"}
+
+_file_hash_memo = {} # (abs path, size, mtime_ns) -> sha256 hex digest
+_file_hash_lock = threading.Lock()
+
+def file_content_hash(path):
+    """SHA-256 of a file's content, memoized for as long as its size and mtime are unchanged."""
+    abs_path = os.path.abspath(path)
+    stat_result = os.stat(abs_path)
+    memo_key = (abs_path, stat_result.st_size, stat_result.st_mtime_ns)
+    with _file_hash_lock:
+        if memo_key in _file_hash_memo:
+            return _file_hash_memo[memo_key]
+    digest = hashlib.sha256()
+    with open(abs_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    with _file_hash_lock:
+        _file_hash_memo[memo_key] = digest.hexdigest()
+    return _file_hash_memo[memo_key]
+
+def remember_file_hash(path, digest):
+    """Seed the memo with a digest computed elsewhere (e.g. while a file was uploaded)."""
+    abs_path = os.path.abspath(path)
+    stat_result = os.stat(abs_path)
+    with _file_hash_lock:
+        _file_hash_memo[(abs_path, stat_result.st_size, stat_result.st_mtime_ns)] = digest
+
+def link_or_copy(src_path, dest_path):
+    """Hardlink src_path to dest_path, copying when the two are on different filesystems."""
+    if os.path.exists(dest_path):
+        os.remove(dest_path)
+    try:
+        os.link(src_path, dest_path)
+    except OSError:
+        shutil.copy2(src_path, dest_path)
+
+class RenderCache:
+    """Content-addressed store of finished montages with LRU size-based eviction.
+
+    The key covers the content of every input file and every output-affecting option,
+    including the seed, so an identical request can reuse an earlier render.
+    """
+    def __init__(self, cache_folder, max_total_bytes):
+        self.cache_folder = cache_folder
+        self.max_total_bytes = max_total_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_folder, exist_ok=True)
+
+    @staticmethod
+    def make_key(video_path, label_path, audio_path, options, video_hash=None):
+        """Cache key of a render. video_hash, when known (e.g. persisted by the media index), spares re-reading the video."""
+        key_material = {
+            "video": video_hash or file_content_hash(video_path),
+            "labels": file_content_hash(label_path) if label_path else None,
+            "audio": file_content_hash(audio_path) if audio_path else None,
+            "options": {k: v for k, v in options.items() if k not in NON_OUTPUT_OPTIONS},
+        }
+        return hashlib.sha256(json.dumps(key_material, sort_keys=True).encode()).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_folder, f"{key}.mp4")
+
+    def lookup(self, key):
+        """Path of the cached render for key, or None. Marks the entry as recently used."""
+        entry_path = self._entry_path(key)
+        with self._lock:
+            if not os.path.isfile(entry_path):
+                return None
+            os.utime(entry_path) # mtime doubles as the LRU timestamp
+        return entry_path
+
+    def materialize(self, key, dest_path):
+        """Place the cached render for key at dest_path. Returns False on a cache miss."""
+        entry_path = self.lookup(key)
+        if not entry_path:
+            return False
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        try:
+            link_or_copy(entry_path, dest_path)
+        except OSError as e: # Evicted between lookup() and the link
+            logger.info(f"Cached render {os.path.basename(entry_path)} vanished before use: {e}")
+            return False
+        return True
+
+    def store(self, key, output_path):
+        entry_path = self._entry_path(key)
+        partial_path = entry_path + ".partial"
+        link_or_copy(output_path, partial_path)
+        os.replace(partial_path, entry_path)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used renders until the cache fits in max_total_bytes."""
+        with self._lock:
+            entries = []
+            with os.scandir(self.cache_folder) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith(".mp4"):
+                        stat_result = entry.stat()
+                        entries.append((stat_result.st_mtime, stat_result.st_size, entry.path))
+            total_bytes = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total_bytes <= self.max_total_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total_bytes -= size
+                    logger.info(f"Evicted cached render {os.path.basename(path)}")
+                except OSError as e:
+                    logger.warning(f"Could not evict cached render '{path}': {e}")
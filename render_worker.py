@@ -0,0 +1,146 @@
+# render_worker.py
+"""Standalone render worker: runs the scene extraction and assembly jobs of distributed montages.
+
+Usage: python -m montage_maker worker --queue redis://host:6379/0 [--concurrency 4] [--metrics-port 9101]
+
+Inputs, outputs and the coordinator's WORK_FOLDER must be mounted at the same paths as on
+the coordinator.
+"""
+import argparse
+import logging
+import os
+import socket
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import montage_maker
+import job_queue
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 60 # A job whose worker stopped heartbeating for this long is handed to another worker
+HEARTBEAT_INTERVAL = 10
+CLAIM_WAIT_SECONDS = 5
+
+WORKER_JOBS = metrics.counter("montage_worker_jobs_total", "Work queue jobs run by this worker, by kind and outcome.", ["kind", "outcome"])
+WORKER_BUSY = metrics.gauge("montage_worker_busy_slots", "Worker slots currently running a job.")
+
+def run_job(job):
+    """Runs one work queue job in this process. Raises MontageError on failure."""
+    payload = job["payload"]
+    if job["kind"] == "extract_scene":
+        filter_parts, variant_opts = montage_maker.scene_output_options(payload["variants"], payload["copy_audio"], payload["ffmpeg_threads"])
+        cmd = montage_maker.scene_extraction_command(
+            payload["input_video_path"], payload["scene"], filter_parts, variant_opts, [["-y", path] for path in payload["output_paths"]]
+        )
+        montage_maker.run_ffmpeg_command(cmd, f"extracting {payload['scene']['desc']}", task_id=job["job_id"], stage="extract_scene")
+    elif job["kind"] == "assemble":
+        variant = payload["variant"]
+        cmd = montage_maker.concat_assembly_command(payload["concat_list_path"], variant, payload["audio_file_path"], payload["audio_mix_behavior"])
+        montage_maker.run_ffmpeg_command(cmd, f"final {variant['resolution']} video assembly", task_id=job["job_id"], stage="assemble")
+    else:
+        raise montage_maker.MontageError(f"Unknown work queue job kind '{job['kind']}'.")
+
+class RenderWorker:
+    """Claims jobs from a WorkQueue with concurrency parallel slots until stopped."""
+    def __init__(self, work_queue, concurrency=1, worker_id=None, lease_seconds=LEASE_SECONDS):
+        self.work_queue = work_queue
+        self.concurrency = concurrency
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.lease_seconds = lease_seconds
+        self.stop_event = threading.Event()
+
+    def run(self):
+        slots = [threading.Thread(target=self._slot_loop, args=(f"{self.worker_id}/{i}",), name=f"render_worker_{i}", daemon=True) for i in range(self.concurrency)]
+        for slot in slots:
+            slot.start()
+        logger.info(f"Render worker {self.worker_id} running {self.concurrency} slot(s).")
+        for slot in slots:
+            slot.join()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _slot_loop(self, slot_id):
+        while not self.stop_event.is_set():
+            try:
+                job = self.work_queue.claim(slot_id, self.lease_seconds, wait_seconds=CLAIM_WAIT_SECONDS)
+            except Exception:
+                logger.exception("Claiming a job failed")
+                self.stop_event.wait(CLAIM_WAIT_SECONDS)
+                continue
+            if job is not None:
+                self._execute(slot_id, job)
+
+    def _keep_lease(self, slot_id, job, control, finished):
+        """Heartbeats until finished is set; cancels the job once the queue says it is no longer ours."""
+        while not finished.wait(HEARTBEAT_INTERVAL):
+            try:
+                if not self.work_queue.heartbeat(job["job_id"], slot_id, self.lease_seconds):
+                    control.cancel("The montage was cancelled or the job was handed to another worker.")
+                    return
+            except Exception:
+                logger.exception(f"Heartbeat of job {job['job_id']} failed")
+
+    def _execute(self, slot_id, job):
+        job_id = job["job_id"]
+        control = montage_maker.start_job(job_id) # Heartbeat failures and stage timeouts stop its ffmpeg
+        finished = threading.Event()
+        threading.Thread(target=self._keep_lease, args=(slot_id, job, control, finished), daemon=True).start()
+        WORKER_BUSY.inc()
+        try:
+            run_job(job)
+        except Exception as e:
+            outcome = "cancelled" if control.cancelled else "failed"
+            logger.warning(f"Job {job_id} ({job['kind']}, attempt {job['attempts']}) {outcome}: {e}")
+            if not control.cancelled:
+                self.work_queue.fail(job_id, slot_id, e)
+        else:
+            outcome = "completed"
+            self.work_queue.complete(job_id, slot_id)
+        finally:
+            finished.set()
+            montage_maker.finish_job(job_id)
+            WORKER_BUSY.dec()
+        WORKER_JOBS.inc(kind=job["kind"], outcome=outcome)
+
+def serve_metrics(port):
+    """Prometheus /metrics of this worker process on a background thread."""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.REGISTRY.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", metrics.CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args): # Scrapes would flood the worker log
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="worker_metrics", daemon=True).start()
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m montage_maker worker", description=__doc__.splitlines()[0])
+    parser.add_argument("--queue", default=os.environ.get("WORK_QUEUE_URL"), help="sqlite:///path or redis://host:port/db (default: $WORK_QUEUE_URL)")
+    parser.add_argument("--concurrency", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="Jobs run in parallel (default: half the CPUs)")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port")
+    args = parser.parse_args(argv)
+    if not args.queue:
+        parser.error("--queue or $WORK_QUEUE_URL is required")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    worker = RenderWorker(job_queue.open_work_queue(args.queue), args.concurrency)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+    return 0
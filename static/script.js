@@ -9,10 +9,12 @@ document.addEventListener('DOMContentLoaded', () => {
     const progressSection = document.getElementById('progress-section');
     const progressBar = document.getElementById('progress-bar');
     const progressText = document.getElementById('progress-text');
+    const cancelButton = document.getElementById('cancel-button');
     const videoPlayerContainer = document.getElementById('video-player-container');
     const outputVideoPlayer = document.getElementById('output-video-player');
     const downloadLinkContainer = document.getElementById('download-link-container');
     const downloadLink = document.getElementById('download-link');
+    const variantLinks = document.getElementById('variant-links');
 
     const inputVideoUrl = document.getElementById('input_video_url');
     const inputVideoFile = document.getElementById('input_video_file');
@@ -74,10 +76,21 @@ document.addEventListener('DOMContentLoaded', () => {
         progressText.textContent = 'Initializing and uploading...';
         videoPlayerContainer.style.display = 'none';
         downloadLinkContainer.style.display = 'none';
+        stopHlsPreview();
 
         const formData = new FormData(form);
+        formData.append('cancel_when_abandoned', '1'); // The server stops the job if this page goes away
 
         try {
+            // Large videos go through the resumable chunked upload API instead of one multipart body
+            const videoFile = inputVideoFile.files[0];
+            if (videoFile) {
+                const uploadId = await uploadInChunks(videoFile);
+                formData.delete('input_video_file');
+                formData.append('upload_id', uploadId);
+                progressText.textContent = 'Upload complete. Starting montage...';
+            }
+
             const response = await fetch('/create_montage', {
                 method: 'POST',
                 body: formData,
@@ -99,7 +112,9 @@ document.addEventListener('DOMContentLoaded', () => {
             if (data.task_id) {
                 taskId = data.task_id;
                 progressText.textContent = data.message || 'Processing started.';
-                pollProgress();
+                cancelButton.style.display = 'inline-block';
+                cancelButton.disabled = false;
+                subscribeProgress();
             } else {
                 throw new Error("Server did not return a task ID.");
             }
@@ -114,43 +129,182 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    const UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024;
+    const UPLOAD_MAX_RETRIES = 5;
+
+    async function uploadInChunks(file) {
+        const createResponse = await fetch('/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size }),
+        });
+        const created = await createResponse.json();
+        if (!createResponse.ok) throw new Error(created.error || 'Could not start upload.');
+
+        const uploadId = created.upload_id;
+        let offset = 0;
+        let retries = 0;
+        while (offset < file.size) {
+            try {
+                const chunk = file.slice(offset, offset + UPLOAD_CHUNK_SIZE);
+                const response = await fetch(`/uploads/${uploadId}?offset=${offset}`, { method: 'PUT', body: chunk });
+                const data = await response.json();
+                if (response.status === 409 && typeof data.offset === 'number') {
+                    offset = data.offset; // Server has a different view of what arrived; resume from there
+                    continue;
+                }
+                if (!response.ok) throw new Error(data.error || `Upload failed (${response.status}).`);
+                offset = data.offset;
+                retries = 0;
+                const percent = Math.round((offset / file.size) * 100);
+                progressBar.style.width = percent + '%';
+                progressText.textContent = `Uploading video... ${percent}%`;
+            } catch (error) {
+                if (++retries > UPLOAD_MAX_RETRIES) throw error;
+                progressText.textContent = `Connection problem, resuming upload (attempt ${retries})...`;
+                await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+                try {
+                    const statusResponse = await fetch(`/uploads/${uploadId}`);
+                    if (statusResponse.ok) offset = (await statusResponse.json()).offset;
+                } catch (e) { /* Keep the last known offset and retry */ }
+            }
+        }
+
+        const completeResponse = await fetch(`/uploads/${uploadId}/complete`, { method: 'POST' });
+        const completed = await completeResponse.json();
+        if (!completeResponse.ok) throw new Error(completed.error || 'Could not finish upload.');
+        return uploadId;
+    }
+
+    cancelButton.addEventListener('click', async () => {
+        if (!taskId) return;
+        cancelButton.disabled = true;
+        try {
+            const response = await fetch(`/task/${taskId}`, { method: 'DELETE' });
+            const data = await response.json();
+            if (response.status === 200) handleStatusUpdate(data); // Removed from the queue
+            else if (response.status === 202) progressText.textContent = data.message; // The event stream reports the end
+        } catch (error) {
+            console.error('Cancel error:', error);
+            cancelButton.disabled = false;
+        }
+    });
+
+    // Closing or leaving the page cancels the running job instead of leaving it to burn CPU
+    window.addEventListener('pagehide', () => {
+        if (taskId) navigator.sendBeacon(`/task/${taskId}/cancel`);
+    });
+
+    let eventSource = null;
+    let hlsPlayer = null;
+    let hlsPreviewUrl = null;
+
+    // Plays the live playlist of an output_mode=hls task while later scenes still render
+    function startHlsPreview(url) {
+        if (hlsPreviewUrl === url) return;
+        stopHlsPreview();
+        if (window.Hls && Hls.isSupported()) {
+            hlsPlayer = new Hls();
+            hlsPlayer.loadSource(url);
+            hlsPlayer.attachMedia(outputVideoPlayer);
+        } else if (outputVideoPlayer.canPlayType('application/vnd.apple.mpegurl')) {
+            outputVideoPlayer.src = url; // Native HLS (Safari)
+        } else {
+            return;
+        }
+        hlsPreviewUrl = url;
+        videoPlayerContainer.style.display = 'block';
+    }
+
+    function stopHlsPreview() {
+        if (hlsPlayer) { hlsPlayer.destroy(); hlsPlayer = null; }
+        hlsPreviewUrl = null;
+    }
+
+    function handleStatusUpdate(data) {
+        if (!data || data.task_id !== taskId) return;
+
+        if (data.hls_playlist && data.status !== 'error') {
+            startHlsPreview(`/hls/${data.task_id}/${data.hls_playlist}`);
+        }
+        progressText.textContent = data.message || '...';
+        if (data.status === 'processing' && typeof data.progress === 'number') {
+            const stageInfo = data.stage ? ` (${data.stage}${data.fps ? `, ${data.fps.toFixed(0)} fps` : ''})` : '';
+            progressBar.style.width = Math.min(data.progress, 99) + '%';
+            progressText.textContent = `${data.progress.toFixed(0)}%${stageInfo} - ${data.message || '...'}`;
+        } else if (data.status === 'completed') {
+            stopProgressUpdates();
+            cancelButton.style.display = 'none';
+            progressBar.style.width = '100%';
+            progressBar.style.backgroundColor = '#2ecc71';
+            if (data.output_file && data.task_id) {
+                const videoFileName = data.output_file;
+                if (!hlsPreviewUrl) { // A finished HLS preview already plays the whole montage
+                    outputVideoPlayer.src = `/stream/${data.task_id}/${videoFileName}`;
+                }
+                videoPlayerContainer.style.display = 'block';
+                downloadLink.href = `/download/${data.task_id}/${videoFileName}`;
+                variantLinks.innerHTML = '';
+                (data.variants || []).slice(1).forEach(variant => { // The first variant is the main download
+                    const link = document.createElement('a');
+                    link.className = 'button';
+                    link.href = `/download/${data.task_id}/${variant.output_file}`;
+                    link.download = '';
+                    link.textContent = `Download ${variant.resolution}`;
+                    variantLinks.appendChild(link);
+                });
+                downloadLinkContainer.style.display = 'block';
+            }
+            submitButton.disabled = false;
+            submitButton.textContent = 'Create Another';
+            taskId = null;
+        } else if (data.status === 'error' || data.status === 'cancelled') {
+            stopProgressUpdates();
+            cancelButton.style.display = 'none';
+            if (data.status === 'cancelled') { // Partial outputs, HLS segments included, are deleted
+                stopHlsPreview();
+                videoPlayerContainer.style.display = 'none';
+            }
+            progressBar.style.width = '100%';
+            progressBar.style.backgroundColor = data.status === 'cancelled' ? '#7f8c8d' : '#e74c3c';
+            submitButton.disabled = false;
+            submitButton.textContent = 'Try Again';
+            taskId = null;
+        }
+    }
+
+    function stopProgressUpdates() {
+        if (eventSource) { eventSource.close(); eventSource = null; }
+        if (pollInterval) { clearInterval(pollInterval); pollInterval = null; }
+    }
+
+    // Server-Sent Events push every status change; polling is only the fallback
+    function subscribeProgress() {
+        stopProgressUpdates();
+        if (!window.EventSource) return pollProgress();
+        eventSource = new EventSource(`/events/${taskId}`);
+        eventSource.onmessage = (event) => {
+            try {
+                handleStatusUpdate(JSON.parse(event.data));
+            } catch (error) {
+                console.error('Event stream error:', error);
+            }
+        };
+        eventSource.onerror = () => {
+            if (!taskId) return stopProgressUpdates();
+            console.warn('Event stream lost, falling back to polling.');
+            pollProgress();
+        };
+    }
+
     function pollProgress() {
-        if (pollInterval) clearInterval(pollInterval);
+        stopProgressUpdates();
         pollInterval = setInterval(async () => {
-            if (!taskId) return clearInterval(pollInterval);
+            if (!taskId) return stopProgressUpdates();
             try {
                 const response = await fetch(`/status/${taskId}`);
                 if (!response.ok) return; // Don't stop polling for a single network hiccup
-                const data = await response.json();
-                if (!data || data.task_id !== taskId) return;
-
-                progressText.textContent = data.message || '...';
-                
-                if (data.status === 'processing') {
-                    let currentWidth = parseFloat(progressBar.style.width) || 0;
-                    progressBar.style.width = (currentWidth < 95 ? currentWidth + 2 : 95) + '%';
-                } else if (data.status === 'completed') {
-                    clearInterval(pollInterval);
-                    progressBar.style.width = '100%';
-                    progressBar.style.backgroundColor = '#2ecc71';
-                    if (data.output_file && data.task_id) {
-                        const videoFileName = data.output_file;
-                        outputVideoPlayer.src = `/stream/${data.task_id}/${videoFileName}`;
-                        videoPlayerContainer.style.display = 'block';
-                        downloadLink.href = `/download/${data.task_id}/${videoFileName}`;
-                        downloadLinkContainer.style.display = 'block';
-                    }
-                    submitButton.disabled = false;
-                    submitButton.textContent = 'Create Another';
-                    taskId = null;
-                } else if (data.status === 'error') {
-                    clearInterval(pollInterval);
-                    progressBar.style.width = '100%';
-                    progressBar.style.backgroundColor = '#e74c3c';
-                    submitButton.disabled = false;
-                    submitButton.textContent = 'Try Again';
-                    taskId = null;
-                }
+                handleStatusUpdate(await response.json());
             } catch (error) {
                 console.error('Polling error:', error);
             }
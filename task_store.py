@@ -0,0 +1,146 @@
+# task_store.py
+import abc
+import json
+import time
+import sqlite3
+import threading
+
+FINISHED_STATUSES = ("completed", "error", "cancelled")
+
+class TaskStore(abc.ABC):
+    """Interface of the task status store used by app.py."""
+    @abc.abstractmethod
+    def create(self, task_id, task):
+        """Store a new task dict under task_id."""
+
+    @abc.abstractmethod
+    def get(self, task_id):
+        """Copy of the task dict, or None."""
+
+    @abc.abstractmethod
+    def update(self, task_id, changes):
+        """Merge changes into an existing task. Returns False if the task does not exist."""
+
+    @abc.abstractmethod
+    def delete(self, task_id):
+        """Forget the task; unknown ids are ignored."""
+
+    @abc.abstractmethod
+    def expire(self, ttl_sec):
+        """Delete finished tasks not updated for ttl_sec. Returns the removed task ids."""
+
+    @abc.abstractmethod
+    def unfinished_task_ids(self):
+        """Ids of the tasks whose status is not in FINISHED_STATUSES."""
+
+class MemoryTaskStore(TaskStore):
+    """Process-local store; state is lost on restart."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks = {} # task_id -> (updated_at, task dict)
+
+    def create(self, task_id, task):
+        with self._lock:
+            self._tasks[task_id] = (time.time(), dict(task))
+
+    def get(self, task_id):
+        with self._lock:
+            entry = self._tasks.get(task_id)
+            return dict(entry[1]) if entry else None
+
+    def update(self, task_id, changes):
+        with self._lock:
+            entry = self._tasks.get(task_id)
+            if not entry:
+                return False
+            entry[1].update(changes)
+            self._tasks[task_id] = (time.time(), entry[1])
+            return True
+
+    def delete(self, task_id):
+        with self._lock:
+            self._tasks.pop(task_id, None)
+
+    def expire(self, ttl_sec):
+        cutoff = time.time() - ttl_sec
+        with self._lock:
+            expired = [task_id for task_id, (updated_at, task) in self._tasks.items()
+                       if updated_at < cutoff and task.get("status") in FINISHED_STATUSES]
+            for task_id in expired:
+                del self._tasks[task_id]
+        return expired
+
+    def unfinished_task_ids(self):
+        with self._lock:
+            return [task_id for task_id, (_, task) in self._tasks.items() if task.get("status") not in FINISHED_STATUSES]
+
+class SQLiteTaskStore(TaskStore):
+    """SQLite-backed store: task state survives restarts and expires after a TTL.
+
+    Reads are served from an in-memory copy; every change is written through.
+    """
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks (task_id TEXT PRIMARY KEY, status TEXT, data TEXT NOT NULL,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tasks_updated_at ON tasks (updated_at)")
+        self._conn.commit()
+        self._cache = {}
+        for task_id, data in self._conn.execute("SELECT task_id, data FROM tasks"):
+            self._cache[task_id] = json.loads(data)
+
+    def create(self, task_id, task):
+        now = time.time()
+        with self._lock:
+            self._cache[task_id] = dict(task)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tasks (task_id, status, data, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (task_id, task.get("status"), json.dumps(task), now, now)
+            )
+            self._conn.commit()
+
+    def get(self, task_id):
+        with self._lock:
+            task = self._cache.get(task_id)
+            return dict(task) if task else None
+
+    def update(self, task_id, changes):
+        with self._lock:
+            task = self._cache.get(task_id)
+            if task is None:
+                return False
+            task.update(changes)
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, data = ?, updated_at = ? WHERE task_id = ?",
+                (task.get("status"), json.dumps(task), time.time(), task_id)
+            )
+            self._conn.commit()
+            return True
+
+    def delete(self, task_id):
+        with self._lock:
+            self._cache.pop(task_id, None)
+            self._conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+            self._conn.commit()
+
+    def expire(self, ttl_sec):
+        cutoff = time.time() - ttl_sec
+        placeholders = ", ".join("?" for _ in FINISHED_STATUSES)
+        with self._lock:
+            expired = [row[0] for row in self._conn.execute(
+                f"SELECT task_id FROM tasks WHERE updated_at < ? AND status IN ({placeholders})", (cutoff,) + FINISHED_STATUSES
+            )]
+            for task_id in expired:
+                self._cache.pop(task_id, None)
+            self._conn.executemany("DELETE FROM tasks WHERE task_id = ?", [(task_id,) for task_id in expired])
+            self._conn.commit()
+        return expired
+
+    def unfinished_task_ids(self):
+        with self._lock:
+            return [task_id for task_id, task in self._cache.items() if task.get("status") not in FINISHED_STATUSES]
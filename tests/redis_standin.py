@@ -0,0 +1,233 @@
+# tests/redis_standin.py
+"""In-process stand-in for the part of the redis-py client that RedisWorkQueue uses.
+
+Keys are str and stored values come back as bytes, as from a real server. WATCH/MULTI
+is modelled with a version per key: execute() raises WatchError when a watched key was
+written since watch(), and transaction() retries the function like redis-py does.
+"""
+import threading
+import time
+
+class WatchError(Exception):
+    pass
+
+def _bytes(value):
+    return value if isinstance(value, bytes) else str(value).encode()
+
+class StandInRedis:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._pushed = threading.Condition(self._lock)
+        self._data = {} # key -> dict (hash), list, set, or dict of member -> score (sorted set)
+        self._expires_at = {} # key -> time.time() deadline
+        self._versions = {} # key -> number of writes, for WATCH
+
+    def _live(self, key):
+        deadline = self._expires_at.get(key)
+        if deadline is not None and deadline <= time.time():
+            self._data.pop(key, None)
+            self._expires_at.pop(key, None)
+            self._touch(key)
+        return self._data.get(key)
+
+    def _touch(self, key):
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+    def _for_write(self, key, factory):
+        value = self._live(key)
+        if value is None:
+            value = self._data[key] = factory()
+        self._touch(key)
+        return value
+
+    def pipeline(self, transaction=True):
+        return StandInPipeline(self)
+
+    def transaction(self, func, *watches, value_from_callable=False):
+        while True:
+            pipe = self.pipeline()
+            try:
+                pipe.watch(*watches)
+                value = func(pipe)
+                results = pipe.execute()
+                return value if value_from_callable else results
+            except WatchError:
+                continue
+
+    # --- keys ---
+    def exists(self, *names):
+        with self._lock:
+            return sum(1 for name in names if self._live(name) is not None)
+
+    def delete(self, *names):
+        with self._lock:
+            removed = 0
+            for name in names:
+                if self._live(name) is not None:
+                    del self._data[name]
+                    self._expires_at.pop(name, None)
+                    self._touch(name)
+                    removed += 1
+            return removed
+
+    def expire(self, name, seconds):
+        with self._lock:
+            if self._live(name) is None:
+                return False
+            self._expires_at[name] = time.time() + seconds
+            self._touch(name)
+            return True
+
+    def ttl(self, name):
+        with self._lock:
+            if self._live(name) is None:
+                return -2
+            deadline = self._expires_at.get(name)
+            return -1 if deadline is None else max(0, round(deadline - time.time()))
+
+    # --- hashes ---
+    def hset(self, name, key=None, value=None, mapping=None):
+        with self._lock:
+            fields = dict(mapping or {})
+            if key is not None:
+                fields[key] = value
+            h = self._for_write(name, dict)
+            added = sum(1 for field in fields if _bytes(field) not in h)
+            h.update({_bytes(field): _bytes(field_value) for field, field_value in fields.items()})
+            return added
+
+    def hget(self, name, key):
+        with self._lock:
+            return (self._live(name) or {}).get(_bytes(key))
+
+    def hmget(self, name, keys):
+        with self._lock:
+            h = self._live(name) or {}
+            return [h.get(_bytes(key)) for key in keys]
+
+    def hgetall(self, name):
+        with self._lock:
+            return dict(self._live(name) or {})
+
+    def hincrby(self, name, key, amount=1):
+        with self._lock:
+            h = self._for_write(name, dict)
+            h[_bytes(key)] = _bytes(int(h.get(_bytes(key), b"0")) + amount)
+            return int(h[_bytes(key)])
+
+    # --- lists ---
+    def lpush(self, name, *values):
+        with self._lock:
+            items = self._for_write(name, list)
+            for value in values:
+                items.insert(0, _bytes(value))
+            self._pushed.notify_all()
+            return len(items)
+
+    def rpush(self, name, *values):
+        with self._lock:
+            items = self._for_write(name, list)
+            items.extend(_bytes(value) for value in values)
+            self._pushed.notify_all()
+            return len(items)
+
+    def rpop(self, name):
+        with self._lock:
+            if not self._live(name):
+                return None
+            items = self._for_write(name, list)
+            value = items.pop()
+            if not items:
+                del self._data[name]
+            return value
+
+    def brpop(self, keys, timeout=0):
+        deadline = time.monotonic() + timeout if timeout else None
+        with self._pushed:
+            while True:
+                for name in keys:
+                    if self._live(name):
+                        return (_bytes(name), self.rpop(name))
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._pushed.wait(remaining)
+
+    # --- sets ---
+    def sadd(self, name, *values):
+        with self._lock:
+            members = self._for_write(name, set)
+            added = len({_bytes(value) for value in values} - members)
+            members.update(_bytes(value) for value in values)
+            return added
+
+    def smembers(self, name):
+        with self._lock:
+            return set(self._live(name) or ())
+
+    # --- sorted sets ---
+    def zadd(self, name, mapping, xx=False):
+        with self._lock:
+            scores = self._for_write(name, dict)
+            added = 0
+            for member, score in mapping.items():
+                member = _bytes(member)
+                if xx and member not in scores:
+                    continue
+                added += member not in scores
+                scores[member] = float(score)
+            return added
+
+    def zrangebyscore(self, name, min, max):
+        low, high = float(min), float(max)
+        with self._lock:
+            scores = self._live(name) or {}
+            return [member for member, score in sorted(scores.items(), key=lambda item: item[1]) if low <= score <= high]
+
+    def zrem(self, name, *values):
+        with self._lock:
+            scores = self._live(name)
+            if not scores:
+                return 0
+            removed = [_bytes(value) for value in values if _bytes(value) in scores]
+            for member in removed:
+                del scores[member]
+            if removed:
+                self._touch(name)
+            return len(removed)
+
+class StandInPipeline:
+    """Buffers commands until execute(); after watch() they run at once until multi()."""
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+        self._watched = None # key -> version when watched
+        self._buffering = True
+
+    def watch(self, *names):
+        with self._client._lock:
+            self._watched = {name: self._client._versions.get(name, 0) for name in names}
+        self._buffering = False
+
+    def multi(self):
+        self._buffering = True
+
+    def __getattr__(self, name):
+        command = getattr(self._client, name)
+        if not self._buffering:
+            return command
+        def queue(*args, **kwargs):
+            self._commands.append((command, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        with self._client._lock:
+            try:
+                if self._watched and any(self._client._versions.get(name, 0) != version for name, version in self._watched.items()):
+                    raise WatchError("Watched key changed before EXEC.")
+                return [command(*args, **kwargs) for command, args, kwargs in self._commands]
+            finally:
+                self._commands = []
+                self._watched = None
+                self._buffering = True
@@ -0,0 +1,81 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import montage_maker
+
+@unittest.skipIf(montage_maker.np is None, "NumPy is not installed")
+class NumpyBeatGroupingTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        # Force the NumPy path for the small files written here
+        patcher = mock.patch.object(montage_maker, "NUMPY_LABEL_PARSE_MIN_BYTES", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_labels(self, text):
+        path = os.path.join(self.temp_dir, f"labels_{len(os.listdir(self.temp_dir))}.txt")
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def parse_both(self, text):
+        path = self.write_labels(text)
+        messages = {"py": [], "np": []}
+        python_result = montage_maker.parse_audacity_labels(path, lambda task_id, update: messages["py"].append(update), "t")
+        numpy_result = montage_maker.parse_audacity_labels_np(path, lambda task_id, update: messages["np"].append(update), "t")
+        self.assertEqual(messages["np"], messages["py"])
+        return python_result, numpy_result
+
+    def test_parse_matches_python(self):
+        rng = random.Random(0)
+        timestamp, lines = 0.0, []
+        for i in range(2000):
+            timestamp += rng.uniform(0.05, 0.4)
+            lines.append(f"{timestamp:.6f}\t{timestamp:.6f}\tonset {i}")
+        lines += lines[:10] # Repeated labels
+        rng.shuffle(lines)
+        python_result, numpy_result = self.parse_both("\n".join(lines) + "\n")
+        self.assertEqual(numpy_result, python_result)
+
+    def test_parse_edge_cases_match_python(self):
+        for text in ["", "\n\n", "1.5\n", "2.0\t2.0\n1.0\t1.0\n", "1.0\t1.0\tx\nnot a time\t3\n2.0\t2.0\ty\n", " 1.0\t1.0\n", "inf\t1\n1.0\t1\n"]:
+            with self.subTest(text=text):
+                python_result, numpy_result = self.parse_both(text)
+                self.assertEqual(numpy_result, python_result)
+
+    def test_small_files_skip_numpy(self):
+        path = self.write_labels("1.0\t1.0\n2.0\t2.0\n")
+        with mock.patch.object(montage_maker, "NUMPY_LABEL_PARSE_MIN_BYTES", 1024), \
+                mock.patch.object(montage_maker.np, "loadtxt") as loadtxt:
+            self.assertEqual(montage_maker.parse_audacity_labels_np(path), [1.0, 2.0])
+        loadtxt.assert_not_called()
+
+    def test_grouping_matches_python(self):
+        rng = random.Random(1)
+        timestamp, beats = 0.0, []
+        for _ in range(3000):
+            timestamp += rng.choice([0.1, 0.2, 0.3, rng.uniform(0.01, 1.0)])
+            beats.append(round(timestamp, 3))
+        for min_duration in (0.1, 0.3, 0.6, 2.5, 1000.0):
+            for start in (0, 1, 17, len(beats) - 2, len(beats) - 1):
+                with self.subTest(min_duration=min_duration, start=start):
+                    self.assertEqual(
+                        montage_maker.generate_beat_grouped_scene_durations_np(beats, start, min_duration),
+                        montage_maker.generate_beat_grouped_scene_durations(beats, start, min_duration),
+                    )
+
+    def test_grouping_with_repeated_or_unsorted_beats_matches_python(self):
+        for beats in ([], [1.0], [0.0, 0.5, 0.5, 1.2, 2.0], [0.0, 1.0, 0.4, 2.0, 3.5]):
+            with self.subTest(beats=beats):
+                self.assertEqual(
+                    montage_maker.generate_beat_grouped_scene_durations_np(beats, 0, 0.6),
+                    montage_maker.generate_beat_grouped_scene_durations(beats, 0, 0.6),
+                )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from chunked_uploads import UploadError, UploadStore
+
+class UploadStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        self.store = UploadStore(self.temp_dir)
+
+    def upload(self, content, chunk_size=4):
+        upload_id = self.store.create("video.mp4", len(content))
+        for offset in range(0, len(content), chunk_size):
+            self.assertEqual(self.store.append_chunk(upload_id, offset, io.BytesIO(content[offset:offset + chunk_size])),
+                             min(offset + chunk_size, len(content)))
+        return upload_id, self.store.complete(upload_id)
+
+    def test_chunks_assemble_into_the_file(self):
+        content = b"0123456789abcdef!"
+        upload_id, status = self.upload(content)
+        self.assertEqual((status["offset"], status["complete"], status["sha256"]), (len(content), True, hashlib.sha256(content).hexdigest()))
+        with open(self.store.completed_path(upload_id), "rb") as f:
+            self.assertEqual(f.read(), content)
+
+    def test_wrong_offset_reports_the_current_one(self):
+        upload_id = self.store.create("video.mp4", 8)
+        self.store.append_chunk(upload_id, 0, io.BytesIO(b"abcd"))
+        with self.assertRaises(UploadError) as caught:
+            self.store.append_chunk(upload_id, 0, io.BytesIO(b"abcd"))
+        self.assertEqual((caught.exception.status_code, caught.exception.current_offset), (409, 4))
+        self.assertEqual(self.store.status(upload_id)["offset"], 4)
+
+    def test_chunk_past_the_declared_size_is_dropped(self):
+        upload_id = self.store.create("video.mp4", 6)
+        self.store.append_chunk(upload_id, 0, io.BytesIO(b"abcd"))
+        with self.assertRaises(UploadError) as caught:
+            self.store.append_chunk(upload_id, 4, io.BytesIO(b"efgh"))
+        self.assertEqual(caught.exception.status_code, 413)
+        self.assertEqual(self.store.append_chunk(upload_id, 4, io.BytesIO(b"ef")), 6)
+        self.assertEqual(self.store.complete(upload_id)["sha256"], hashlib.sha256(b"abcdef").hexdigest())
+
+    def test_incomplete_upload_cannot_complete(self):
+        upload_id = self.store.create("video.mp4", 8)
+        self.store.append_chunk(upload_id, 0, io.BytesIO(b"abcd"))
+        with self.assertRaises(UploadError) as caught:
+            self.store.complete(upload_id)
+        self.assertEqual(caught.exception.current_offset, 4)
+        with self.assertRaises(UploadError):
+            self.store.completed_path(upload_id)
+
+    def test_resume_after_restart(self):
+        upload_id = self.store.create("video.mp4", 8)
+        self.store.append_chunk(upload_id, 0, io.BytesIO(b"abcd"))
+        restarted = UploadStore(self.temp_dir) # Running hash is gone and is rebuilt from disk
+        self.assertEqual(restarted.append_chunk(upload_id, 4, io.BytesIO(b"efgh")), 8)
+        self.assertEqual(restarted.complete(upload_id)["sha256"], hashlib.sha256(b"abcdefgh").hexdigest())
+
+    def test_identical_upload_is_deduplicated(self):
+        first_id, first = self.upload(b"same bytes")
+        second_id, second = self.upload(b"same bytes")
+        self.assertFalse(first["deduplicated"])
+        self.assertTrue(second["deduplicated"])
+        self.assertTrue(os.path.samefile(self.store.completed_path(first_id), self.store.completed_path(second_id)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import unittest
+
+import montage_maker
+from download_cache import DownloadCache
+
+# Stands in for yt-dlp: counts its runs, then "downloads" after a pause, or fails for URLs containing "fail"
+STUB_YT_DLP = f"""#!{sys.executable}
+import os, sys, time
+args = sys.argv[1:]
+with open(os.environ["STUB_YT_DLP_RUNS"], "a") as f:
+    f.write("run\\n")
+time.sleep(0.5)
+url = args[-1]
+if "fail" in url:
+    sys.stderr.write("ERROR: stub cannot fetch " + url)
+    sys.exit(1)
+template = args[args.index("-o") + 1]
+with open(template.replace("%(title)s", "video").replace("%(ext)s", "mp4"), "wb") as f:
+    f.write(b"x" * 1000)
+"""
+
+class DownloadCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        stub_path = os.path.join(self.temp_dir, "yt-dlp")
+        with open(stub_path, "w") as f:
+            f.write(STUB_YT_DLP)
+        os.chmod(stub_path, os.stat(stub_path).st_mode | stat.S_IXUSR)
+        self.runs_path = os.path.join(self.temp_dir, "runs")
+        os.environ["STUB_YT_DLP_RUNS"] = self.runs_path
+        self.addCleanup(os.environ.pop, "STUB_YT_DLP_RUNS", None)
+        self.cache = DownloadCache(os.path.join(self.temp_dir, "cache"), 10 ** 6, {"mp4"}, yt_dlp_path=stub_path)
+
+    def runs(self):
+        try:
+            with open(self.runs_path) as f:
+                return len(f.readlines())
+        except OSError:
+            return 0
+
+    def get_concurrently(self, url, count=4):
+        results = [None] * count
+        def get(i):
+            try:
+                results[i] = self.cache.get(url)
+            except Exception as e:
+                results[i] = e
+        threads = [threading.Thread(target=get, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_requests_share_one_download(self):
+        paths = self.get_concurrently("https://example.com/a")
+        self.assertEqual(self.runs(), 1)
+        self.assertEqual(len(set(paths)), 1)
+        self.assertTrue(os.path.isfile(paths[0]))
+        self.assertEqual(self.cache.get("https://example.com/a"), paths[0]) # Served from the cache
+        self.assertEqual(self.runs(), 1)
+        for _ in range(len(paths) + 1):
+            self.cache.release("https://example.com/a")
+        self.assertEqual(self.cache._pins, {})
+
+    def test_failed_download_reaches_every_waiter(self):
+        results = self.get_concurrently("https://example.com/fail")
+        self.assertEqual(self.runs(), 1)
+        for result in results:
+            self.assertIsInstance(result, montage_maker.MontageError)
+            self.assertIn("stub cannot fetch", str(result))
+        self.assertEqual(self.cache._pins, {})
+        self.assertEqual(os.listdir(self.cache.cache_folder), [])
+
+    def test_evict_keeps_pinned_entries(self):
+        self.cache.max_total_bytes = 0
+        pinned = self.cache.get("https://example.com/pinned")
+        unpinned = self.cache.get("https://example.com/unpinned")
+        self.cache.release("https://example.com/unpinned")
+        self.cache.evict()
+        self.assertTrue(os.path.isfile(pinned))
+        self.assertFalse(os.path.exists(unpinned))
+
+if __name__ == '__main__':
+    unittest.main()
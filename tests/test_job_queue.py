@@ -0,0 +1,70 @@
+import time
+import unittest
+
+import job_queue
+from tests.redis_standin import StandInRedis
+
+class RedisWorkQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.client = StandInRedis()
+        self.queue = job_queue.RedisWorkQueue(self.client, group_ttl=3600)
+
+    def test_claim_leases_the_oldest_job(self):
+        first = self.queue.enqueue("g1", "extract_scene", {"n": 1})
+        self.queue.enqueue("g1", "extract_scene", {"n": 2})
+        job = self.queue.claim("w1", lease_seconds=60)
+        self.assertEqual((job["job_id"], job["payload"], job["attempts"]), (first, {"n": 1}, 1))
+        self.assertTrue(self.queue.heartbeat(first, "w1", 60))
+        self.assertFalse(self.queue.heartbeat(first, "w2", 60))
+        self.queue.complete(first, "w1", {"ok": True})
+        self.assertEqual(self.queue.group_jobs("g1")[first], {"state": job_queue.DONE, "result": {"ok": True}, "error": None})
+
+    def test_expired_lease_hands_the_job_to_another_worker(self):
+        job_id = self.queue.enqueue("g1", "assemble", {})
+        self.queue.claim("w1", lease_seconds=0.01)
+        time.sleep(0.05)
+        job = self.queue.claim("w2", lease_seconds=60)
+        self.assertEqual((job["job_id"], job["attempts"]), (job_id, 2))
+        self.assertFalse(self.queue.heartbeat(job_id, "w1", 60))
+        self.queue.complete(job_id, "w1") # The old worker's result is dropped
+        self.assertEqual(self.queue.group_jobs("g1")[job_id]["state"], job_queue.RUNNING)
+
+    def test_job_fails_after_max_attempts(self):
+        queue = job_queue.RedisWorkQueue(self.client, max_attempts=1)
+        job_id = queue.enqueue("g1", "assemble", {})
+        queue.claim("w1", lease_seconds=0.01)
+        time.sleep(0.05)
+        self.assertIsNone(queue.claim("w2", lease_seconds=60))
+        self.assertEqual(queue.group_jobs("g1")[job_id]["state"], job_queue.FAILED)
+
+    def test_purged_jobs_are_never_claimed_or_recreated(self):
+        running = self.queue.enqueue("g1", "extract_scene", {})
+        self.queue.enqueue("g1", "extract_scene", {})
+        self.queue.claim("w1", lease_seconds=60)
+        self.queue.purge_group("g1")
+        self.assertIsNone(self.queue.claim("w2", lease_seconds=60))
+        self.assertFalse(self.queue.heartbeat(running, "w1", 60))
+        self.queue.complete(running, "w1")
+        self.assertEqual(self.queue.group_jobs("g1"), {})
+        self.assertFalse(self.client.exists(self.queue._key("job", running)))
+
+    def test_purge_between_claim_read_and_write(self):
+        job_id = self.queue.enqueue("g1", "extract_scene", {})
+        job_key = self.queue._key("job", job_id)
+        read_job = self.client.hgetall
+        def purge_after_read(name):
+            job = read_job(name)
+            if job:
+                self.queue.purge_group("g1")
+            return job
+        self.client.hgetall = purge_after_read
+        self.assertIsNone(self.queue.claim("w1", lease_seconds=60))
+        self.assertFalse(self.client.exists(job_key))
+
+    def test_claim_keeps_the_group_ttl(self):
+        job_id = self.queue.enqueue("g1", "extract_scene", {})
+        self.queue.claim("w1", lease_seconds=60)
+        self.assertGreater(self.client.ttl(self.queue._key("job", job_id)), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import threading
+import time
+import unittest
+
+from job_scheduler import JobScheduler, QueueFullError
+
+class JobSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set) # Lets blocked workers finish
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak_running = 0
+        self.finished = []
+        self.all_finished = threading.Event()
+
+    def job(self, job_id, total_jobs):
+        with self.lock:
+            self.running += 1
+            self.peak_running = max(self.peak_running, self.running)
+        self.release.wait(10)
+        with self.lock:
+            self.running -= 1
+            self.finished.append(job_id)
+            if len(self.finished) == total_jobs:
+                self.all_finished.set()
+
+    def wait_for(self, condition):
+        for _ in range(500):
+            if condition():
+                return
+            time.sleep(0.01)
+        self.fail("Timed out waiting for the scheduler.")
+
+    def test_never_runs_more_than_num_workers(self):
+        scheduler = JobScheduler(num_workers=2, max_queue_depth=10)
+        scheduler.start()
+        for i in range(6):
+            scheduler.submit(f"j{i}", self.job, (f"j{i}", 6))
+        self.wait_for(lambda: scheduler.active_count() == 2)
+        self.assertEqual((scheduler.active_count(), scheduler.queue_depth()), (2, 4))
+        self.release.set()
+        self.assertTrue(self.all_finished.wait(10))
+        self.assertEqual(self.peak_running, 2)
+        self.wait_for(lambda: scheduler.active_count() == 0)
+
+    def test_full_queue_rejects_jobs(self):
+        scheduler = JobScheduler(num_workers=1, max_queue_depth=2)
+        self.assertEqual(scheduler.submit("a", self.job, ("a", 3)), 1)
+        self.assertEqual(scheduler.submit("b", self.job, ("b", 3)), 2)
+        self.assertTrue(scheduler.is_full())
+        with self.assertRaises(QueueFullError):
+            scheduler.submit("c", self.job, ("c", 3))
+        self.assertTrue(scheduler.cancel("b"))
+        self.assertFalse(scheduler.cancel("b"))
+        self.assertEqual(scheduler.submit("c", self.job, ("c", 2)), 2)
+
+    def test_higher_priority_runs_first(self):
+        scheduler = JobScheduler(num_workers=1, max_queue_depth=10)
+        for job_id, priority in (("low", 0), ("high", 5), ("low2", 0)):
+            scheduler.submit(job_id, self.job, (job_id, 3), priority=priority)
+        self.assertEqual(scheduler.queue_position("high"), 1)
+        self.release.set()
+        scheduler.start()
+        self.assertTrue(self.all_finished.wait(10))
+        self.assertEqual(self.finished, ["high", "low", "low2"])
+
+if __name__ == '__main__':
+    unittest.main()
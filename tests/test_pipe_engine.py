@@ -0,0 +1,120 @@
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import montage_maker
+
+SCENE_BYTES = 6 * 1024 * 1024 # More than the pipe engine buffers per scene, so an unread scene blocks its extractor
+
+# Stands in for a scene extractor: writes SCENE_BYTES into every pipe:N output
+FAKE_EXTRACTOR = f"""#!{sys.executable}
+import os, sys
+for arg in sys.argv[1:]:
+    if arg.startswith("pipe:") and arg != "pipe:1":
+        fd = int(arg[len("pipe:"):])
+        with os.fdopen(fd, "wb") as pipe:
+            for _ in range({SCENE_BYTES} // 65536):
+                pipe.write(b"x" * 65536)
+"""
+
+# Stands in for a muxer: reads its concat list's files in order until it has --bytes, writes the byte count to its output
+FAKE_MUXER = f"""#!{sys.executable}
+import os, sys, time
+args = sys.argv[1:]
+concat_list = args[args.index("-i") + 1]
+max_bytes = int(args[args.index("--bytes") + 1])
+delay = float(args[args.index("--delay") + 1])
+paths = [line[len("file '"):-1] for line in open(concat_list).read().splitlines() if line.startswith("file ")]
+total = 0
+for path in paths:
+    if total >= max_bytes:
+        break
+    with open(os.path.join(os.path.dirname(concat_list), path), "rb") as f:
+        while total < max_bytes:
+            chunk = f.read(min(65536, max_bytes - total))
+            if not chunk:
+                break
+            total += len(chunk)
+            time.sleep(delay)
+with open(args[-1], "w") as f:
+    f.write(str(total))
+"""
+
+class PipeEngineEarlyMuxerExitTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        self.extractor = self.write_script("fake_extractor", FAKE_EXTRACTOR)
+        self.muxer = self.write_script("fake_muxer", FAKE_MUXER)
+        self.scene_plan = [{"start": float(i), "duration": 1.0, "desc": f"scene {i}"} for i in range(6)]
+
+    def write_script(self, name, source):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, "w") as f:
+            f.write(source)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+        return path
+
+    def render(self, scenes_read_per_variant, task_id=None, read_delay=0):
+        """Runs the pipe engine with fake processes; returns each variant's bytes muxed, or fails on a hang."""
+        variants = [
+            {"resolution": f"v{k}", "output_path": os.path.join(self.temp_dir, f"out_{k}.txt"), "bytes_read": int(scenes_read * SCENE_BYTES)}
+            for k, scenes_read in enumerate(scenes_read_per_variant)
+        ]
+        extraction_command = lambda input_video_path, scene, filter_parts, variant_opts, outputs: [self.extractor] + [arg for output in outputs for arg in output]
+        assembly_command = lambda concat_list_path, variant, *args: [self.muxer, "--bytes", str(variant["bytes_read"]), "--delay", str(read_delay), "-i", concat_list_path, variant["output_path"]]
+        errors = []
+        def run():
+            try:
+                montage_maker.render_scenes_pipe("input.mp4", variants, self.scene_plan, self.temp_dir, task_id=task_id, extraction_workers=2)
+            except Exception as e:
+                errors.append(e)
+        with mock.patch.object(montage_maker, "scene_output_options", return_value=([], [[] for _ in variants])), \
+                mock.patch.object(montage_maker, "scene_extraction_command", extraction_command), \
+                mock.patch.object(montage_maker, "concat_assembly_command", assembly_command):
+            thread = threading.Thread(target=run, daemon=True)
+            thread.start()
+            thread.join(60)
+        self.assertFalse(thread.is_alive(), "render_scenes_pipe hung after a muxer stopped reading")
+        if errors:
+            raise errors[0]
+        results = []
+        for variant in variants:
+            with open(variant["output_path"]) as f:
+                results.append(int(f.read()))
+        return results
+
+    def test_muxer_that_stops_early_ends_its_variant(self):
+        self.assertEqual(self.render([1]), [SCENE_BYTES])
+
+    def test_muxer_that_stops_mid_scene(self):
+        self.assertEqual(self.render([1.5]), [int(1.5 * SCENE_BYTES)])
+
+    def test_other_variants_still_get_every_scene(self):
+        self.assertEqual(self.render([6, 2]), [6 * SCENE_BYTES, 2 * SCENE_BYTES])
+
+    def test_muxer_that_exits_before_opening_a_scene(self):
+        self.assertEqual(self.render([0, 0]), [0, 0])
+
+    def test_cancel_stops_the_render(self):
+        control = montage_maker.start_job("pipe-test")
+        self.addCleanup(montage_maker.finish_job, "pipe-test")
+        threading.Timer(0.5, control.cancel, args=("Stopped by the test.",)).start()
+        with self.assertRaises(montage_maker.JobCancelled):
+            self.render([6], task_id="pipe-test", read_delay=0.01)
+
+    def test_events_registered_after_cancel_are_set(self):
+        control = montage_maker.JobControl("pipe-test")
+        waiting, late = threading.Event(), threading.Event()
+        control.register_event(waiting)
+        control.cancel()
+        control.register_event(late)
+        self.assertTrue(waiting.is_set() and late.is_set())
+
+if __name__ == '__main__':
+    unittest.main()
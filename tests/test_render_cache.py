@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from render_cache import RenderCache
+
+class RenderCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        self.cache = RenderCache(os.path.join(self.temp_dir, "cache"), 10 ** 6)
+        self.video = self.write_file("video.mp4", b"video")
+        self.labels = self.write_file("labels.txt", b"1.0\t1.0\n")
+
+    def write_file(self, name, content):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def store(self, key, content):
+        self.cache.store(key, self.write_file(f"output_{key}.mp4", content)) # The cache hardlinks it, so one file per key
+        return key
+
+    def test_key_ignores_speed_options_only(self):
+        key = RenderCache.make_key(self.video, self.labels, None, {"seed": 1, "extraction_workers": 2})
+        self.assertEqual(RenderCache.make_key(self.video, self.labels, None, {"seed": 1, "extraction_workers": 8}), key)
+        self.assertNotEqual(RenderCache.make_key(self.video, self.labels, None, {"seed": 2, "extraction_workers": 2}), key)
+        self.assertEqual(RenderCache.make_key(self.video, self.labels, None, {"seed": 1}, video_hash="abc"),
+                         RenderCache.make_key(self.labels, self.labels, None, {"seed": 1}, video_hash="abc"))
+
+    def test_key_follows_file_content(self):
+        key = RenderCache.make_key(self.video, self.labels, None, {})
+        self.write_file("labels.txt", b"2.0\t2.0\n")
+        os.utime(self.labels, ns=(1, 1)) # A new mtime, so the memoized hash is not reused
+        self.assertNotEqual(RenderCache.make_key(self.video, self.labels, None, {}), key)
+
+    def test_miss_then_hit(self):
+        key = RenderCache.make_key(self.video, self.labels, None, {"seed": 1})
+        dest_path = os.path.join(self.temp_dir, "outputs", "montage.mp4")
+        self.assertIsNone(self.cache.lookup(key))
+        self.assertFalse(self.cache.materialize(key, dest_path))
+        self.store(key, b"rendered")
+        self.assertTrue(self.cache.materialize(key, dest_path))
+        with open(dest_path, "rb") as f:
+            self.assertEqual(f.read(), b"rendered")
+
+    def test_evict_removes_least_recently_used(self):
+        self.cache.max_total_bytes = 10
+        old, recent = self.store("old", b"x" * 5), self.store("recent", b"y" * 5)
+        os.utime(self.cache.lookup(old), (1, 1))
+        os.utime(self.cache.lookup(recent), (2, 2))
+        self.store("new", b"z" * 5)
+        self.assertIsNone(self.cache.lookup(old))
+        self.assertIsNotNone(self.cache.lookup(recent))
+        self.assertIsNotNone(self.cache.lookup("new"))
+
+if __name__ == '__main__':
+    unittest.main()
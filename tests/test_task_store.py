@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from task_store import MemoryTaskStore, SQLiteTaskStore
+
+class TaskStoreChecks:
+    """Behaviour every TaskStore shares; mixed into a TestCase that sets self.store."""
+    def test_update_merges_into_a_copy(self):
+        self.store.create("t1", {"status": "queued", "progress": 0})
+        self.assertTrue(self.store.update("t1", {"progress": 50}))
+        self.assertFalse(self.store.update("missing", {"progress": 50}))
+        task = self.store.get("t1")
+        task["status"] = "changed"
+        self.assertEqual(self.store.get("t1"), {"status": "queued", "progress": 50})
+
+    def test_expire_only_removes_old_finished_tasks(self):
+        self.store.create("done", {"status": "completed"})
+        self.store.create("running", {"status": "processing"})
+        self.assertEqual(self.store.expire(3600), [])
+        self.assertEqual(self.store.expire(-1), ["done"])
+        self.assertIsNone(self.store.get("done"))
+        self.assertEqual(self.store.unfinished_task_ids(), ["running"])
+
+    def test_delete(self):
+        self.store.create("t1", {"status": "queued"})
+        self.store.delete("t1")
+        self.store.delete("t1")
+        self.assertIsNone(self.store.get("t1"))
+
+class MemoryTaskStoreTest(TaskStoreChecks, unittest.TestCase):
+    def setUp(self):
+        self.store = MemoryTaskStore()
+
+class SQLiteTaskStoreTest(TaskStoreChecks, unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        self.db_path = os.path.join(self.temp_dir, "tasks.db")
+        self.store = SQLiteTaskStore(self.db_path)
+
+    def test_tasks_survive_a_reopen(self):
+        self.store.create("done", {"status": "completed", "output": "a.mp4"})
+        self.store.create("queued", {"status": "queued"})
+        self.store.update("queued", {"status": "processing", "progress": 10})
+        self.store.create("gone", {"status": "error"})
+        self.store.delete("gone")
+        reopened = SQLiteTaskStore(self.db_path)
+        self.assertEqual(reopened.get("done"), {"status": "completed", "output": "a.mp4"})
+        self.assertEqual(reopened.get("queued"), {"status": "processing", "progress": 10})
+        self.assertIsNone(reopened.get("gone"))
+        self.assertEqual(reopened.unfinished_task_ids(), ["queued"])
+
+    def test_expired_tasks_stay_gone_after_a_reopen(self):
+        self.store.create("done", {"status": "completed"})
+        self.store.expire(-1)
+        self.assertIsNone(SQLiteTaskStore(self.db_path).get("done"))
+
+if __name__ == '__main__':
+    unittest.main()